@@ -0,0 +1,53 @@
+"""
+Per file time of first_format_data_transformation (workbooks up to 2018), vectorized or row by row.
+
+Synthetic first format sheets are generated with --products products per food category (a DANE file has a few
+dozen), each priced in a random subset of the markets. The row by row implementation it replaced is the golden
+reference of the tests (see tests._fixtures); both outputs are checked to be identical before timing.
+
+Usage:
+    python -m benchmarks.bench_first_format_transformation [--products 10 40 160] [--repeat N]
+"""
+import argparse
+import logging
+import time
+import pandas as pd
+from src.DataWrangler import DataWrangler
+from tests._fixtures import first_format_frame, legacy_first_format_transformation
+
+
+def best_of(function, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, nargs='+', default=[10, 40, 160], help='Products per food category.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per sheet, the best one is kept.')
+    args = parser.parse_args()
+
+    logger = logging.getLogger('bench_first_format_transformation')
+    for name in (logger.name, 'test_logger'):
+        logging.getLogger(name).addHandler(logging.NullHandler())
+        logging.getLogger(name).propagate = False
+    wrangler = DataWrangler(bucket_name='bench-bucket', s3=None, logger=logger)
+    file_path = 'reports/2016/week_7_anexo_2016.xlsx'
+
+    print(f'{"products":>9} {"rows":>7} {"row by row (ms)":>16} {"vectorized (ms)":>16} {"speedup":>8}')
+    for products in args.products:
+        dataframe = first_format_frame(products)
+        pd.testing.assert_frame_equal(wrangler.first_format_data_transformation(dataframe.copy(), file_path),
+                                      legacy_first_format_transformation(dataframe.copy(), file_path))
+
+        legacy = best_of(lambda: legacy_first_format_transformation(dataframe.copy(), file_path), args.repeat)
+        vectorized = best_of(lambda: wrangler.first_format_data_transformation(dataframe.copy(), file_path), args.repeat)
+        print(f'{products * 8:9d} {len(dataframe):7d} {legacy * 1e3:16.1f} {vectorized * 1e3:16.1f} {legacy / vectorized:7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
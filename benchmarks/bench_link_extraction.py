@@ -0,0 +1,85 @@
+"""
+Parity and speed benchmark of the link extraction backends over DANE pages.
+
+Saved copies of the DANE landing page and year pages can be passed with --pages (a directory of
+.html files, the landing page must be named landing.html). Without it, synthetic pages with the
+structure and size of the DANE Joomla pages are generated.
+
+Usage:
+    python -m benchmarks.bench_link_extraction [--pages DIR] [--repeat N]
+"""
+import argparse
+import timeit
+from pathlib import Path
+from src.LinkExtractor import BeautifulSoupLinkExtractor, LxmlLinkExtractor
+
+
+def navigation(n_links: int = 600) -> str:
+    items = ''.join(f'<li class="item-{i}"><a href="/index.php/menu/{i}" title="Menu {i}"><span>Menú {i}</span></a></li>'
+                    for i in range(n_links))
+    return f'<header><nav><ul class="menu">{items}</ul></nav></header>'
+
+
+def synthetic_landing_page() -> bytes:
+    years = ''.join(f'<a href="/index.php/sipsa/mayoristas-boletin-semanal-1/{year}">{year}</a> | '
+                    for year in range(2025, 2011, -1))
+    body = f'<div class="item-page"><h1>Boletín semanal</h1><p>{years}</p></div>'
+    return f'<html><head><meta charset="utf-8"></head><body>{navigation()}{body}{navigation(200)}</body></html>'.encode('utf-8')
+
+
+def synthetic_year_page(year: int) -> bytes:
+    rows = ''.join(
+        f'<tr><td>Semana {week}</td>'
+        f'<td><a href="/files/sipsa/{year}/bol_sem_{week}.pdf" target="_blank">Boletín</a></td>'
+        f'<td><a href="/files/sipsa/{year}/anex-SIPSASemanal-{week}-{year}.xlsx" target="_blank"><img src="/x.png"> Anexo</a></td>'
+        f'<td><a href="/files/sipsa/{year}/info_{week}.png" target="_blank">Infografía</a></td></tr>'
+        for week in range(52, 0, -1))
+    body = f'<div class="item-page"><table>{rows}</table></div>'
+    return f'<html><head><meta charset="utf-8"></head><body>{navigation()}{body}{navigation(200)}</body></html>'.encode('utf-8')
+
+
+def load_pages(pages_dir: str) -> tuple:
+    if pages_dir:
+        paths = sorted(Path(pages_dir).glob('*.html'))
+        landing = [path.read_bytes() for path in paths if path.name == 'landing.html']
+        years = [path.read_bytes() for path in paths if path.name != 'landing.html']
+        return landing, years
+    return [synthetic_landing_page()], [synthetic_year_page(year) for year in range(2012, 2026)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', help='Directory with saved DANE pages (landing.html and year pages).')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed passes over all pages.')
+    args = parser.parse_args()
+
+    landing_pages, year_pages = load_pages(args.pages)
+    reference, fast = BeautifulSoupLinkExtractor(), LxmlLinkExtractor()
+
+    # Parity: both backends must return the same (href, text) links
+    for page in landing_pages:
+        assert fast.year_links(page) == reference.year_links(page), 'year links differ'
+    for page in year_pages:
+        assert fast.report_links(page) == reference.report_links(page), 'report links differ'
+    n_links = sum(len(reference.year_links(page)) for page in landing_pages) + \
+        sum(len(reference.report_links(page)) for page in year_pages)
+    size_kb = sum(len(page) for page in landing_pages + year_pages) / 1024
+    print(f'Parity OK: {len(landing_pages) + len(year_pages)} pages ({size_kb:.0f} KiB), {n_links} links.')
+
+    def run(extractor):
+        for page in landing_pages:
+            extractor.year_links(page)
+        for page in year_pages:
+            extractor.report_links(page)
+
+    n_pages = len(landing_pages) + len(year_pages)
+    timings = {}
+    for extractor in (reference, fast):
+        seconds = min(timeit.repeat(lambda: run(extractor), number=1, repeat=args.repeat))
+        timings[extractor.name] = seconds
+        print(f'{extractor.name:>5}: {seconds * 1000:8.1f} ms per pass, {seconds * 1000 / n_pages:6.2f} ms per page')
+    print(f'Speed-up: {timings["bs4"] / timings["lxml"]:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Parse throughput of DataWrangler.parse_workbooks with a growing pool of parse worker processes.
+
+Synthetic second format workbooks (eight food class sheets of --rows price rows, see bench_workbook_parse) are
+parsed with 1 (in process), 2, 4, ... up to --max-workers processes. The workbooks are served from memory, so the
+figures are the parse throughput alone; the output of every pool size is checked against the in-process one.
+Pool start-up (one interpreter per worker importing pandas) is included in the time. Parsing in processes is
+experimental and the default stays in process, run this on the target host before raising PARSE_WORKERS.
+
+Usage:
+    python -m benchmarks.bench_parallel_parse [--workbooks N] [--rows N] [--max-workers N] [--excel-engine NAME]
+"""
+import argparse
+import logging
+import os
+import time
+import pandas as pd
+from benchmarks.bench_workbook_parse import synthetic_workbook
+from src.DataWrangler import DataWrangler
+
+
+def parse_all(workbooks: dict, parse_workers: int, excel_engine: str, logger: logging.Logger) -> tuple:
+    wrangler = DataWrangler(bucket_name='bench-bucket', s3=None, logger=logger, excel_engine=excel_engine,
+                            parse_workers=parse_workers)
+    wrangler.read_workbook = lambda file_path: workbooks[file_path]
+    start = time.perf_counter()
+    results = list(wrangler.parse_workbooks((file_path, 2) for file_path in workbooks))
+    return time.perf_counter() - start, results
+
+
+def main():
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workbooks', type=int, default=32, help='Number of workbooks to parse.')
+    parser.add_argument('--rows', type=int, default=400, help='Price rows per sheet of the synthetic workbooks.')
+    parser.add_argument('--max-workers', type=int, default=cpus, help='Largest pool size, defaults to the CPUs.')
+    parser.add_argument('--excel-engine', default='standard', help="'calamine' or 'standard' (default).")
+    args = parser.parse_args()
+
+    logger = logging.getLogger('bench_parallel_parse')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    data = synthetic_workbook(args.rows)
+    workbooks = {f'reports/2020/week_{week}_anexo_2020.xlsx': data for week in range(1, args.workbooks + 1)}
+    sizes = [1]
+    while sizes[-1] * 2 <= args.max_workers:
+        sizes.append(sizes[-1] * 2)
+    if sizes[-1] != args.max_workers and args.max_workers > 1:
+        sizes.append(args.max_workers)
+
+    print(f'{args.workbooks} workbooks of {len(data) / 1024:.0f} KiB, {cpus} CPUs available')
+    print(f'{"workers":>8} {"time (s)":>9} {"workbooks/s":>12} {"speedup":>8} {"efficiency":>11}')
+    baseline, reference = None, None
+    for workers in sizes:
+        elapsed, results = parse_all(workbooks, workers, args.excel_engine, logger)
+        if reference is None:
+            baseline, reference = elapsed, results
+        else:
+            for (path, _, expected), (result_path, _, dataframe) in zip(reference, results):
+                assert path == result_path
+                pd.testing.assert_frame_equal(dataframe, expected)
+        speedup = baseline / elapsed
+        print(f'{workers:8d} {elapsed:9.2f} {args.workbooks / elapsed:12.1f} {speedup:7.1f}x {speedup / workers:10.0%}')
+
+
+if __name__ == '__main__':
+    main()
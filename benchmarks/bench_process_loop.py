@@ -0,0 +1,99 @@
+"""
+Overhead of the file loop of ProcessHandler.executing_process as the files tracker grows.
+
+A ProcessHandler is run against a synthetic archive of N workbooks whose files tracker (SQLite backend) marks
+all but the last --new files as loaded into RDS. S3, parsing and the database are stubbed out, so the timing
+is the bookkeeping done per file: S3 name lookups, RDS load status lookups and tracker updates. The per file
+time should stay flat from 500 to 50,000 tracked files.
+
+The lookups used before (rebuilding the list of S3 names and scanning the tracker DataFrame for every file)
+are timed as well, up to --legacy-max files since they grow quadratically.
+
+Usage:
+    python -m benchmarks.bench_process_loop [--sizes 500 5000 50000] [--new N] [--legacy-max N]
+"""
+import argparse
+import logging
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+import pandas as pd
+from src.ProcessHandler import ProcessHandler
+
+
+def archive_paths(n_files: int) -> list:
+    return [f'reports/{2018 + i // 52}/week_{i % 52 + 1}_anex-SIPSASemanal-{i}-{2018 + i // 52}.xlsx'
+            for i in range(n_files)]
+
+
+def build_handler(paths: list, n_new: int) -> ProcessHandler:
+    logger = logging.getLogger('bench_process_loop')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    s3 = MagicMock()
+    s3.meta.client.head_object.return_value = {'ETag': '"v1"'}
+    s3.Object.return_value.put.return_value = {'ETag': '"v1"'}
+    handler = ProcessHandler(s3=s3, engine=MagicMock(), bucket_name='bench-bucket',
+                             table_name='bench-table', logger=logger)
+
+    loaded = len(paths) - n_new
+    handler.files_tracker.tracker.save(pd.DataFrame({
+        'file': [Path(path).name for path in paths],
+        'link': [f'https://www.dane.gov.co/files/{Path(path).name}' for path in paths],
+        'date_added': '2024-01-01',
+        'rds_load': ['yes'] * loaded + [None] * n_new,
+    }))
+
+    workbook = pd.DataFrame({'producto': ['papa'], 'precio_medio': [1000]})
+    handler.get_files = MagicMock()
+    handler.bucket_inventory = MagicMock()
+    handler.first_format_paths = MagicMock(return_value=[])
+    handler.second_format_paths = MagicMock(return_value=paths)
+    handler.second_format_data_extraction = MagicMock(return_value=workbook)
+    handler.validate_dataframe = MagicMock(side_effect=lambda df: df)
+    handler.insert_dataframe_to_db = MagicMock()
+    handler.delete_rows = MagicMock(return_value=0)
+    return handler
+
+
+def legacy_loop(paths: list, tracker_df: pd.DataFrame):
+    # The lookups executing_process used to do for every file
+    for file_path in paths:
+        file_name = Path(file_path).name
+        if file_name not in [Path(f).name for f in paths]:
+            pass
+        if not tracker_df.empty and file_name in tracker_df['file'].values:
+            if tracker_df.loc[tracker_df['file'] == file_name, 'rds_load'].values[0] == 'yes':
+                continue
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 5000, 50000], help='Numbers of tracked files.')
+    parser.add_argument('--new', type=int, default=100, help='Number of files not loaded yet in each archive.')
+    parser.add_argument('--legacy-max', type=int, default=2000, help='Largest archive timed with the old lookups.')
+    args = parser.parse_args()
+
+    print(f'{"files":>8} {"loop (s)":>10} {"per file (us)":>14} {"old lookups (s)":>16} {"per file (us)":>14}')
+    for n_files in args.sizes:
+        paths = archive_paths(n_files)
+        handler = build_handler(paths, min(args.new, n_files))
+
+        with patch('src.ProcessHandler.tqdm', lambda iterable: iterable):
+            start = time.perf_counter()
+            handler.executing_process()
+            seconds = time.perf_counter() - start
+        assert handler.insert_dataframe_to_db.call_count == min(args.new, n_files)
+
+        legacy = ''
+        if n_files <= args.legacy_max:
+            tracker_df = handler.files_tracker.load()
+            start = time.perf_counter()
+            legacy_loop(paths, tracker_df)
+            legacy_seconds = time.perf_counter() - start
+            legacy = f'{legacy_seconds:16.2f} {legacy_seconds / n_files * 1e6:14.1f}'
+        print(f'{n_files:8d} {seconds:10.3f} {seconds / n_files * 1e6:14.1f} {legacy}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Time and peak memory of building_complete_report over the whole archive (2012 to the current year), growing the
+report with one pd.concat per workbook as it used to, or concatenating the frames of every workbook once.
+
+Workbook parsing is replaced by synthetic frames of --rows rows with the columns of the parsed reports, built when
+each workbook is "parsed", so only the accumulation of the report is measured. Growing the report copies
+everything accumulated so far on every workbook, which is quadratic in the number of workbooks and holds two
+copies of the report at its peak. A single concatenation also peaks at two copies (the frames of the workbooks
+and the report), but copies every row once. The peak is measured with tracemalloc in a separate run, as tracing slows
+pandas down.
+
+Usage:
+    python -m benchmarks.bench_report_building [--rows N] [--first-year 2012] [--last-year YYYY] [--repeat N]
+"""
+import argparse
+import datetime
+import gc
+import logging
+import time
+import tracemalloc
+import zlib
+import numpy as np
+import pandas as pd
+import src.DataWrangler
+from src.DataWrangler import DataWrangler
+
+CITIES = ['Bogotá, D.C.', 'Medellín', 'Cali', 'Barranquilla', 'Bucaramanga', 'Pereira', 'Cúcuta', 'Ibagué']
+CATEGORIES = ['verduras_hortalizas', 'frutas_frescas', 'tuberculos_raices_platanos', 'granos_cereales',
+              'huevos_lacteos', 'carnes', 'pescados', 'productos_procesados']
+
+
+def archive_paths(first_year: int, last_year: int) -> tuple:
+    # The first format covers the files up to week 19 of 2018, the second format the ones after it
+    first, second = [], []
+    for year in range(first_year, last_year + 1):
+        for week in range(1, 53):
+            path = f'reports/{year}/week_{week}_anexo_{year}.xlsx'
+            (first if (year, week) <= (2018, 19) else second).append(path)
+    return first, second
+
+
+def synthetic_report(file_path: str, n_rows: int) -> pd.DataFrame:
+    stem = file_path.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+    rng = np.random.default_rng(zlib.crc32(stem.encode()))
+    prices = rng.integers(500, 20000, n_rows).astype(float)
+    return pd.DataFrame({
+        'producto': [f'Producto {index // len(CITIES)}' for index in range(n_rows)],
+        'ciudad': [CITIES[index % len(CITIES)] for index in range(n_rows)],
+        'precio_minimo': prices,
+        'precio_maximo': prices + 400,
+        'precio_medio': prices + 150,
+        'tendencia': rng.choice(['+', '-', '='], n_rows),
+        'categoria': [CATEGORIES[index * len(CATEGORIES) // n_rows] for index in range(n_rows)],
+        'mercado': 'Central mayorista',
+        'semana_no': int(stem.split('_')[1]),
+        'anho': stem[-4:],
+    })
+
+
+def concat_per_workbook(wrangler: DataWrangler) -> pd.DataFrame:
+    # What building_complete_report used to do: the report is copied for each workbook
+    first_format_final = pd.DataFrame()
+    for file_path in wrangler.first_format_paths(bucket_name=wrangler.bucket_name):
+        dataframe = wrangler.parse_workbook(file_path, wrangler.workbook_signature(file_path, default_format=1))
+        first_format_final = pd.concat([first_format_final, dataframe], ignore_index=True)
+    second_format_final = pd.DataFrame()
+    for file_path in wrangler.second_format_paths(bucket_name=wrangler.bucket_name):
+        dataframe = wrangler.parse_workbook(file_path, wrangler.workbook_signature(file_path, default_format=2))
+        second_format_final = pd.concat([second_format_final, dataframe], ignore_index=True)
+    return pd.concat([first_format_final, second_format_final], ignore_index=True)
+
+
+def measure(function, repeat: int) -> tuple:
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        report = function()
+        times.append(time.perf_counter() - start)
+        del report
+    gc.collect()
+    tracemalloc.start()
+    report = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000, help='Rows of each parsed workbook.')
+    parser.add_argument('--first-year', type=int, default=2012, help='First year of the archive.')
+    parser.add_argument('--last-year', type=int, default=datetime.date.today().year, help='Last year of the archive.')
+    parser.add_argument('--repeat', type=int, default=1, help='Timed runs per strategy, the best one is kept.')
+    args = parser.parse_args()
+
+    logger = logging.getLogger('bench_report_building')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    src.DataWrangler.tqdm = lambda iterable: iterable
+
+    first, second = archive_paths(args.first_year, args.last_year)
+    wrangler = DataWrangler(bucket_name='bench-bucket', s3=None, logger=logger, excel_engine='standard')
+    wrangler.first_format_paths = lambda bucket_name: first
+    wrangler.second_format_paths = lambda bucket_name: second
+    wrangler.workbook_signature = lambda file_path, default_format=None: default_format
+    wrangler.parse_workbook = lambda file_path, signature=None: synthetic_report(file_path, args.rows)
+
+    legacy_time, legacy_peak, legacy = measure(lambda: concat_per_workbook(wrangler), args.repeat)
+    single_time, single_peak, single = measure(wrangler.building_complete_report, args.repeat)
+    pd.testing.assert_frame_equal(legacy, single)
+
+    print(f'{len(first) + len(second)} workbooks ({len(first)} first format), {len(single):,} rows, '
+          f'{single.memory_usage(deep=True).sum() / 2 ** 20:,.0f} MiB report')
+    print(f'{"strategy":<22} {"time (s)":>9} {"peak (MiB)":>11}')
+    print(f'{"concat per workbook":<22} {legacy_time:9.2f} {legacy_peak / 2 ** 20:11.0f}')
+    print(f'{"single concat":<22} {single_time:9.2f} {single_peak / 2 ** 20:11.0f}')
+    print(f'speedup {legacy_time / single_time:.1f}x, peak memory ratio {legacy_peak / single_peak:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Parse time of second format workbooks (2018 onwards), reading the eight food class sheets per call to
+pd.read_excel as second_format_data_extraction used to, or from one WorkbookSession. The session is timed with
+openpyxl and, when python-calamine is installed, with the calamine reader.
+
+Real workbooks can be passed with --files (e.g. the second format files of a local mirror cache). Without it,
+synthetic workbooks with the layout of the DANE weekly annex are generated: a contents sheet and eight food
+class sheets with a title block and --rows price rows each.
+
+Usage:
+    python -m benchmarks.bench_workbook_parse [--files PATH ...] [--rows N] [--repeat N]
+"""
+import argparse
+import logging
+import time
+from io import BytesIO
+from pathlib import Path
+import openpyxl
+import pandas as pd
+from src.DataWrangler import DataWrangler
+from src.WorkbookSession import WorkbookSession, python_calamine
+
+FOOD_CLASSES = ['Verduras y hortalizas', 'Frutas frescas', 'Tubérculos, raíces y plátanos', 'Granos y cereales',
+                'Huevos y lácteos', 'Carnes', 'Pescados', 'Productos procesados']
+CITIES = ['Bogotá, D.C., Corabastos', 'Medellín, Central Mayorista de Antioquia', 'Cali, Cavasa', 'Barranquilla',
+          'Bucaramanga, Centroabastos', 'Pereira, Mercasa', 'Cúcuta, Cenabastos', 'Ibagué, Plaza La 21']
+
+
+def synthetic_workbook(n_rows: int) -> bytes:
+    workbook = openpyxl.Workbook()
+    workbook.active.title = 'Índice'
+    workbook.active.append(['Contenido'])
+    for index, food_class in enumerate(FOOD_CLASSES, start=1):
+        sheet = workbook.create_sheet(f'{index}. {food_class[:20]}')
+        sheet.append(['Boletín semanal de precios mayoristas'])
+        for line in ('Sistema de Información de Precios - SIPSA', food_class, 'Semana del 4 al 8 de mayo de 2020',
+                     'Pesos por kilogramo', None, None, None, 'Producto'):
+            sheet.append([line])
+        sheet.append([None])
+        sheet.append([None])
+        for row in range(n_rows):
+            price = 1000 + row * 7 % 3000
+            sheet.append([f'Producto {row // len(CITIES)}', CITIES[row % len(CITIES)], price, price + 400,
+                          price + 150, ['+', '-', '='][row % 3]])
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def read_per_call(data: bytes) -> list:
+    # What second_format_data_extraction used to do: one parse of the workbook per sheet
+    sheet_names = pd.ExcelFile(BytesIO(data), engine='openpyxl').sheet_names
+    return [pd.read_excel(BytesIO(data), sheet_name=sheet_names[index]) for index in range(1, 9)]
+
+
+def read_session(data: bytes, logger: logging.Logger, engine: str = 'openpyxl') -> list:
+    with WorkbookSession(data, logger, engines=(engine,)) as session:
+        return [session.sheet(index) for index in range(1, 9)]
+
+
+def best_of(function, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', nargs='+', type=Path, help='Second format workbooks to parse.')
+    parser.add_argument('--rows', type=int, default=400, help='Price rows per sheet of the synthetic workbooks.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per workbook, the best one is kept.')
+    args = parser.parse_args()
+
+    logger = logging.getLogger('bench_workbook_parse')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    if args.files:
+        workbooks = {path.name: path.read_bytes() for path in args.files}
+    else:
+        workbooks = {f'week_19_synthetic_{rows}_2020.xlsx': synthetic_workbook(rows) for rows in (args.rows // 4, args.rows)}
+
+    wrangler = DataWrangler(bucket_name='bench-bucket', s3=None, logger=logger, excel_engine='standard')
+    print(f'{"workbook":<45} {"KiB":>6} {"per call (ms)":>14} {"session (ms)":>13} {"speedup":>8} '
+          f'{"extraction (ms)":>16} {"calamine (ms)":>14}')
+    for name, data in workbooks.items():
+        for old, new in zip(read_per_call(data), read_session(data, logger)):
+            pd.testing.assert_frame_equal(old, new)
+
+        per_call = best_of(lambda: read_per_call(data), args.repeat)
+        session = best_of(lambda: read_session(data, logger), args.repeat)
+        wrangler.read_workbook = lambda file_path: data
+        file_path = name if name.startswith('week_') else f'week_1_{name}'
+        extraction = best_of(lambda: wrangler.second_format_data_extraction(file_path), args.repeat)
+        calamine = ''
+        if python_calamine is not None:
+            calamine = f'{best_of(lambda: read_session(data, logger, "calamine"), args.repeat) * 1e3:14.1f}'
+        print(f'{name[:45]:<45} {len(data) / 1024:6.0f} {per_call * 1e3:14.1f} {session * 1e3:13.1f} '
+              f'{per_call / session:7.1f}x {extraction * 1e3:16.1f} {calamine}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 
 from src.logging_setup import setup_logger
 from src.ProcessHandler import ProcessHandler
+from src.WorkQueue import WorkQueue
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
 import boto3
@@ -20,6 +21,13 @@ def run_project():
 
     table_name = os.environ['TABLE_NAME']
     bucket_name = os.environ['BUCKET_NAME']
+    max_workers = int(os.environ.get('MAX_WORKERS', 8))
+    incremental = os.environ.get('INCREMENTAL_CRAWL', '1') == '1'
+    cache_dir = os.environ.get('MIRROR_CACHE_DIR')
+    tracker_backend = os.environ.get('TRACKER_BACKEND', 'sqlite')
+    queue_worker = os.environ.get('QUEUE_WORKER', '0') == '1'
+    excel_engine = os.environ.get('EXCEL_ENGINE') or 'standard'
+    parse_workers = int(os.environ.get('PARSE_WORKERS', 1)) or None  # Experimental above 1
 
 
     # Creating connection to database
@@ -38,9 +46,20 @@ def run_project():
                                 engine = engine, 
                                 bucket_name = bucket_name, 
                                 table_name = table_name, 
-                                logger = logger)
+                                logger = logger, 
+                                max_workers = max_workers, 
+                                async_crawl = True, 
+                                incremental = incremental, 
+                                cache_dir = cache_dir, 
+                                tracker_backend = tracker_backend, 
+                                excel_engine = excel_engine, 
+                                parse_workers = parse_workers)
 
-    sipsa_process.executing_process()
+    if queue_worker:
+        # Share the archive with the other workers through a queue in the database
+        sipsa_process.process_queue(WorkQueue(engine = engine, logger = logger))
+    else:
+        sipsa_process.executing_process()
     upload_log_to_s3(bucket_name = bucket_name)
 
 if __name__ == "__main__": 
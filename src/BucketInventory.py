@@ -0,0 +1,322 @@
+
+from typing import Iterable, List, NamedTuple
+import boto3
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from src.Manifest import Manifest
+
+class InventoryEntry(NamedTuple):
+    """
+    A workbook stored under the reports prefix of the bucket.
+
+    Attributes:
+        key (str): The S3 key of the workbook.
+        year (str): The year folder of the workbook.
+        week (int): The week number taken from the file name.
+        file_format (int): 1 for the single tab DANE format, 2 for the one tab per food class format, as detected
+            from the template of the workbook once it was read, and given by its path until then.
+        size (int): The size of the object in bytes.
+        etag (str): The ETag of the object.
+        last_modified (datetime.datetime): The last modification time of the object.
+        parse_status (str): 'pending' until the workbook has been processed, as recorded in the manifest.
+    """
+    key: str
+    year: str
+    week: int
+    file_format: int
+    size: int
+    etag: str
+    last_modified: datetime.datetime
+    parse_status: str = 'pending'
+
+
+class BucketInventory:
+    """
+    A single listing of the workbooks stored in an S3 bucket, classified by DANE format.
+
+    The bucket is listed once under the reports prefix, each key is parsed once, and every consumer reads
+    from the same cached result: the format path methods, the report builder and the processing workflow.
+    DANE switched from the single tab format to the one tab per food class format after week 19 of 2018.
+
+    Each `reports/{year}/` prefix is listed by its own thread and the results are merged in key order, so
+    the listing time follows the largest year rather than the size of the whole archive.
+
+    With a manifest, the inventory is persisted in the bucket. Once the manifest holds the archive, a refresh
+    only lists the year prefixes known to have changed (a delta listing) and reads everything else from the
+    manifest, so downstream stages pick their work without listing S3. Objects written or deleted outside the
+    collector are only seen by a full listing, which runs when the last one is older than `full_listing_interval`.
+
+    Attributes:
+        s3 (boto3.resource): An S3 resource object to interact with AWS S3.
+        logger (logging.Logger): Logger instance for logging messages.
+        bucket_name (str): The name of the S3 bucket.
+        prefix (str): The prefix the workbooks are stored under.
+        max_workers (int): Number of year prefixes listed at the same time.
+        manifest (Manifest): The persistent record of the inventory, None to keep it in memory only.
+        full_listing_interval (datetime.timedelta): Age of the last full listing after which a refresh lists the
+            whole bucket again, None to only list it whole when asked to.
+        entries (List[InventoryEntry]): The classified workbooks, in listing order.
+        loaded (bool): Whether the bucket has been listed.
+
+    Methods:
+        __init__(s3: boto3.resource, logger: logging.Logger, bucket_name: str, prefix: str = 'reports/',
+                 max_workers: int = 8, manifest: Manifest = None,
+                 full_listing_interval: datetime.timedelta = FULL_LISTING_INTERVAL):
+            Initializes an empty inventory of the bucket.
+
+        refresh(years: Iterable[str] = None, full: bool = False) -> List[InventoryEntry]:
+            Lists the bucket, or only some years of it, and classifies its workbooks, replacing the cached entries.
+
+        year_prefixes() -> List[str]:
+            Returns the year folders found directly under the reports prefix.
+
+        list_prefix(prefix: str) -> List[dict]:
+            Lists every object under a prefix.
+
+        classify(key: str) -> tuple:
+            Returns the year, week and format of a workbook key.
+
+        paths(file_format: int) -> List[str]:
+            Returns the keys of the workbooks in a given format.
+
+        etag(key: str) -> str:
+            Returns the ETag of a listed workbook.
+
+        set_parse_status(key: str, status: str):
+            Records the parse status of a workbook in the manifest.
+
+        signature(key: str) -> dict:
+            Returns the template stored in the manifest for the listed version of a workbook.
+
+        set_signature(key: str, signature: dict):
+            Stores the template detected for the listed version of a workbook, and records its format.
+
+        save():
+            Saves the manifest to S3 if it changed.
+    """
+    FORMAT_CUTOVER = (2018, 19)
+    FULL_LISTING_INTERVAL = datetime.timedelta(days=7)
+
+    def __init__(self,
+                 s3: boto3.resource,
+                 logger: logging.Logger,
+                 bucket_name: str,
+                 prefix: str = 'reports/',
+                 max_workers: int = 8,
+                 manifest: Manifest = None,
+                 full_listing_interval: datetime.timedelta = FULL_LISTING_INTERVAL):
+        """
+        Initializes an empty inventory of the bucket. Nothing is listed until `refresh` is called.
+
+        Args:
+            s3 (boto3.resource): An S3 resource object to interact with AWS S3.
+            logger (logging.Logger): Logger instance for logging messages.
+            bucket_name (str): The name of the S3 bucket.
+            prefix (str, optional): The prefix the workbooks are stored under. Defaults to 'reports/'.
+            max_workers (int, optional): Number of year prefixes listed at the same time. Defaults to 8.
+            manifest (Manifest, optional): The persistent record of the inventory. Defaults to None.
+            full_listing_interval (datetime.timedelta, optional): Age of the last full listing after which a refresh
+                lists the whole bucket again, None to disable it. Defaults to `FULL_LISTING_INTERVAL` (7 days).
+        """
+        self.s3 = s3
+        self.logger = logger
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.max_workers = max(1, max_workers)
+        self.manifest = manifest
+        self.full_listing_interval = full_listing_interval
+        self.entries = []
+        self.loaded = False
+        self._positions = {}
+
+    def refresh(self, years: Iterable[str] = None, full: bool = False) -> List[InventoryEntry]:
+        """
+        Lists the bucket, or only some years of it, and classifies its workbooks, replacing the cached entries.
+
+        Keys that are not Excel files are ignored, keys whose week cannot be parsed are logged and skipped.
+
+        Args:
+            years (Iterable[str], optional): The only years that may have changed since the manifest was last
+                updated. Ignored without a manifest, while it is empty or when a full listing is due.
+                Defaults to None (list every year).
+            full (bool, optional): List the whole bucket even if `years` is given. Defaults to False.
+
+        Returns:
+            List[InventoryEntry]: The classified workbooks, in listing order.
+        """
+        if self.manifest is not None and not self.manifest.loaded:
+            self.manifest.load()
+
+        full = full or years is None or self.manifest is None or self.manifest.is_empty() or self._full_listing_due()
+        if not full:
+            prefixes = [f'{self.prefix}{year}/' for year in sorted(years)]
+        else:
+            # A bucket without year folders is listed as a whole
+            prefixes = self.year_prefixes() or [self.prefix]
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(prefixes)))) as executor:
+            listings = list(executor.map(self.list_prefix, prefixes))
+
+        entries = []
+        for obj in (obj for listing in listings for obj in listing):
+            key = obj['Key']
+            if not key.endswith(('.xls', '.xlsx')):
+                continue
+            try:
+                year, week, file_format = self.classify(key)
+            except (IndexError, ValueError) as e:
+                self.logger.warning(f"Error processing path {key}: {e}")
+                continue
+            entries.append(InventoryEntry(key, year, week, file_format,
+                                          obj.get('Size'), obj.get('ETag'), obj.get('LastModified')))
+            self.logger.debug(f"File added to format {file_format}: {key}")
+
+        if self.manifest is not None:
+            self.manifest.apply_listing(prefixes, [entry._asdict() for entry in entries], full=full)
+            self.manifest.save()
+            entries = [InventoryEntry(**row) for row in self.manifest.rows()]
+
+        self.entries = entries
+        self._positions = {entry.key: position for position, entry in enumerate(entries)}
+        self.loaded = True
+        self.logger.info(f"Listed {len(entries)} workbooks under {self.prefix} in bucket {self.bucket_name} "
+                         f"({len(prefixes)} prefixes).")
+        return entries
+
+    def _full_listing_due(self) -> bool:
+        if self.full_listing_interval is None:
+            return False
+        last_full_listing = self.manifest.last_full_listing()
+        if last_full_listing is None:
+            self.logger.info(f"No full listing of bucket {self.bucket_name} recorded in the manifest, listing it whole.")
+            return True
+        age = datetime.datetime.now(datetime.timezone.utc) - last_full_listing
+        if age < self.full_listing_interval:
+            return False
+        self.logger.info(f"Last full listing of bucket {self.bucket_name} is {age} old, listing it whole again.")
+        return True
+
+    def year_prefixes(self) -> List[str]:
+        """
+        Returns the year folders found directly under the reports prefix.
+
+        Returns:
+            List[str]: Prefixes like 'reports/2012/', in key order.
+        """
+        paginator = self.s3.meta.client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(Bucket=self.bucket_name, Prefix=self.prefix, Delimiter='/')
+        return sorted(common['Prefix'] for page in pages for common in page.get('CommonPrefixes', []))
+
+    def list_prefix(self, prefix: str) -> List[dict]:
+        """
+        Lists every object under a prefix.
+
+        It goes through the S3 client, which unlike the resource can be shared between threads.
+
+        Args:
+            prefix (str): The prefix to list.
+
+        Returns:
+            List[dict]: The `Key`, `Size`, `ETag` and `LastModified` of each object, in key order.
+        """
+        paginator = self.s3.meta.client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(Bucket=self.bucket_name, Prefix=prefix)
+        return [obj for page in pages for obj in page.get('Contents', [])]
+
+    def classify(self, key: str) -> tuple:
+        """
+        Returns the year, week and format of a workbook key.
+
+        Args:
+            key (str): A key like 'reports/{year}/week_{week}_{name}.xlsx'.
+
+        Returns:
+            tuple: The year (str), the week (int) and the format (1 or 2).
+
+        Raises:
+            IndexError: If the key has no year folder or no week in its file name.
+            ValueError: If the year or the week is not a number.
+        """
+        path = Path(key)
+        year = path.parts[1]
+        week = int(path.stem.split('_')[1])
+        file_format = 1 if (int(year), week) <= self.FORMAT_CUTOVER else 2
+        return year, week, file_format
+
+    def paths(self, file_format: int) -> List[str]:
+        """
+        Returns the keys of the workbooks in a given format.
+
+        Args:
+            file_format (int): 1 or 2.
+
+        Returns:
+            List[str]: The keys, in listing order.
+        """
+        return [entry.key for entry in self.entries if entry.file_format == file_format]
+
+    def etag(self, key: str) -> str:
+        """
+        Returns the ETag of a listed workbook.
+
+        Args:
+            key (str): The S3 key of the workbook.
+
+        Returns:
+            str: The ETag, or None if the key was not listed.
+        """
+        position = self._positions.get(key)
+        return self.entries[position].etag if position is not None else None
+
+    def set_parse_status(self, key: str, status: str):
+        """
+        Records the parse status of a workbook in the manifest.
+
+        Args:
+            key (str): The S3 key of the workbook.
+            status (str): The new status, e.g. 'loaded' or 'empty'.
+        """
+        position = self._positions.get(key)
+        if position is not None:
+            self.entries[position] = self.entries[position]._replace(parse_status=status)
+        if self.manifest is not None:
+            self.manifest.set_parse_status(key, status)
+
+    def signature(self, key: str) -> dict:
+        """
+        Returns the template stored in the manifest for the listed version of a workbook.
+
+        Args:
+            key (str): The S3 key of the workbook.
+
+        Returns:
+            dict: The stored template, or None without a manifest or if that version was not detected yet.
+        """
+        etag = self.etag(key)
+        if self.manifest is None or etag is None:
+            return None
+        return self.manifest.signature(key, etag)
+
+    def set_signature(self, key: str, signature: dict):
+        """
+        Stores the template detected for the listed version of a workbook, and records its format when it was
+        recognised, in place of the one given by the path of the workbook.
+
+        Args:
+            key (str): The S3 key of the workbook.
+            signature (dict): The template, as JSON serializable values, with its `file_format`.
+        """
+        etag = self.etag(key)
+        position = self._positions.get(key)
+        if position is not None and signature.get('file_format') is not None:
+            self.entries[position] = self.entries[position]._replace(file_format=signature['file_format'])
+        if self.manifest is not None and etag is not None:
+            self.manifest.set_signature(key, etag, signature)
+
+    def save(self):
+        """
+        Saves the manifest to S3 if it changed.
+        """
+        if self.manifest is not None:
+            self.manifest.save()
@@ -1,16 +1,22 @@
 
 import boto3
 import requests
-import re
-from bs4 import BeautifulSoup
 import pandas as pd
 import datetime
 from io import BytesIO
-from typing import List
+from typing import Callable, List
+import json
+import hashlib
 from botocore.exceptions import ClientError
 from pathlib import Path
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
 import logging
+import threading
+from src.RateLimiter import JitteredRetry, RateLimiter, RateLimitedAdapter
+from src.LinkExtractor import Link, get_link_extractor
+from src.FilesTracker import FilesTracker, get_files_tracker
 
 class DataCollector:    
     """
@@ -26,35 +32,110 @@ class DataCollector:
         url_base (str): The base URL of the DANE website.
         url (str): The URL of the DANE webpage for the data.
         headers (dict): HTTP headers used for web requests.
-        files_tracker_name (str): The name of the file tracker CSV in S3.
+        session (requests.Session): Pooled keep-alive session shared by every request to the DANE website.
+        rate_limiter (RateLimiter): Token bucket and adaptive concurrency controller applied to every request of the session.
+        link_extractor (BeautifulSoupLinkExtractor): Backend extracting the year and report links from the DANE pages.
+        tracker_backend (str): Storage of the files tracker, 'csv' (files_tracker.csv), 'sqlite' (files_tracker.sqlite)
+            or 'postgres' (a table of the target database, needs the engine of a ProcessHandler).
+        trackers (dict): The files tracker of each bucket used so far.
+        listing_cache_name (str): The name of the HTTP validator cache JSON in S3, stored next to the files tracker.
+        listing_cache (dict): Per listing URL, the ETag, Last-Modified and parsed `(href, text)` links of the last fetch.
         logfile_name (str): The name of the log file.
         logger (logging.Logger): Logger instance for logging messages.
+        max_workers (int): Number of worker threads used to download and upload files concurrently.
+        async_crawl (bool): If True, `get_files` crawls all year pages concurrently and streams them into the download stage.
+        incremental (bool): If True, `get_files` only crawls the most recent years and skips years already complete in the tracker.
+        incremental_years (int): Number of most recent years considered open to changes in incremental mode.
+        s3_client (botocore.client.S3): The low-level client of `s3`. Unlike resources, clients are thread safe,
+            so the download worker threads only go through it.
+        part_size (int): Size in bytes of the parts of the multipart uploads to S3, at least MIN_PART_SIZE.
+        upload_concurrency (int): Number of parts of a single file uploaded to S3 at the same time.
+        tracked_counts (dict): Number of tracked files per year, loaded by `get_files` in incremental mode.
+        content_index (dict): SHA-256 of every tracked workbook mapped to its file name, built from the files tracker.
+            Hashes missing from rows tracked before they were recorded are backfilled once per run, when new files
+            are first downloaded.
+        updated_years (set): Year folders under reports/ that received new workbooks during the last `get_files`.
 
     Methods:
-        __init__(s3: boto3.resource, logger: logging.Logger) -> None:
+        __init__(s3: boto3.resource, logger: logging.Logger, max_workers: int = 1, async_crawl: bool = False,
+                 pool_size: int = 10, max_retries: int = 3, backoff_factor: float = 0.5,
+                 incremental: bool = False, incremental_years: int = 2,
+                 part_size: int = 8 * 1024 * 1024, upload_concurrency: int = 4, rate_limit: float = 5.0,
+                 html_backend: str = None, tracker_backend: str = 'csv') -> None:
             Initializes the DataCollector with S3 resource and logger.
 
-        all_years_links() -> List[BeautifulSoup]:
+        build_session(pool_size: int, max_retries: int, backoff_factor: float) -> requests.Session:
+            Creates a pooled, rate-limited keep-alive session with jittered exponential retry on idempotent requests.
+
+        connection_stats() -> dict:
+            Returns request and connection counters of the session's connection pools.
+
+        fetch_listing(url: str, parse: Callable[[bytes], List[Link]]) -> List[Link]:
+            Fetches a listing page with a conditional GET and returns its links, parsing only when it changed.
+
+        load_listing_cache(bucket_name: str) -> dict:
+            Loads the listing cache from S3 or returns an empty cache if it does not exist.
+
+        update_listing_cache(bucket_name: str):
+            Saves the listing cache to S3.
+
+        all_years_links() -> List[Link]:
             Fetches the set of year links available on the DANE webpage.
 
-        links_per_year(link: BeautifulSoup) -> List[BeautifulSoup]:
+        links_per_year(link: Link) -> List[Link]:
             Retrieves all report links for a specific year.
 
         check_file_exists_in_s3(bucket_name: str, file_name: str) -> bool:
             Checks if a specific file already exists in the S3 bucket.
 
+        tracker_store(bucket_name: str) -> FilesTracker:
+            Returns the files tracker of a bucket, with keyed lookups and upserts.
+
         load_files_tracker(bucket_name: str) -> pd.DataFrame:
-            Loads the files_tracker.csv from S3 or creates a new DataFrame if it does not exist.
+            Loads the files tracker from S3 or creates a new DataFrame if it does not exist.
 
         update_files_tracker(df: pd.DataFrame, bucket_name: str):
-            Updates the files_tracker.csv in S3.
+            Updates the files tracker in S3.
 
         upload_or_update_dataframe_to_s3(df: pd.DataFrame, bucket_name: str, file_name: str):
             Uploads or updates a DataFrame as a CSV file to an S3 bucket.
 
-        download_files_per_year(link: BeautifulSoup, bucket_name: str = None):
+        find_multipart_upload(bucket_name: str, destination_key: str) -> tuple:
+            Looks for an unfinished multipart upload of a key and the parts it already holds.
+
+        build_content_index(tracker_df: pd.DataFrame) -> dict:
+            Maps the SHA-256 of every tracked workbook to its file name.
+
+        backfill_content_hashes(tracker_df: pd.DataFrame, bucket_name: str) -> pd.DataFrame:
+            Computes the SHA-256 of the tracked workbooks recorded before content hashes were tracked.
+
+        claim_content_hash(sha256: str, file_name: str) -> str:
+            Registers the content hash of a file, or returns the file already holding that content.
+
+        upload_stream_to_s3(file_link: str, bucket_name: str, destination_key: str) -> dict:
+            Streams a file into S3 with a resumable multipart upload and returns its size and SHA-256.
+
+        fetch_and_upload_file(file_link: str, destination_key: str, bucket_name: str = None) -> dict:
+            Downloads a single file and optionally uploads it to an S3 bucket.
+
+        download_files_per_year(link: Link, bucket_name: str = None, file_links: List[Link] = None):
             Downloads all files for a specific year and optionally uploads them to an S3 bucket.
 
+        tracked_files_per_year(tracker_df: pd.DataFrame) -> dict:
+            Counts the tracked files of each year.
+
+        select_years(year_links: List[Link]) -> List[Link]:
+            Keeps the years that have to be crawled in the current mode.
+
+        year_is_up_to_date(link: Link, file_links: List[Link]) -> bool:
+            Checks if the tracker already holds as many files for a year as its page lists.
+
+        crawl_year_pages(year_links: List[Link], queue: asyncio.Queue):
+            Fetches all year pages concurrently and pushes their report links into a queue as they arrive.
+
+        crawl_and_download(bucket_name: str = None):
+            Runs the concurrent crawler and the download stage as a streaming pipeline.
+
         get_files(bucket_name: str = None):
             Downloads all files from all years and optionally uploads them to an S3 bucket.
 
@@ -62,13 +143,35 @@ class DataCollector:
             Displays the DataFrame contained in the files_tracker.csv file from the S3 bucket.
             """
     
-    def __init__(self, s3: boto3.resource, logger: logging.Logger) -> None:
+    MIN_PART_SIZE = 5 * 1024 * 1024  # S3 rejects smaller parts, except the last one, when completing an upload
+
+    def __init__(self, s3: boto3.resource, logger: logging.Logger, max_workers: int = 1, async_crawl: bool = False,
+                 pool_size: int = 10, max_retries: int = 3, backoff_factor: float = 0.5,
+                 incremental: bool = False, incremental_years: int = 2,
+                 part_size: int = 8 * 1024 * 1024, upload_concurrency: int = 4, rate_limit: float = 5.0,
+                 html_backend: str = None, tracker_backend: str = 'csv') -> None:
         """
         Initializes the DataCollector class with the provided S3 resource and logger.
 
         Args:
             s3 (boto3.resource): An S3 resource object to interact with AWS S3.
             logger (logging.Logger): Logger instance for logging messages.
+            max_workers (int, optional): Number of files downloaded and uploaded at the same time. Defaults to 1 (serial).
+            async_crawl (bool, optional): Crawl all year pages concurrently and stream them into the downloads. Defaults to False.
+            pool_size (int, optional): Maximum number of keep-alive connections kept open to the DANE website. Defaults to 10.
+            max_retries (int, optional): Number of retries for failed GET requests. Defaults to 3.
+            backoff_factor (float, optional): Base delay in seconds of the exponential backoff between retries. Defaults to 0.5.
+            incremental (bool, optional): Only crawl the years whose data could still change. Defaults to False.
+            incremental_years (int, optional): Number of most recent years crawled in incremental mode. Defaults to 2
+                (current and previous year).
+            part_size (int, optional): Size in bytes of the multipart upload parts, at least 5 MiB (the S3
+                minimum for every part but the last). Defaults to 8 MiB.
+            upload_concurrency (int, optional): Number of parts of a file uploaded at the same time. Defaults to 4.
+            rate_limit (float, optional): Initial number of requests per second sent to the DANE website; adapted
+                at runtime between a tenth and four times this value. Defaults to 5.0.
+            html_backend (str, optional): Link extraction backend, 'lxml' or 'bs4'. Defaults to lxml when installed.
+            tracker_backend (str, optional): Files tracker storage, 'csv', 'sqlite' or 'postgres'. The SQLite tracker
+                imports an existing files_tracker.csv on first use. Defaults to 'csv'.
             """
         self.url_base = 'https://www.dane.gov.co'
         self.url = 'https://www.dane.gov.co/index.php/estadisticas-por-tema/agropecuario/sistema-de-informacion-de-precios-sipsa/mayoristas-boletin-semanal-1'
@@ -76,48 +179,207 @@ class DataCollector:
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
         }
         self.s3 = s3
-        self.files_tracker_name = 'files_tracker.csv'
+        # boto3 resources must not be shared between threads, the download workers use the client instead
+        self.s3_client = s3.meta.client if s3 is not None else None
+        self.tracker_backend = tracker_backend
+        self.trackers = {}
+        self.listing_cache_name = 'listing_cache.json'
+        self.listing_cache = {}
         self.logfile_name = 'logfile'
         self.logger = logger
+        self.max_workers = max(1, max_workers)
+        self.async_crawl = async_crawl
+        self.incremental = incremental
+        self.incremental_years = incremental_years
+        self.tracked_counts = {}
+        self.content_index = {}
+        self.updated_years = set()
+        self._content_index_lock = threading.Lock()
+        self._hashes_backfilled = False
+        if part_size < self.MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {self.MIN_PART_SIZE} bytes (the S3 minimum), got {part_size}")
+        self.part_size = part_size
+        self.upload_concurrency = max(1, upload_concurrency)
+        self.max_retries = max_retries
+        pool_size = max(pool_size, self.max_workers)
+        self.rate_limiter = RateLimiter(logger, rate=rate_limit, min_rate=rate_limit / 10, max_rate=rate_limit * 4,
+                                        max_concurrency=pool_size)
+        self.session = self.build_session(pool_size, max_retries, backoff_factor)
+        self.link_extractor = get_link_extractor(html_backend)
+
+    def build_session(self, pool_size: int, max_retries: int, backoff_factor: float) -> requests.Session:
+        """
+        Creates a pooled, rate-limited keep-alive session with jittered exponential retry on idempotent requests.
+
+        Connections to the DANE website are kept open and reused across pages and workbooks, so the
+        TCP and TLS handshakes are paid once per pooled connection instead of once per request.
+        Every request goes through `rate_limiter` before being sent.
+        GET and HEAD requests answered with 500, 502 or 504, or failing to connect, are retried by urllib3
+        with an exponential backoff plus random jitter. Throttled requests (429 and 503) are retried by the
+        adapter instead, honouring any Retry-After header, so each attempt goes through the rate limiter and
+        its throttling is seen by the adaptive controller.
+
+        Args:
+            pool_size (int): Maximum number of connections kept open per host.
+            max_retries (int): Number of retries for a failed request.
+            backoff_factor (float): Base delay in seconds of the exponential backoff.
+
+        Returns:
+            requests.Session: The configured session.
+        """
+        retry = JitteredRetry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            jitter=backoff_factor,
+            status_forcelist=(500, 502, 504),
+            # urllib3 retries any 429/503 carrying Retry-After, the adapter does it through the rate limiter
+            respect_retry_after_header=False,
+            allowed_methods=frozenset({'GET', 'HEAD'}),
+            raise_on_status=False,
+        )
+        adapter = RateLimitedAdapter(self.rate_limiter, throttle_retries=max_retries, backoff_factor=backoff_factor,
+                                     pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.headers.update(self.headers)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def connection_stats(self) -> dict:
+        """
+        Returns request and connection counters of the session's connection pools.
+
+        Returns:
+            dict: `requests` sent, `connections` opened, and `reused` requests that did not need a new connection.
+        """
+        requests_count, connections_count = 0, 0
+        for adapter in set(self.session.adapters.values()):
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools[key]
+                requests_count += pool.num_requests
+                connections_count += pool.num_connections
+        return {
+            'requests': requests_count,
+            'connections': connections_count,
+            'reused': requests_count - connections_count,
+        }
+
+    def fetch_listing(self, url: str, parse: Callable[[bytes], List[Link]]) -> List[Link]:
+        """
+        Fetches a listing page with a conditional GET and returns its links, parsing only when it changed.
+
+        The ETag and Last-Modified validators of the previous fetch are sent as If-None-Match and
+        If-Modified-Since. On a 304 answer the page is not downloaded nor parsed again: the links stored
+        in the listing cache are returned instead. On a 200 answer the page is parsed and the cache refreshed.
+
+        Args:
+            url (str): The URL of the listing page.
+            parse (Callable[[bytes], List[Link]]): Extracts the links from the page content.
+
+        Returns:
+            List[Link]: The links of the page.
+
+        Raises:
+            requests.RequestException: If the page cannot be fetched.
+        """
+        cached = self.listing_cache.get(url)
+        conditional_headers = {}
+        if cached:
+            if cached.get('etag'):
+                conditional_headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                conditional_headers['If-Modified-Since'] = cached['last_modified']
+
+        response = self.session.get(url, headers=conditional_headers)
+        response.raise_for_status()
+
+        if cached and response.status_code == 304:
+            self.logger.debug(f"Listing {url} not modified, using cached links.")
+            return [Link(href, text) for href, text in cached['links']]
+
+        links = parse(response.content)
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if etag or last_modified:
+            self.listing_cache[url] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'links': [[item['href'], item.get_text()] for item in links],
+            }
+        return links
+
+    def load_listing_cache(self, bucket_name: str) -> dict:
+        """
+        Loads the listing cache from S3 or returns an empty cache if it does not exist.
+
+        Args:
+            bucket_name (str): The name of the S3 bucket containing the listing cache.
+
+        Returns:
+            dict: The listing cache, keyed by listing URL.
+        """
+        try:
+            obj = self.s3.Object(bucket_name, self.listing_cache_name)
+            listing_cache = json.loads(obj.get()['Body'].read())
+            self.logger.info("Loaded existing listing cache from S3.")
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchKey':
+                listing_cache = {}
+                self.logger.info("No existing listing cache found in S3. Creating a new one.")
+            else:
+                self.logger.error(f"ClientError when accessing {self.listing_cache_name}: {e}")
+                raise
+        except ValueError as e:
+            listing_cache = {}
+            self.logger.warning(f"Discarding unreadable listing cache {self.listing_cache_name}: {e}")
+        return listing_cache
+
+    def update_listing_cache(self, bucket_name: str):
+        """
+        Saves the listing cache to S3.
+
+        Args:
+            bucket_name (str): The name of the S3 bucket where the listing cache is stored.
+        """
+        body = json.dumps(self.listing_cache).encode('utf-8')
+        try:
+            self.s3.Bucket(bucket_name).put_object(Body=body, Key=self.listing_cache_name, ContentType='application/json')
+        except ClientError as e:
+            self.logger.error(f"Failed to update listing cache in S3 bucket {bucket_name}: {e}")
+            raise
 
-    def all_years_links(self) -> List[BeautifulSoup]:
+    def all_years_links(self) -> List[Link]:
         """
         Retrieves the set of year links available on the DANE webpage.
 
         Returns:
-            List[BeautifulSoup]: A list of BeautifulSoup objects representing the links for each year.
+            List[Link]: A list of `(href, text)` links, one for each year.
         """
         try:
-            response = requests.get(self.url, headers=self.headers)
-            response.raise_for_status()
+            link_years = self.fetch_listing(self.url, self.link_extractor.year_links)
         except requests.RequestException as e:
             self.logger.error(f"Failed to fetch URL {self.url}: {e}")
             return []
 
-        soup = BeautifulSoup(response.content, "html.parser")
-        link_years = soup.find_all(lambda tag: tag.name == 'a' and re.match(r'^\d+$', tag.get_text().strip()))
         return link_years
 
-    def links_per_year(self, link: BeautifulSoup) -> List[BeautifulSoup]:
+    def links_per_year(self, link: Link) -> List[Link]:
         """
         Retrieves all report links for a specific year.
 
         Args:
-            link (BeautifulSoup): The BeautifulSoup object containing the link to the year page.
+            link (Link): The link to the year page.
 
         Returns:
-            List[BeautifulSoup]: A list of BeautifulSoup objects representing the report links for the specified year.
+            List[Link]: A list of `(href, text)` links to the reports of the specified year.
         """
         try:
-            r = requests.get(self.url_base + link['href'], headers=self.headers)
-            r.raise_for_status()
+            one_year_links = self.fetch_listing(self.url_base + link['href'], self.link_extractor.report_links)
         except requests.RequestException as e:
             self.logger.error(f"Failed to fetch URL {self.url_base + link['href']}: {e}")
             return []
 
         self.logger.info(f"Working on {link['href'][-4:]} files")
-        soup_year = BeautifulSoup(r.content, "html.parser")
-        one_year_links = [item for item in soup_year.find_all(target='_blank') if 'Anexo' in item.text]
         return one_year_links
 
     def check_file_exists_in_s3(self, bucket_name: str, file_name: str) -> bool:
@@ -141,47 +403,49 @@ class DataCollector:
                 self.logger.error(f"ClientError when checking {file_name} in bucket {bucket_name}: {e}")
                 raise
 
+    def tracker_store(self, bucket_name: str) -> FilesTracker:
+        """
+        Returns the files tracker of a bucket, with keyed lookups and upserts.
+
+        The same tracker object is shared by every caller for a given bucket, so rows added while
+        downloading and RDS load statuses recorded while processing never overwrite each other.
+
+        Args:
+            bucket_name (str): The name of the S3 bucket holding the tracker.
+
+        Returns:
+            FilesTracker: The tracker of the bucket, using the `tracker_backend` storage.
+        """
+        if bucket_name not in self.trackers:
+            # The database tracker uses the engine of the DataIngestor when both are combined (ProcessHandler)
+            self.trackers[bucket_name] = get_files_tracker(self.tracker_backend, self.s3, self.logger, bucket_name,
+                                                           engine=getattr(self, 'engine', None))
+        return self.trackers[bucket_name]
+
     def load_files_tracker(self, bucket_name: str) -> pd.DataFrame:
         """
-        Loads the files_tracker.csv from S3 or creates a new DataFrame if it does not exist.
+        Loads the files tracker from S3 or creates a new DataFrame if it does not exist.
 
         Args:
-            bucket_name (str): The name of the S3 bucket containing the files_tracker.csv.
+            bucket_name (str): The name of the S3 bucket containing the files tracker.
 
         Returns:
             pd.DataFrame: A DataFrame containing the file tracking information.
         """
-        try:
-            obj = self.s3.Object(bucket_name, self.files_tracker_name)
-            response = obj.get()
-            tracker_df = pd.read_csv(BytesIO(response['Body'].read()))
-            self.logger.info("Loaded existing files tracker from S3.")
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'NoSuchKey':
-                tracker_df = pd.DataFrame(columns=['file', 'link', 'date_added'])
-                self.logger.info("No existing files tracker found in S3. Creating a new one.")
-            else:
-                self.logger.error(f"ClientError when accessing {self.files_tracker_name}: {e}")
-                raise
-        return tracker_df
+        return self.tracker_store(bucket_name).load()
 
     def update_files_tracker(self, df: pd.DataFrame, bucket_name: str):
         """
-        Updates the files_tracker.csv in S3 with new file information.
+        Updates the files tracker in S3 with new file information.
+
+        The RDS load status is owned by the processing stage, which may have recorded loads since the DataFrame
+        was read, so it is never written from here.
 
         Args:
             df (pd.DataFrame): The DataFrame containing file tracking information to update.
-            bucket_name (str): The name of the S3 bucket where the files_tracker.csv is stored.
+            bucket_name (str): The name of the S3 bucket where the files tracker is stored.
         """
-        buffer = BytesIO()
-        df.to_csv(buffer, index=False)
-        buffer.seek(0)
-        try:
-            self.s3.Bucket(bucket_name).put_object(Body=buffer, Key=self.files_tracker_name)
-#             self.logger.info("Files tracker updated successfully in S3.")
-        except ClientError as e:
-            self.logger.error(f"Failed to update files tracker in S3 bucket {bucket_name}: {e}")
-            raise
+        self.tracker_store(bucket_name).save(df.drop(columns=['rds_load'], errors='ignore'))
 
     def upload_or_update_dataframe_to_s3(self, df: pd.DataFrame, bucket_name: str, file_name: str):
         """
@@ -202,66 +466,522 @@ class DataCollector:
             self.logger.error(f"Failed to upload DataFrame {file_name} to S3 bucket {bucket_name}: {e}")
             raise
 
-    def download_files_per_year(self, link: BeautifulSoup, bucket_name: str = None):
+    def find_multipart_upload(self, bucket_name: str, destination_key: str) -> tuple:
+        """
+        Looks for an unfinished multipart upload of a key and the parts it already holds.
+
+        Args:
+            bucket_name (str): The name of the S3 bucket.
+            destination_key (str): The S3 key of the upload.
+
+        Returns:
+            tuple: The upload id (None if there is no unfinished upload) and a dict of its uploaded parts
+                keyed by part number, each with its `ETag` and `Size`.
+        """
+        client = self.s3_client
+        uploads = client.list_multipart_uploads(Bucket=bucket_name, Prefix=destination_key).get('Uploads', [])
+        uploads = [upload for upload in uploads if upload['Key'] == destination_key]
+        if not uploads:
+            return None, {}
+
+        upload_id = uploads[-1]['UploadId']
+        parts = client.list_parts(Bucket=bucket_name, Key=destination_key, UploadId=upload_id).get('Parts', [])
+        return upload_id, {part['PartNumber']: {'ETag': part['ETag'], 'Size': part['Size']} for part in parts}
+
+    def build_content_index(self, tracker_df: pd.DataFrame) -> dict:
+        """
+        Maps the SHA-256 of every tracked workbook to its file name.
+
+        Rows without a hash (see `backfill_content_hashes`) and alias rows are left out. When several tracked
+        workbooks share a hash, the first one tracked is the original.
+
+        Args:
+            tracker_df (pd.DataFrame): The files tracker.
+
+        Returns:
+            dict: The file name of each known content hash.
+        """
+        if 'sha256' not in tracker_df.columns:
+            return {}
+        originals = tracker_df[tracker_df['sha256'].notna()]
+        if 'alias_of' in originals.columns:
+            originals = originals[originals['alias_of'].isna()]
+        index = {}
+        for sha256, file_name in zip(originals['sha256'], originals['file']):
+            index.setdefault(sha256, file_name)
+        return index
+
+    def backfill_content_hashes(self, tracker_df: pd.DataFrame, bucket_name: str) -> pd.DataFrame:
+        """
+        Computes the SHA-256 of the tracked workbooks recorded before content hashes were tracked.
+
+        Their objects are found with one listing of the reports/ prefix and streamed from S3 by `max_workers`
+        threads. The hashes are recorded in the tracker when it is next saved, so each workbook is only read once.
+        Workbooks already stored twice under different names are logged as duplicates. They stay tracked as they
+        are, and the first one tracked becomes the original of later copies.
+
+        Args:
+            tracker_df (pd.DataFrame): The files tracker.
+            bucket_name (str): The name of the S3 bucket holding the workbooks.
+
+        Returns:
+            pd.DataFrame: The files tracker with the missing hashes filled in where the workbook could be read.
+        """
+        tracker_df = tracker_df.copy()
+        if 'sha256' not in tracker_df.columns:
+            tracker_df['sha256'] = None
+        missing = tracker_df['sha256'].isna()
+        if 'alias_of' in tracker_df.columns:
+            missing &= tracker_df['alias_of'].isna()
+        if not missing.any():
+            return tracker_df
+
+        keys = {}
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix='reports/'):
+            for obj in page.get('Contents', []):
+                keys.setdefault(Path(obj['Key']).name, obj['Key'])
+
+        def content_hash(key):
+            digest = hashlib.sha256()
+            body = self.s3_client.get_object(Bucket=bucket_name, Key=key)['Body']
+            for chunk in iter(lambda: body.read(1024 * 1024), b''):
+                digest.update(chunk)
+            return digest.hexdigest()
+
+        rows = [(index, keys[file_name]) for index, file_name in tracker_df.loc[missing, 'file'].items() if file_name in keys]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            hashes = list(executor.map(lambda row: content_hash(row[1]), rows))
+        for (index, _), sha256 in zip(rows, hashes):
+            tracker_df.at[index, 'sha256'] = sha256
+        self.logger.info(f"Backfilled the content hash of {len(rows)} of {int(missing.sum())} tracked files without one.")
+
+        hashed = tracker_df[tracker_df['sha256'].notna()]
+        if 'alias_of' in hashed.columns:
+            hashed = hashed[hashed['alias_of'].isna()]
+        for sha256, files in hashed.groupby('sha256', sort=False)['file']:
+            if len(files) > 1:
+                self.logger.warning(f"Tracked files {list(files)} have the same content ({sha256[:12]}).")
+        return tracker_df
+
+    def claim_content_hash(self, sha256: str, file_name: str) -> str:
+        """
+        Registers the content hash of a file, or returns the file already holding that content.
+
+        The check and the registration happen under a lock, so two identical workbooks downloaded by
+        concurrent workers cannot both be stored.
+
+        Args:
+            sha256 (str): The SHA-256 hex digest of the file content.
+            file_name (str): The tracker file name of the file.
+
+        Returns:
+            str: The file name already registered for this content, None if the content is new.
+        """
+        with self._content_index_lock:
+            original = self.content_index.get(sha256)
+            if original is not None and original != file_name:
+                return original
+            self.content_index[sha256] = file_name
+            return None
+
+    def _release_content_hash(self, sha256: str):
+        # The file holding this content could not be stored: let the next copy claim it
+        with self._content_index_lock:
+            self.content_index.pop(sha256, None)
+
+    def upload_stream_to_s3(self, file_link: str, bucket_name: str, destination_key: str) -> dict:
+        """
+        Streams a file into S3 with a resumable multipart upload and returns its size and SHA-256.
+
+        The download is cut into `part_size` parts, uploaded `upload_concurrency` at a time, while a SHA-256
+        of the content is computed on the fly. The object only becomes visible once every byte announced by
+        the server has been uploaded, so a dropped connection can no longer leave a truncated workbook behind.
+        A file smaller than one part (most weekly workbooks) is stored with a single PUT instead, and no
+        multipart upload is started for it; an unfinished upload of the key left by a previous run is aborted.
+
+        Interrupted transfers resume instead of restarting:
+            - Within a run, the download is retried from the last complete part with an HTTP Range request.
+            - Across runs, the unfinished multipart upload left in S3 is picked up again. Its parts are checked
+              against the downloaded bytes (MD5 ETag) and only missing or different parts are uploaded.
+
+        The content hash is known before the last part is sent. When `content_index` already holds it, DANE
+        republished a workbook under a new URL: the upload is aborted, no object is created, and the file is
+        reported as an alias of the original so it is never parsed or loaded again.
+
+        Args:
+            file_link (str): The full URL of the file to download.
+            bucket_name (str): The name of the S3 bucket.
+            destination_key (str): The S3 key the file is uploaded to.
+
+        Returns:
+            dict: The `size` in bytes and the `sha256` hex digest of the file, plus `alias_of`, the file
+                name of the original, if the content was already stored.
+
+        Raises:
+            requests.RequestException: If the download keeps failing after `max_retries` resumed attempts.
+            IOError: If fewer bytes than announced by the server could be read.
+            ClientError: If S3 rejects the upload.
+        """
+        client = self.s3_client
+        upload_id, previous_parts = None, {}
+
+        def start_multipart_upload():
+            # Only started once the file turns out to need more than one part
+            nonlocal upload_id, previous_parts
+            upload_id, previous_parts = self.find_multipart_upload(bucket_name, destination_key)
+            if upload_id:
+                self.logger.info(f"Resuming upload of {destination_key}: {len(previous_parts)} parts already in S3.")
+            else:
+                upload_id = client.create_multipart_upload(Bucket=bucket_name, Key=destination_key)['UploadId']
+
+        def upload_part(part_number, body):
+            previous = previous_parts.get(part_number)
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            if previous and previous['ETag'] == etag and previous['Size'] == len(body):
+                return part_number, etag
+            response = client.upload_part(Bucket=bucket_name, Key=destination_key, UploadId=upload_id,
+                                          PartNumber=part_number, Body=body)
+            return part_number, response['ETag']
+
+        digest = hashlib.sha256()
+        offset, part_number, expected_size = 0, 0, None
+        futures, attempt = [], 0
+
+        with ThreadPoolExecutor(max_workers=self.upload_concurrency) as executor:
+            while True:
+                # Workbooks are zip or OLE2 files: ask for identity encoding so byte counts match Content-Length
+                headers = {'Accept-Encoding': 'identity'}
+                if offset:
+                    headers['Range'] = f'bytes={offset}-'
+                try:
+                    with self.session.get(file_link, headers=headers, stream=True) as response:
+                        response.raise_for_status()
+                        if 'Content-Range' in response.headers:
+                            expected_size = int(response.headers['Content-Range'].rsplit('/', 1)[-1])
+                        elif 'Content-Length' in response.headers:
+                            expected_size = int(response.headers['Content-Length'])
+
+                        # A server ignoring the range sends the whole file again: drop what is already uploaded
+                        skip = offset if response.status_code != 206 else 0
+                        buffer = bytearray()
+                        for chunk in response.iter_content(chunk_size=min(self.part_size, 64 * 1024)):
+                            if skip:
+                                skipped = min(skip, len(chunk))
+                                chunk, skip = chunk[skipped:], skip - skipped
+                            buffer.extend(chunk)
+                            while len(buffer) >= self.part_size:
+                                if upload_id is None:
+                                    start_multipart_upload()
+                                body = bytes(buffer[:self.part_size])
+                                del buffer[:self.part_size]
+                                part_number += 1
+                                offset += len(body)
+                                digest.update(body)
+                                futures.append(executor.submit(upload_part, part_number, body))
+                                # Bound the number of parts held in memory
+                                if len(futures) - sum(f.done() for f in futures) >= self.upload_concurrency:
+                                    next(as_completed([f for f in futures if not f.done()])).result()
+                        # urllib3 1.x does not enforce Content-Length: a connection closed early just ends the body
+                        if expected_size is not None and offset + len(buffer) < expected_size:
+                            raise IOError(f"Connection closed after {offset + len(buffer)} of {expected_size} bytes")
+                    break
+                except (requests.RequestException, IOError) as e:
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        raise
+                    self.logger.warning(f"Transfer of {file_link} interrupted at byte {offset} ({e}), resuming.")
+
+            if expected_size is not None and offset + len(buffer) != expected_size:
+                raise IOError(f"Read {offset + len(buffer)} of {expected_size} bytes from {file_link}")
+
+            offset += len(buffer)
+            digest.update(buffer)
+            sha256 = digest.hexdigest()
+            alias_of = self.claim_content_hash(sha256, Path(destination_key).name)
+            if alias_of is None and upload_id is not None and buffer:
+                part_number += 1
+                futures.append(executor.submit(upload_part, part_number, bytes(buffer)))
+
+            try:
+                parts = [future.result() for future in futures]
+            except ClientError:
+                if alias_of is None:
+                    self._release_content_hash(sha256)
+                raise
+
+        if alias_of is not None:
+            if upload_id is not None:
+                client.abort_multipart_upload(Bucket=bucket_name, Key=destination_key, UploadId=upload_id)
+            self.logger.info(f"{destination_key} has the same content as {alias_of}, recorded as an alias.")
+            return {'size': offset, 'sha256': sha256, 'alias_of': alias_of}
+
+        try:
+            if upload_id is None:
+                # An unfinished upload of a previous run would otherwise linger (and bill) in the bucket
+                stale_id, _ = self.find_multipart_upload(bucket_name, destination_key)
+                if stale_id:
+                    self.logger.info(f"Aborting unfinished upload of {destination_key}: it fits a single PUT.")
+                    client.abort_multipart_upload(Bucket=bucket_name, Key=destination_key, UploadId=stale_id)
+                client.put_object(Bucket=bucket_name, Key=destination_key, Body=bytes(buffer))
+            else:
+                client.complete_multipart_upload(
+                    Bucket=bucket_name, Key=destination_key, UploadId=upload_id,
+                    MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': etag} for number, etag in sorted(parts)]},
+                )
+        except ClientError:
+            self._release_content_hash(sha256)
+            raise
+        return {'size': offset, 'sha256': sha256}
+
+    def fetch_and_upload_file(self, file_link: str, destination_key: str, bucket_name: str = None) -> dict:
+        """
+        Downloads a single file and optionally uploads it to an S3 bucket.
+
+        This method is self-contained so it can run inside a worker thread: each call opens its own
+        streamed request and performs its own upload through the thread-safe `s3_client`, never the shared
+        S3 resource. Errors are logged and reported through the return value.
+
+        Args:
+            file_link (str): The full URL of the file to download.
+            destination_key (str): The S3 key the file is uploaded to.
+            bucket_name (str, optional): The name of the S3 bucket to upload the file to. Defaults to None.
+
+        Returns:
+            dict: The `size`, `sha256` and, for republished content, `alias_of` of the file if it was handled
+                in S3, None otherwise.
+        """
+        try:
+            if bucket_name:
+                return self.upload_stream_to_s3(file_link, bucket_name, destination_key)
+
+            with self.session.get(file_link, stream=True) as result:
+                result.raise_for_status()
+
+        except requests.RequestException as e:
+            self.logger.error(f"Failed to download file from {file_link}: {e}")
+        except ClientError as e:
+            self.logger.error(f"Failed to upload file {destination_key} to S3 bucket {bucket_name}: {e}")
+        except IOError as e:
+            self.logger.error(f"Incomplete download of {file_link}, upload left open to resume: {e}")
+        return None
+
+    def download_files_per_year(self, link: Link, bucket_name: str = None, file_links: List[Link] = None):
         """
         Downloads all files for a specific year and optionally uploads them to an S3 bucket.
 
+        Files are fetched by a pool of `max_workers` threads. New tracker rows are merged in the order
+        the links appear on the year page, regardless of the order in which downloads finish.
+
+        Files whose content is already tracked under another name are recorded with an `alias_of` column
+        pointing to the original instead of being stored again.
+
         Args:
-            link (BeautifulSoup): The BeautifulSoup object representing the year link.
+            link (Link): The year link.
             bucket_name (str, optional): The name of the S3 bucket to upload the files to. Defaults to None.
+            file_links (List[Link], optional): Report links already retrieved for this year. If None,
+                the year page is fetched with `links_per_year`.
         """
-        links_per_year = self.links_per_year(link)
+        links_per_year = file_links if file_links is not None else self.links_per_year(link)
         n = len(links_per_year)
 
         tracker_df = self.load_files_tracker(bucket_name) if bucket_name else pd.DataFrame(columns=['file', 'link', 'date_added'])
-
-        new_files_count = 0
+        tracked_files = set(tracker_df['file'].values)
+
+        pending_files = []
+        for i, file in enumerate(links_per_year):
+            file_name = f'week_{n - i}_{file["href"].split("/")[-1]}'
+            if bucket_name and file_name in tracked_files:
+                continue
+            file_link = self.url_base + file['href']
+            destination_key = f'reports/{link.text.strip()}/{file_name}'
+            pending_files.append((file_name, file_link, destination_key))
+
+        # Files tracked before content hashes are hashed once, the first time new files are compared with them
+        if bucket_name and pending_files and not self._hashes_backfilled:
+            tracker_df = self.backfill_content_hashes(tracker_df, bucket_name)
+            self._hashes_backfilled = True
+        self.content_index = self.build_content_index(tracker_df)
 
         with tqdm(total=n, desc=f"Processing {link['href'][-4:]} files", unit='file') as pbar:
-            for i, file in enumerate(links_per_year):
-                file_name = f'week_{n - i}_{file["href"].split("/")[-1]}'
-                file_link = self.url_base + file['href']
-
-                if bucket_name and file_name in tracker_df['file'].values:
+            pbar.update(n - len(pending_files))
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(self.fetch_and_upload_file, file_link, destination_key, bucket_name)
+                           for _, file_link, destination_key in pending_files]
+                for _ in as_completed(futures):
                     pbar.update(1)
-                    continue
 
-                try:
-                    with requests.get(file_link, headers=self.headers, stream=True) as result:
-                        result.raise_for_status()
-
-                        if bucket_name:
-                            destination_key = f'reports/{link.text.strip()}/{file_name}'
-                            self.s3.Bucket(bucket_name).upload_fileobj(result.raw, destination_key)
-
-                            new_entry = pd.DataFrame({
-                                'file': [file_name],
-                                'link': [file_link],
-                                'date_added': [datetime.datetime.today().strftime('%Y-%m-%d')]
-                            })
-                            tracker_df = pd.concat([tracker_df, new_entry], ignore_index=True)
-                            new_files_count += 1
-
-                except requests.RequestException as e:
-                    self.logger.error(f"Failed to download file from {file_link}: {e}")
-                    continue
-                except ClientError as e:
-                    self.logger.error(f"Failed to upload file {file_name} to S3 bucket {bucket_name}: {e}")
-                    continue
-                finally:
-                    pbar.update(1)
+        # Merge results in page order so the tracker is identical whatever the completion order was
+        date_added = datetime.datetime.today().strftime('%Y-%m-%d')
+        year = link.text.strip()
+        new_entries = [{'file': file_name, 'link': file_link, 'date_added': date_added, 'year': year, **future.result()}
+                       for (file_name, file_link, _), future in zip(pending_files, futures) if future.result()]
+
+        if any(not entry.get('alias_of') for entry in new_entries):
+            self.updated_years.add(year)
 
         if bucket_name:
+            if new_entries:
+                tracker_df = pd.concat([tracker_df, pd.DataFrame(new_entries)], ignore_index=True)
             self.update_files_tracker(tracker_df, bucket_name)
-            self.logger.info(f"Year {link['href'][-4:]} processed: {new_files_count} new files uploaded to S3 bucket {bucket_name}.")
+            limits = self.rate_limiter.stats()
+            aliases = sum(1 for entry in new_entries if entry.get('alias_of'))
+            self.logger.info(f"Year {link['href'][-4:]} processed: {len(new_entries) - aliases} new files uploaded to S3 bucket {bucket_name}, "
+                             f"{aliases} republished files recorded as aliases "
+                             f"(rate {limits['rate']:.2f} req/s, concurrency {limits['concurrency']}, "
+                             f"{limits['backoff_events']} backoff events).")
+
+    def tracked_files_per_year(self, tracker_df: pd.DataFrame) -> dict:
+        """
+        Counts the tracked files of each year.
+
+        The year is read from the `year` column when it was recorded, and otherwise taken from the last four
+        characters of the file name, as done when the files are parsed.
+
+        Args:
+            tracker_df (pd.DataFrame): The files tracker.
+
+        Returns:
+            dict: Number of distinct tracked files keyed by year (as a string).
+        """
+        if tracker_df.empty:
+            return {}
+        tracker_df = tracker_df.drop_duplicates(subset='file')
+        years = tracker_df['file'].astype(str).map(lambda file: Path(file).stem[-4:])
+        if 'year' in tracker_df.columns:
+            recorded_years = pd.to_numeric(tracker_df['year'], errors='coerce')
+            years = recorded_years.map(lambda year: str(int(year)), na_action='ignore').fillna(years)
+        return years.value_counts().to_dict()
+
+    def select_years(self, year_links: List[Link]) -> List[Link]:
+        """
+        Keeps the years that have to be crawled in the current mode.
+
+        Outside incremental mode every year is kept. In incremental mode only the `incremental_years`
+        most recent years are kept, plus any older year that has no tracked file yet (first backfill).
+
+        Args:
+            year_links (List[Link]): The year links returned by `all_years_links`.
+
+        Returns:
+            List[Link]: The year links to crawl.
+        """
+        if not self.incremental:
+            return year_links
+
+        first_open_year = datetime.date.today().year - self.incremental_years + 1
+        selected = [link for link in year_links
+                    if int(link.text.strip()) >= first_open_year or not self.tracked_counts.get(link.text.strip())]
+        self.logger.info(f"Incremental crawl: {len(selected)} of {len(year_links)} years selected.")
+        return selected
+
+    def year_is_up_to_date(self, link: Link, file_links: List[Link]) -> bool:
+        """
+        Checks if the tracker already holds as many files for a year as its page lists.
+
+        Always False outside incremental mode, so every year goes through the download stage.
+
+        Args:
+            link (Link): The year link.
+            file_links (List[Link]): The report links listed on the year page.
+
+        Returns:
+            bool: True if the year can be skipped.
+        """
+        if not self.incremental:
+            return False
+        year = link.text.strip()
+        if len(file_links) == self.tracked_counts.get(year, 0):
+            self.logger.info(f"Year {year} unchanged ({len(file_links)} files tracked), skipping downloads.")
+            return True
+        return False
+
+    async def crawl_year_pages(self, year_links: List[Link], queue: asyncio.Queue):
+        """
+        Fetches all year pages concurrently and pushes their report links into a queue as they arrive.
+
+        Each page is requested on its own thread, so a slow year does not hold back the others. Items are
+        `(year_link, report_links)` tuples in completion order, followed by a final `None` sentinel.
+
+        Args:
+            year_links (List[Link]): The year links returned by `all_years_links`.
+            queue (asyncio.Queue): The queue feeding the download stage.
+        """
+        loop = asyncio.get_running_loop()
+
+        with ThreadPoolExecutor(max_workers=max(1, len(year_links))) as executor:
+            async def fetch_year(link):
+                return link, await loop.run_in_executor(executor, self.links_per_year, link)
+
+            for next_year in asyncio.as_completed([fetch_year(link) for link in year_links]):
+                link, file_links = await next_year
+                await queue.put((link, file_links))
+
+        await queue.put(None)
+
+    async def crawl_and_download(self, bucket_name: str = None):
+        """
+        Runs the concurrent crawler and the download stage as a streaming pipeline.
+
+        Downloads for a year start as soon as its page has been parsed, while the remaining year pages
+        are still being fetched. Years are downloaded one at a time so tracker updates never overlap.
+
+        Args:
+            bucket_name (str, optional): The name of the S3 bucket to upload the files to. Defaults to None.
+        """
+        loop = asyncio.get_running_loop()
+        year_links = self.select_years(await loop.run_in_executor(None, self.all_years_links))
+        queue = asyncio.Queue()
+
+        async def download_stage():
+            while (item := await queue.get()) is not None:
+                link, file_links = item
+                if self.year_is_up_to_date(link, file_links):
+                    continue
+                await loop.run_in_executor(None, self.download_files_per_year, link, bucket_name, file_links)
+
+        await asyncio.gather(self.crawl_year_pages(year_links, queue), download_stage())
 
     def get_files(self, bucket_name: str = None):
         """
         Download all files from all years and optionally upload them to an S3 bucket.
+
+        When a bucket is given, the listing cache is loaded before crawling and saved afterwards so the
+        next run can revalidate unchanged year pages with a single conditional request each.
+
+        In incremental mode only the most recent years are crawled, and a year is downloaded only when
+        its page lists a different number of files than the tracker holds for it.
+
+        The years that received new workbooks are collected in `updated_years`.
         """
-        all_years_links = self.all_years_links()
-        for link in all_years_links:
-            self.download_files_per_year(link, bucket_name)
+        self.updated_years = set()
+        if bucket_name:
+            self.listing_cache = self.load_listing_cache(bucket_name)
+        if self.incremental:
+            self.tracked_counts = self.tracked_files_per_year(self.load_files_tracker(bucket_name)) if bucket_name else {}
+
+        if self.async_crawl:
+            asyncio.run(self.crawl_and_download(bucket_name))
+        elif self.incremental:
+            for link in self.select_years(self.all_years_links()):
+                file_links = self.links_per_year(link)
+                if not self.year_is_up_to_date(link, file_links):
+                    self.download_files_per_year(link, bucket_name, file_links)
+        else:
+            all_years_links = self.all_years_links()
+            for link in all_years_links:
+                self.download_files_per_year(link, bucket_name)
+
+        if bucket_name:
+            self.update_listing_cache(bucket_name)
+
+        stats = self.connection_stats()
+        self.logger.info(f"HTTP session: {stats['requests']} requests over {stats['connections']} connections "
+                         f"({stats['reused']} reused).")
+        limits = self.rate_limiter.stats()
+        self.logger.info(f"Rate limiter: {limits['rate']:.2f} req/s, concurrency {limits['concurrency']}, "
+                         f"peak {limits['peak_in_flight']} in flight, {limits['throttled']} throttled answers, "
+                         f"{limits['backoff_events']} backoff events.")
 
         # Upload log file to S3 after processing
         if bucket_name:
@@ -2,6 +2,7 @@
 import sqlalchemy
 from sqlalchemy import create_engine
 import logging
+from contextlib import nullcontext
 import pandas as pd
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -15,8 +16,14 @@ class DataIngestor:
         logger (logging.Logger): A logger instance to log information, warnings, and errors.
 
     Methods:
-        insert_dataframe_to_db(dataframe: pd.DataFrame, table_name: str) -> None:
+        insert_dataframe_to_db(dataframe: pd.DataFrame, table_name: str, connection=None, source_file=None) -> None:
             Inserts the contents of a DataFrame into a specified PostgreSQL table in chunks.
+
+        delete_rows(table_name: str, connection=None, **criteria) -> int:
+            Deletes the rows of a table matching every given column value.
+
+        ensure_indexed_column(table_name: str, column: str, connection=None):
+            Adds a text column to a table if it is missing, and indexes it.
     """
     def __init__(self, 
                  engine:sqlalchemy.engine.base.Engine,
@@ -30,10 +37,13 @@ class DataIngestor:
         """
         self.engine = engine
         self.logger = logger
+        self._indexed_columns = set()
         
     def insert_dataframe_to_db(self,
                                dataframe: pd.DataFrame, 
-                               table_name: str)-> None:
+                               table_name: str,
+                               connection: sqlalchemy.engine.Connection = None,
+                               source_file: str = None)-> None:
     
         """
         Inserts a DataFrame into a PostgreSQL table. Handles large DataFrames by inserting data in chunks.
@@ -41,6 +51,10 @@ class DataIngestor:
         Args:
             dataframe (pd.DataFrame): The DataFrame to be inserted into the database.
             table_name (str): The name of the PostgreSQL table where the data will be inserted.
+            connection (sqlalchemy.engine.Connection, optional): A connection with an open transaction to insert
+                the rows in, committed by the caller. Defaults to None (the rows are committed on their own).
+            source_file (str, optional): The S3 key of the file the rows come from, stored in the indexed
+                `source_file` column so the rows of a file can be replaced. Defaults to None (not stored).
 
         Returns:
             None
@@ -64,13 +78,20 @@ class DataIngestor:
         """
 
         try:
+            if source_file is not None:
+                dataframe = dataframe.assign(source_file=source_file)
+                self.ensure_indexed_column(table_name, 'source_file', connection=connection)
+
             # Insert data in chunks to handle large DataFrames
             dataframe.to_sql(table_name, 
-                             self.engine, 
+                             connection if connection is not None else self.engine, 
                              if_exists='append', 
                              index=False, 
                              chunksize=500)
 
+            if source_file is not None:
+                self.ensure_indexed_column(table_name, 'source_file', connection=connection)
+
             self.logger.info(f"Data successfully inserted into {table_name}.")
 
         except SQLAlchemyError as e:
@@ -78,5 +99,75 @@ class DataIngestor:
             raise
 
         finally:
-            # Close the connection
-            self.engine.dispose()
+            # Close the connection, unless it belongs to a transaction still in progress
+            if connection is None:
+                self.engine.dispose()
+
+    def delete_rows(self, table_name: str, connection: sqlalchemy.engine.Connection = None, **criteria) -> int:
+        """
+        Deletes the rows of a table matching every given column value.
+
+        Used before loading a workbook again, so rows inserted by a run that stopped before recording the load
+        in the files tracker are replaced rather than duplicated.
+
+        Args:
+            table_name (str): The name of the PostgreSQL table.
+            connection (sqlalchemy.engine.Connection, optional): A connection with an open transaction to delete
+                the rows in, committed by the caller. Defaults to None (the deletion is committed on its own).
+            **criteria: Column names mapped to the values the deleted rows must have.
+
+        Returns:
+            int: The number of deleted rows, 0 when the table or one of the columns does not exist yet.
+
+        Raises:
+            SQLAlchemyError: If an error occurs while deleting the rows.
+        """
+        if not criteria:
+            raise ValueError("delete_rows needs at least one column value.")
+        try:
+            with self.engine.begin() if connection is None else nullcontext(connection) as conn:
+                inspector = sqlalchemy.inspect(conn)
+                if not inspector.has_table(table_name):
+                    return 0
+                if not set(criteria) <= {column['name'] for column in inspector.get_columns(table_name)}:
+                    return 0
+                conditions = ' AND '.join(f'"{column}" = :{column}' for column in criteria)
+                result = conn.execute(sqlalchemy.text(f'DELETE FROM "{table_name}" WHERE {conditions}'), criteria)
+            if result.rowcount:
+                self.logger.info(f"Deleted {result.rowcount} rows of {table_name} matching {criteria}.")
+            return result.rowcount
+
+        except SQLAlchemyError as e:
+            self.logger.error(f"Error deleting data: {e}")
+            raise
+
+    def ensure_indexed_column(self, table_name: str, column: str, connection: sqlalchemy.engine.Connection = None):
+        """
+        Adds a text column to a table if it is missing, and indexes it. Does nothing before the table exists.
+
+        Rows can then be looked up by the column without scanning the table. Outside of a transaction, which could
+        still roll the change back, the table is only inspected once per column.
+
+        Args:
+            table_name (str): The name of the PostgreSQL table.
+            column (str): The name of the column.
+            connection (sqlalchemy.engine.Connection, optional): A connection with an open transaction to alter
+                the table in, committed by the caller. Defaults to None (the change is committed on its own).
+
+        Raises:
+            SQLAlchemyError: If an error occurs while altering the table.
+        """
+        if (table_name, column) in self._indexed_columns:
+            return
+        with self.engine.begin() if connection is None else nullcontext(connection) as conn:
+            inspector = sqlalchemy.inspect(conn)
+            if not inspector.has_table(table_name):
+                return
+            table, quoted_column = f'"{table_name}"', f'"{column}"'
+            if column not in {existing['name'] for existing in inspector.get_columns(table_name)}:
+                conn.execute(sqlalchemy.text(f'ALTER TABLE {table} ADD COLUMN {quoted_column} TEXT'))
+                self.logger.info(f"Added column {column} to {table_name}.")
+            conn.execute(sqlalchemy.text(
+                f'CREATE INDEX IF NOT EXISTS "ix_{table_name}_{column}" ON {table} ({quoted_column})'))
+        if connection is None:
+            self._indexed_columns.add((table_name, column))
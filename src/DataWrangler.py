@@ -3,11 +3,20 @@
 import pandas as pd
 # from FileNameBuilder import FileNameBuilder
 from src.FileNameBuilder import FileNameBuilder
+from src.MirrorCache import MirrorCache
+from src.FormatDetector import FormatDetector, WorkbookSignature
+from src.WorkbookSession import WorkbookSession, excel_engines, workbook_stream
 from config import CATEGORIES_DICT, CITY_TO_REGION
+from typing import Iterable, Iterator, List, Tuple
 import boto3
 import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from logging.handlers import QueueHandler
 from pathlib import Path
-from io import BytesIO
 from tqdm import tqdm
 import re
 import numpy as np
@@ -26,18 +35,38 @@ class DataWrangler(FileNameBuilder):
         logger (logging.Logger): Logger instance for logging messages.
         categories_dict (dict): A dictionary mapping category indices to category names.
         city_to_region (dict): A dictionary mapping city names to their respective regions.
+        mirror_cache (MirrorCache): Local mirror of the workbooks read from S3, None when disabled.
+        format_detector (FormatDetector): Fingerprints the template of the workbooks, cached per ETag.
+        excel_engine (str): Excel reader, 'calamine' or 'standard' (openpyxl for xlsx, xlrd for xls files).
+        parse_workers (int): Number of processes parsing workbooks, 1 parses them in this process.
 
     Methods:
-        __init__(bucket_name: str, s3: boto3.resource, logger: logging.Logger):
+        __init__(bucket_name: str, s3: boto3.resource, logger: logging.Logger, cache_dir: str = None,
+                 cache_max_bytes: int = 2 * 1024 ** 3, excel_engine: str = 'standard', parse_workers: int = 1):
             Initializes the DataWrangler class with S3 resource, bucket name, and logger.
 
+        read_workbook(file_path: str):
+            Reads the raw content of a workbook, through the local mirror cache when it is enabled.
+
+        excel_engines(data: bytes) -> Tuple[str, ...]:
+            Returns the pandas engines able to read a workbook, chosen from its magic bytes.
+
+        workbook_signature(file_path: str, default_format: int = None) -> WorkbookSignature:
+            Returns the template of a workbook, detected from its sheet names and header cells.
+
+        parse_workbook(file_path: str, signature: WorkbookSignature = None) -> pd.DataFrame:
+            Extracts and transforms a workbook with the parser of its detected format.
+
+        parse_workbooks(jobs: Iterable[Tuple[str, int]]) -> Iterator[Tuple[str, WorkbookSignature, pd.DataFrame]]:
+            Parses workbooks in order, in a pool of processes when parse_workers is more than one.
+
         first_format_data_extraction(file_path: str) -> pd.DataFrame:
             Extracts and processes data from an Excel file stored in an S3 bucket using the first format.
 
         first_format_data_transformation(dataframe: pd.DataFrame, file_path: str) -> pd.DataFrame:
             Transforms the raw data extracted from a file into a structured format with relevant categories and products.
 
-        second_format_data_extraction(file_path: str) -> pd.DataFrame:
+        second_format_data_extraction(file_path: str, signature: WorkbookSignature = None) -> pd.DataFrame:
             Extracts and processes data from an Excel file stored in an S3 bucket using multiple sheets for the second format.
 
         building_complete_report() -> pd.DataFrame:
@@ -46,7 +75,11 @@ class DataWrangler(FileNameBuilder):
     def __init__(self, 
                  bucket_name: str, 
                  s3: boto3.resource, 
-                 logger:logging.Logger):
+                 logger:logging.Logger,
+                 cache_dir: str = None,
+                 cache_max_bytes: int = 2 * 1024 ** 3,
+                 excel_engine: str = 'standard',
+                 parse_workers: int = 1):
         """
         Initializes the DataWrangler class with S3 resource, bucket name, and logger.
 
@@ -54,6 +87,13 @@ class DataWrangler(FileNameBuilder):
             bucket_name (str): The name of the S3 bucket to interact with.
             s3 (boto3.resource): An S3 resource object to interact with AWS S3.
             logger (logging.Logger): Logger instance for logging messages.
+            cache_dir (str, optional): Directory of the local mirror of the workbooks. Defaults to None (no mirror,
+                every workbook is read from S3).
+            cache_max_bytes (int, optional): Maximum size in bytes of the local mirror. Defaults to 2 GiB.
+            excel_engine (str, optional): Excel reader, 'calamine' (Rust-backed, requires python-calamine) or
+                'standard' (openpyxl for xlsx, xlrd for xls files). Defaults to 'standard'.
+            parse_workers (int, optional): Number of processes parsing workbooks in parse_workbooks, None for one
+                per available CPU. More than one is experimental. Defaults to 1 (parsed in this process).
         """
         FileNameBuilder.__init__(self, s3, logger)
         self.bucket_name = bucket_name
@@ -61,7 +101,186 @@ class DataWrangler(FileNameBuilder):
         self.logger = logger
         self.categories_dict = CATEGORIES_DICT
         self.city_to_region = CITY_TO_REGION
-        
+        self.mirror_cache = MirrorCache(s3, logger, cache_dir, cache_max_bytes) if cache_dir else None
+        self.format_detector = FormatDetector(logger)
+        self._workbook_memo = None
+        self._job_etags = {}  # ETags handed over with the workbooks parsed by a parse worker, which lists no bucket
+        excel_engines('unknown', excel_engine)  # Fail early on an unknown or missing engine
+        self.excel_engine = excel_engine
+        # The CPUs this process may run on, fewer than the host's in a container limited to some cores
+        cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+        self.parse_workers = parse_workers or cpus
+
+    def read_workbook(self, file_path: str):
+        """
+        Reads the raw content of a workbook, through the local mirror cache when it is enabled.
+
+        Args:
+            file_path (str): The path of the file in the S3 bucket.
+
+        Returns:
+            bytes: The content of the workbook, or a read-only memory map of it when served by the mirror cache.
+        """
+        # A workbook read to detect its format is parsed right after, without reading it again
+        if self._workbook_memo is not None and self._workbook_memo[0] == file_path:
+            data = self._workbook_memo[1]
+            self._workbook_memo = None
+            return data
+        if self.mirror_cache is not None:
+            # The ETag from the bucket listing spares a HEAD request per workbook
+            return self.mirror_cache.open(self.bucket_name, file_path, self._listed_etag(file_path))
+        bucket = self.s3.Bucket(self.bucket_name)
+        obj = bucket.Object(file_path)
+        return obj.get()['Body'].read()
+
+    def excel_engines(self, data: bytes) -> Tuple[str, ...]:
+        """
+        Returns the pandas engines able to read a workbook, chosen from its magic bytes (ZIP or OLE2).
+
+        Args:
+            data (bytes): The content of the workbook.
+
+        Returns:
+            Tuple[str, ...]: The names of the engines, in the order to try them.
+        """
+        return excel_engines(self.format_detector.container(data), self.excel_engine)
+
+    def workbook_signature(self, file_path: str, default_format: int = None) -> WorkbookSignature:
+        """
+        Returns the template of a workbook, detected from its sheet names and header cells.
+
+        Signatures are cached per ETag of the listed workbook, in memory and in the manifest of the bucket, so a
+        version already fingerprinted, by this run or an earlier one, is routed without being read. Otherwise the
+        workbook is read once, and kept for the parser that follows.
+
+        Args:
+            file_path (str): The path of the file in the S3 bucket.
+            default_format (int, optional): The format assumed when the template is not recognised, e.g. the
+                one given by the path of the file. Defaults to None.
+
+        Returns:
+            WorkbookSignature: The template of the workbook.
+        """
+        etag = self._listed_etag(file_path)
+        signature = self._known_signature(file_path, etag)
+        if signature is None:
+            try:
+                data = self.read_workbook(file_path)
+                self._workbook_memo = (file_path, data)
+                signature = self.format_detector.detect(data, etag)
+                self._store_signature(file_path, etag)
+            except Exception as e:
+                self.logger.warning(f"Failed to detect the format of {file_path}: {e}")
+                signature = WorkbookSignature(None, 'unknown', 'unknown', (), ())
+        if signature.file_format is None and default_format is not None:
+            self.logger.warning(f"Unrecognised template for {file_path}, parsing it as format {default_format}.")
+            signature = signature._replace(file_format=default_format)
+        elif default_format is not None and signature.file_format != default_format:
+            self.logger.info(f"{Path(file_path).name} has the format {signature.file_format} template "
+                             f"({signature.layout}), not the one expected from its path.")
+        return signature
+
+    def parse_workbook(self, file_path: str, signature: WorkbookSignature = None) -> pd.DataFrame:
+        """
+        Extracts and transforms a workbook with the parser of its detected format.
+
+        Args:
+            file_path (str): The path of the file in the S3 bucket.
+            signature (WorkbookSignature, optional): The template of the workbook, detected if not given.
+
+        Returns:
+            pd.DataFrame: The transformed data, or an empty DataFrame if the workbook holds none.
+        """
+        if signature is None:
+            signature = self.workbook_signature(file_path)
+        if signature.file_format == 1:
+            dataframe = self.first_format_data_extraction(file_path)
+            return self.first_format_data_transformation(dataframe, file_path) if not dataframe.empty else dataframe
+        if signature.file_format == 2:
+            return self.second_format_data_extraction(file_path, signature)
+        self.logger.error(f"Skipping {file_path}: its workbook template is not recognised.")
+        return pd.DataFrame()
+
+    def parse_workbooks(self, jobs: Iterable[Tuple[str, int]]) -> Iterator[Tuple[str, WorkbookSignature, pd.DataFrame]]:
+        """
+        Parses workbooks with the parser of their template, in the order of the jobs.
+
+        With more than one parse worker, the jobs are farmed out to a pool of processes. This is experimental:
+        the pool has not been measured on several cores yet, and the cost of starting the workers and shipping
+        workbooks and results between processes may outweigh the parsing it spreads out. The workbooks are read here (from S3 or the mirror cache) while the workers
+        detect their template and parse the ones read before. A worker sends its DataFrame back as a compact
+        columnar batch, and the results are yielded in the order of the jobs whatever order they finish in.
+        At most two jobs per worker are in flight, so the jobs can be produced lazily, e.g. checked against the
+        files tracker right before they are parsed. Worker log records are handled by this wrangler's logger.
+
+        Args:
+            jobs (Iterable[Tuple[str, int]]): The path of each workbook in the S3 bucket, and the format assumed
+                when its template is not recognised (None to skip unrecognised workbooks).
+
+        Yields:
+            Tuple[str, WorkbookSignature, pd.DataFrame]: The path, the template and the parsed data of each workbook.
+        """
+        if self.parse_workers <= 1:
+            for file_path, default_format in jobs:
+                signature = self.workbook_signature(file_path, default_format=default_format)
+                yield file_path, signature, self.parse_workbook(file_path, signature)
+            return
+
+        context = multiprocessing.get_context('spawn')
+        records = context.Queue()
+        forwarder = threading.Thread(target=_forward_records, args=(records, self.logger), daemon=True)
+        forwarder.start()
+        executor = ProcessPoolExecutor(self.parse_workers, mp_context=context, initializer=_init_parse_worker,
+                                       initargs=(records, self.logger.name, self.logger.getEffectiveLevel(),
+                                                 self.excel_engine))
+        pending = deque()
+        try:
+            for file_path, default_format in jobs:
+                etag = self._listed_etag(file_path)
+                data = bytes(self.read_workbook(file_path))
+                future = executor.submit(_parse_workbook_job, file_path, default_format, etag,
+                                         self._known_signature(file_path, etag), data)
+                pending.append((file_path, etag, future))
+                if len(pending) >= 2 * self.parse_workers:
+                    yield self._parsed(*pending.popleft())
+            while pending:
+                yield self._parsed(*pending.popleft())
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            records.put(None)
+            forwarder.join()
+
+    def _parsed(self, file_path: str, etag: str, future: Future) -> Tuple[str, WorkbookSignature, pd.DataFrame]:
+        detected, signature, batch = future.result()
+        # Templates detected by the workers are cached here, so the next runs route the workbooks without reading them
+        if detected is not None:
+            self.format_detector.remember(etag, detected)
+            self._store_signature(file_path, etag)
+        return file_path, signature, _from_columnar(batch)
+
+    def _listed_etag(self, file_path: str) -> str:
+        inventory = self.inventories.get(self.bucket_name)
+        return inventory.etag(file_path) if inventory is not None else self._job_etags.get(file_path)
+
+    def _known_signature(self, file_path: str, etag: str) -> WorkbookSignature:
+        # Signatures stored in the manifest by earlier runs are cached in the detector when first looked up
+        signature = self.format_detector.cached(etag)
+        inventory = self.inventories.get(self.bucket_name)
+        if signature is None and inventory is not None:
+            stored = inventory.signature(file_path)
+            if stored is not None:
+                signature = WorkbookSignature(**{**stored, 'sheet_names': tuple(stored['sheet_names']),
+                                                 'header': tuple(stored['header'])})
+                self.format_detector.remember(etag, signature)
+        return signature
+
+    def _store_signature(self, file_path: str, etag: str):
+        # Only signatures the detector cached are stored, not workbooks whose structure could not be read
+        signature = self.format_detector.cached(etag)
+        inventory = self.inventories.get(self.bucket_name)
+        if signature is not None and inventory is not None:
+            inventory.set_signature(file_path, signature._asdict())
+
     def first_format_data_extraction(self, file_path: str) -> pd.DataFrame:
         """
         Extracts and processes data from an Excel file stored in an S3 bucket using the first format.
@@ -71,25 +290,26 @@ class DataWrangler(FileNameBuilder):
 
         Args:
             file_path (str): The path of the file in the S3 bucket.
+            signature (WorkbookSignature, optional): The template of the workbook, as detected when it was routed
+                to this parser. Detected from the workbook if not given.
 
         Returns:
             pd.DataFrame: A DataFrame containing the extracted data, or an empty DataFrame if extraction fails.
         """
-        bucket = self.s3.Bucket(self.bucket_name)
-        obj = bucket.Object(file_path)
-        xls_data = obj.get()['Body'].read()
+        xls_data = self.read_workbook(file_path)
 
+        # The reader is chosen from the file signature, the next one is only tried if it fails
         dataframe = None
-        try:
-            dataframe = pd.read_excel(BytesIO(xls_data), engine='openpyxl')
-        except Exception as e:
-            self.logger.debug(f"openpyxl failed for {file_path}: {e}")
-        if dataframe is None:
+        engines = self.excel_engines(xls_data)
+        for engine in engines:
             try:
-                dataframe = pd.read_excel(BytesIO(xls_data), engine='xlrd')
+                dataframe = pd.read_excel(workbook_stream(xls_data), engine=engine)
+                break
             except Exception as e:
-                self.logger.error(f"Failed to read Excel file {file_path} with xlrd: {e}")
-                return pd.DataFrame()  # Return empty DataFrame if reading fails
+                self.logger.debug(f"{engine} failed for {file_path}: {e}")
+        if dataframe is None:
+            self.logger.error(f"Failed to read Excel file {file_path} with any of the engines {list(engines)}")
+            return pd.DataFrame()  # Return empty DataFrame if reading fails
 
         if dataframe.empty:
             self.logger.warning(f"No data found in {file_path}")
@@ -105,6 +325,9 @@ class DataWrangler(FileNameBuilder):
         Transforms the raw data extracted from a file into a structured format with relevant categories and products.
 
         This method processes the extracted data by renaming columns, identifying product categories, and cleaning city names.
+        Category and product blocks are labelled over the whole sheet at once (product blocks by a cumulative sum
+        of the product name rows), so the time grows linearly with the size of the sheet. When a malformed category
+        block fails the sheet, the categories are transformed one at a time and only that block is logged and skipped.
         It returns a structured DataFrame containing the transformed data.
 
         Args:
@@ -129,66 +352,34 @@ class DataWrangler(FileNameBuilder):
             self.logger.warning(f"No 'cuadro' titles found in {file_path}")
             return pd.DataFrame()  # Return empty DataFrame if no categories found
 
-        # Create target dataframe for all data
-        df_final = pd.DataFrame()
-
-        # Iterate over food categories
+        # Segment the food categories: the table before the first 'cuadro' title, then the table following each
+        # title, past its header row. Titles are located by their row label, used as a position.
+        blocks = []
         for i_categoria in range(len(index_cuadro) + 1):
-            try:
-                if i_categoria == 0:
-                    dataframe_categoria = dataframe.iloc[1:index_cuadro[i_categoria]]
-                elif i_categoria <= 6:
-                    dataframe_categoria = dataframe.iloc[index_cuadro[i_categoria - 1] + 2:index_cuadro[i_categoria]]
-                else:
-                    dataframe_categoria = dataframe.iloc[index_cuadro[i_categoria - 1] + 2:]
-
-                # Add category name
-                dataframe_categoria = dataframe_categoria.copy()
-                dataframe_categoria['categoria'] = self.categories_dict.get(i_categoria + 1, 'unknown')
-
-                # Identify products within category
-                index_producto = dataframe_categoria[dataframe_categoria['precio_minimo'].isnull()].index.tolist()
-                if not index_producto:
-                    continue
-
-                df_categoria_final = pd.DataFrame()
-
-                for i_producto in range(len(index_producto)):
-                    if i_producto < len(index_producto) - 1:
-                        start_idx = index_producto[i_producto]
-                        end_idx = index_producto[i_producto + 1]
-                    else:
-                        start_idx = index_producto[i_producto]
-                        end_idx = None
+            if i_categoria == 0:
+                blocks.append((i_categoria, 1, index_cuadro[0]))
+            elif i_categoria > 6:
+                blocks.append((i_categoria, index_cuadro[i_categoria - 1] + 2, len(dataframe)))
+            elif i_categoria < len(index_cuadro):
+                blocks.append((i_categoria, index_cuadro[i_categoria - 1] + 2, index_cuadro[i_categoria]))
+            # The table after the last title is only read from the seventh title on
 
-                    dataframe_producto = dataframe_categoria.loc[start_idx:end_idx].reset_index(drop=True)
-
-                    # Add product name
-                    producto_name = dataframe_producto.at[0, 'ciudad']
-                    dataframe_producto['producto'] = producto_name
-
-                    # Clean city names
-                    dataframe_producto['ciudad'] = dataframe_producto['ciudad'].str.replace(r'\s*\([^)]*\)', '', regex=True)
-
-                    # Extract marketplace if present
-                    dataframe_producto['mercado'] = dataframe_producto['ciudad'].str.extract(r',\s*(.*)')[0]
-                    dataframe_producto['ciudad'] = dataframe_producto['ciudad'].str.split(',').str[0].str.strip()
-                    dataframe_producto = dataframe_producto[~dataframe_producto['precio_medio'].isnull()]
-                    
-                    # Drop first row (product name)
-                    dataframe_producto = dataframe_producto.iloc[1:].reset_index(drop=True)
-
-                    df_categoria_final = pd.concat([df_categoria_final, dataframe_producto], ignore_index=True)
-
-                df_final = pd.concat([df_final, df_categoria_final], ignore_index=True)
-
-            except Exception as e:
-                self.logger.error(f"Error processing category {i_categoria} in file {file_path}: {e}")
-                continue
+        try:
+            df_final = self._first_format_categories(dataframe, blocks)
+        except Exception:
+            # A malformed category fails the whole sheet: transform the categories one at a time to skip only it
+            frames = []
+            for block in blocks:
+                try:
+                    frames.append(self._first_format_categories(dataframe, [block]))
+                except Exception as e:
+                    self.logger.error(f"Error processing category {block[0]} in file {file_path}: {e}")
+            frames = [frame for frame in frames if not frame.empty]
+            df_final = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
         if df_final.empty:
             self.logger.warning(f"No data extracted from {file_path} after transformation.")
-            return df_final
+            return pd.DataFrame()  # Without columns, as when no category holds a product
 
         # Add timestamps
         try:
@@ -208,41 +399,83 @@ class DataWrangler(FileNameBuilder):
         
         return df_final
 
-    def second_format_data_extraction(self, file_path: str) -> pd.DataFrame:
+    def _first_format_categories(self, dataframe: pd.DataFrame, blocks: List[Tuple[int, int, int]]) -> pd.DataFrame:
+        # Blocks are (category, start, stop) positions of the sheet, labelled over all the blocks at once
+        n_rows = len(dataframe)
+        positions, segments, categories = [], [], []
+        for i_categoria, start, stop in blocks:
+            block = np.arange(start, min(stop, n_rows))
+            positions.append(block)
+            segments.append(np.full(len(block), i_categoria))
+            categories.append(np.full(len(block), self.categories_dict.get(i_categoria + 1, 'unknown'), dtype=object))
+
+        rows = dataframe.iloc[np.concatenate(positions)].reset_index(drop=True)
+        rows['categoria'] = np.concatenate(categories)
+        rows['segment'] = np.concatenate(segments)
+        rows['position'] = np.arange(len(rows))
+
+        # A product starts at each row without minimum price and runs up to the next one, which is included too
+        is_product = rows['precio_minimo'].isnull()
+        rows['product_id'] = is_product.groupby(rows['segment']).cumsum()
+        rows['own_header'] = is_product
+        next_headers = rows[is_product & (rows['product_id'] > 1)].assign(own_header=False)
+        next_headers['product_id'] -= 1
+        rows = pd.concat([rows, next_headers], ignore_index=True)
+        rows = rows[rows['product_id'] > 0].sort_values(['segment', 'product_id', 'position'], kind='stable')
+
+        # Add product name, from the first row of each product
+        groups = [rows['segment'], rows['product_id']]
+        rows['producto'] = rows['ciudad'].where(rows['own_header']).groupby(groups).ffill()
+
+        # Clean city names and extract the marketplace when present
+        rows['ciudad'] = rows['ciudad'].str.replace(r'\s*\([^)]*\)', '', regex=True)
+        rows['mercado'] = rows['ciudad'].str.extract(r',\s*(.*)')[0]
+        rows['ciudad'] = rows['ciudad'].str.split(',').str[0].str.strip()
+
+        # Drop the first priced row of each product, as the product name row used to be
+        rows = rows[~rows['precio_medio'].isnull()]
+        rows = rows[rows.groupby(['segment', 'product_id']).cumcount() > 0]
+        return rows.drop(columns=['segment', 'position', 'product_id', 'own_header']).reset_index(drop=True)
+
+    def second_format_data_extraction(self, file_path: str, signature: WorkbookSignature = None) -> pd.DataFrame:
         """
         Extracts and processes data from an Excel file stored in an S3 bucket using multiple sheets for the second format.
 
         This method reads Excel files stored in an S3 bucket, handling different file formats and sheets. 
+        The workbook is parsed once, and its eight food class sheets are read from it one at a time.
         It returns a structured DataFrame containing the extracted data.
 
         Args:
             file_path (str): The path of the file in the S3 bucket.
+            signature (WorkbookSignature, optional): The template of the workbook, as detected when it was routed
+                to this parser. Detected from the workbook if not given.
 
         Returns:
             pd.DataFrame: A DataFrame containing the extracted data, or an empty DataFrame if extraction fails.
         """
-        bucket = self.s3.Bucket(self.bucket_name)
-        obj = bucket.Object(file_path)
-        xls_data = obj.get()['Body'].read()
+        xls_data = self.read_workbook(file_path)
 
-        xl = None
+        # The workbook is parsed once, its sheets are read from it one at a time
         try:
-            xl = pd.ExcelFile(BytesIO(xls_data), engine='openpyxl')
-        except Exception as e:
-            self.logger.debug(f"openpyxl failed for {file_path}: {e}")
-        if xl is None:
-            try:
-                xl = pd.ExcelFile(BytesIO(xls_data), engine='xlrd')
-            except Exception as e:
-                self.logger.error(f"Failed to read Excel file {file_path} with xlrd: {e}")
-                return pd.DataFrame()
+            session = WorkbookSession(xls_data, self.logger, file_path, engines=self.excel_engines(xls_data))
+        except ValueError as e:
+            self.logger.error(f"Failed to read Excel file {file_path}: {e}")
+            return pd.DataFrame()
+        with session:
+            return self._second_format_sheets(session, xls_data, file_path, signature)
 
-        full_dataframe = pd.DataFrame()
+    def _second_format_sheets(self, session: WorkbookSession, xls_data: bytes, file_path: str,
+                              signature: WorkbookSignature = None) -> pd.DataFrame:
+        # The template decides how the sheets are laid out, instead of checking for specific file names
+        if signature is None:
+            signature = self.format_detector.detect(xls_data, self._listed_etag(file_path))
+
+        sheets = []
         for index in range(1, 9):
-            sheet_name = xl.sheet_names[index]
+            sheet_name = session.sheet_names[index]
             dataframe = None
             try:
-                dataframe = pd.read_excel(BytesIO(xls_data), sheet_name=sheet_name)
+                dataframe = session.sheet(sheet_name)
             except Exception as e:
                 self.logger.error(f"Failed to read sheet {sheet_name} in {file_path}: {e}")
                 continue
@@ -251,10 +484,12 @@ class DataWrangler(FileNameBuilder):
                 self.logger.warning(f"No data found in sheet {sheet_name} of {file_path}")
                 continue
 
-            if file_path == 'reports/2018/week_20_Sem_12may__18may_2018.xlsx':
-                dataframe['mercado'] = dataframe['Mercado mayorista'].str.split(',').str[1].str.strip()
-                dataframe['ciudad'] = dataframe['Mercado mayorista'].str.split(',').str[0].str.strip()
-                dataframe.columns = dataframe.columns.str.lower().str.replace(' ','_').str.replace('í','i').str.replace('á','a')
+            if signature.layout == 'market_column':
+                # The header is matched as the detector does, whatever the case and spacing of the workbook
+                dataframe.columns = (dataframe.columns.astype(str).str.strip().str.lower().str.replace(' ','_')
+                                     .str.replace('í','i').str.replace('á','a'))
+                dataframe['mercado'] = dataframe['mercado_mayorista'].str.split(',').str[1].str.strip()
+                dataframe['ciudad'] = dataframe['mercado_mayorista'].str.split(',').str[0].str.strip()
             else:
 
                 if pd.isnull(dataframe.iloc[9, 0]):
@@ -287,9 +522,10 @@ class DataWrangler(FileNameBuilder):
             dataframe['anho'] = Path(file_path).stem[-4:]
           
 
-            # Add to full_dataframe
-            full_dataframe = pd.concat([full_dataframe, dataframe], ignore_index=True)
+            sheets.append(dataframe)
 
+        # One concatenation once every sheet is read
+        full_dataframe = pd.concat(sheets, ignore_index=True) if sheets else pd.DataFrame()
         if full_dataframe.empty:
             self.logger.warning(f"No data extracted from {file_path} after processing all sheets.")
             return full_dataframe
@@ -312,20 +548,79 @@ class DataWrangler(FileNameBuilder):
         first_format_paths_aws = self.first_format_paths(bucket_name=self.bucket_name)
         second_format_paths_aws = self.second_format_paths(bucket_name=self.bucket_name)
 
-        first_format_final = pd.DataFrame()
-        self.logger.info('[INFO] First batch of files')
-
-        for file_path in tqdm(first_format_paths_aws):
-            dataframe = self.first_format_data_extraction(file_path)
-            if not dataframe.empty:
-                transformed_df = self.first_format_data_transformation(dataframe, file_path)
-                first_format_final = pd.concat([first_format_final, transformed_df], ignore_index=True)
+        # Each workbook is parsed as its template requires, the path only decides when it is not recognised
+        jobs = [(file_path, 1) for file_path in first_format_paths_aws] + \
+               [(file_path, 2) for file_path in second_format_paths_aws]
+        self.logger.info(f'[INFO] Parsing {len(first_format_paths_aws)} first format and '
+                         f'{len(second_format_paths_aws)} second format files')
 
-        self.logger.info('[INFO] Second batch of files')
-        second_format_final = pd.DataFrame()
-        for file_path in tqdm(second_format_paths_aws):
-            dataframe = self.second_format_data_extraction(file_path)
-            second_format_final = pd.concat([second_format_final, dataframe], ignore_index=True)
+        # The frames of every workbook are concatenated once, instead of copying the report for each workbook
+        frames = [dataframe for _, _, dataframe in tqdm(self.parse_workbooks(jobs), total=len(jobs))]
 
-        complete_report = pd.concat([first_format_final, second_format_final], ignore_index=True)
+        complete_report = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
         return complete_report
+
+
+# The wrangler of a parse worker process, created by the pool initializer and reused for every job
+_parse_worker = None
+
+
+def _init_parse_worker(records, logger_name: str, level: int, excel_engine: str):
+    global _parse_worker
+    logger = logging.getLogger(logger_name)
+    logger.handlers = [QueueHandler(records)]
+    logger.setLevel(level)
+    logger.propagate = False
+    _parse_worker = DataWrangler(bucket_name=None, s3=None, logger=logger, excel_engine=excel_engine)
+
+
+def _parse_workbook_job(file_path: str, default_format: int, etag: str, cached: WorkbookSignature,
+                        data: bytes) -> tuple:
+    # Runs in a parse worker: the template is detected unless the parent had it cached, then the workbook parsed
+    wrangler = _parse_worker
+    wrangler._job_etags = {file_path: etag} if etag is not None else {}
+    if cached is not None:
+        wrangler.format_detector.remember(etag, cached)
+    wrangler._workbook_memo = (file_path, data)
+    try:
+        signature = wrangler.workbook_signature(file_path, default_format=default_format)
+        dataframe = wrangler.parse_workbook(file_path, signature)
+    finally:
+        wrangler._workbook_memo = None
+        wrangler._job_etags = {}
+    detected = wrangler.format_detector.cached(etag) if cached is None else None
+    return detected, signature, _to_columnar(dataframe)
+
+
+def _forward_records(records, logger: logging.Logger):
+    for record in iter(records.get, None):
+        logger.handle(record)
+
+
+def _to_columnar(dataframe: pd.DataFrame) -> dict:
+    # String columns are dictionary encoded: each city, product or category name is pickled once, with an integer
+    # code per row. Missing values are kept as they are, other columns are sent as their arrays.
+    data = []
+    for _, series in dataframe.items():
+        if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == 'string':
+            codes, uniques = pd.factorize(series.to_numpy())
+            data.append(('codes', codes.astype(np.int32), uniques, series.to_numpy()[codes < 0]))
+        else:
+            data.append(('values', series.array))
+    return {'index': dataframe.index, 'columns': dataframe.columns, 'data': data}
+
+
+def _from_columnar(batch: dict) -> pd.DataFrame:
+    arrays = {}
+    for position, column in enumerate(batch['data']):
+        if column[0] == 'codes':
+            _, codes, uniques, missing = column
+            values = np.empty(len(codes), dtype=object)
+            values[codes >= 0] = uniques[codes[codes >= 0]]
+            values[codes < 0] = missing
+            arrays[position] = values
+        else:
+            arrays[position] = column[1]
+    dataframe = pd.DataFrame(arrays, index=batch['index'])
+    dataframe.columns = batch['columns']
+    return dataframe
@@ -1,8 +1,9 @@
 
-from typing import List
+from typing import Iterable, List
 import boto3
 import logging
-from pathlib import Path
+from src.BucketInventory import BucketInventory
+from src.Manifest import Manifest
 
 class FileNameBuilder:
     """
@@ -15,14 +16,21 @@ class FileNameBuilder:
     DANE first format refers to a single tab file with information displayed with several titles through it
     DANE second format refers to a file containing several tabs (per food class)
 
+    The format given by the path is only a default: the processing workflow routes each workbook to the parser
+    of the template detected in it (see FormatDetector).
+
     Attributes:
         s3 (boto3.resource): An S3 resource object to interact with AWS S3.
         logger (logging.Logger): Logger instance for logging messages.
+        inventories (dict): The cached BucketInventory of each bucket listed so far.
 
     Methods:
         __init__(s3: boto3.resource, logger: logging.Logger):
             Initializes the FileNameBuilder class with the provided S3 resource and logger.
 
+        bucket_inventory(bucket_name: str, refresh: bool = False, years: Iterable[str] = None) -> BucketInventory:
+            Returns the cached inventory of a bucket, updating it on first use or when asked to refresh.
+
         first_format_paths(bucket_name: str) -> List[str]:
             Retrieves file paths from the S3 bucket that match the first format criteria.
 
@@ -41,13 +49,39 @@ class FileNameBuilder:
         """
         self.s3 = s3
         self.logger = logger
+        self.inventories = {}
+
+    def bucket_inventory(self, bucket_name: str, refresh: bool = False, years: Iterable[str] = None) -> BucketInventory:
+        """
+        Returns the cached inventory of a bucket, updating it on first use or when asked to refresh.
+
+        The inventory is persisted in the bucket manifest, which is updated incrementally: with `years`,
+        only those year prefixes are listed again and the rest of the inventory is read from the manifest.
+
+        Args:
+            bucket_name (str): The name of the S3 bucket containing the files.
+            refresh (bool, optional): Update the inventory again, e.g. after new files were uploaded. Defaults to False.
+            years (Iterable[str], optional): The only years that may have changed since the manifest was last
+                updated. Defaults to None (list every year).
+
+        Returns:
+            BucketInventory: The inventory of the workbooks stored in the bucket.
+        """
+        inventory = self.inventories.get(bucket_name)
+        if inventory is None:
+            manifest = Manifest(self.s3, self.logger, bucket_name)
+            inventory = self.inventories[bucket_name] = BucketInventory(self.s3, self.logger, bucket_name,
+                                                                        manifest=manifest)
+        if refresh or not inventory.loaded:
+            inventory.refresh(years)
+        return inventory
 
     def first_format_paths(self, bucket_name: str) -> List[str]:
         """
         Retrieves file paths from the S3 bucket that match the first format criteria.
 
-        The first format includes files from the years 2012 to 2017, and files from the year 2018 up to 
-        and including week 19. It filters files based on their extensions (.xls, .xlsx).
+        The first format includes files up to 2017, and files from the year 2018 up to and including
+        week 19. Paths are read from the cached bucket inventory.
 
         Args:
             bucket_name (str): The name of the S3 bucket containing the files.
@@ -56,31 +90,7 @@ class FileNameBuilder:
             List[str]: A list of file paths matching the first format criteria.
         """
         self.logger.info(f"Fetching first format paths from bucket: {bucket_name}")
-        bucket = self.s3.Bucket(bucket_name)
-        object_names = [obj.key for obj in bucket.objects.all() if obj.key.endswith(('.xls', '.xlsx'))]
-
-        first_format_years = {'2012', '2013', '2014', '2015', '2016', '2017'}
-        final_files_paths_first = []
-
-        for path in object_names:
-            try:
-                parts = Path(path).parts
-                if len(parts) < 2:
-                    continue
-                year = parts[1]
-                week = int(Path(path).stem.split('_')[1])
-
-                # Check for files in years prior to 2018
-                if year in first_format_years:
-                    final_files_paths_first.append(path)
-                    self.logger.debug(f"File added to first format: {path}")
-                elif year == '2018' and week <= 19:
-                    final_files_paths_first.append(path)
-                    self.logger.debug(f"File added to first format: {path}")
-
-            except (IndexError, ValueError) as e:
-                self.logger.warning(f"Error processing path {path}: {e}")
-
+        final_files_paths_first = self.bucket_inventory(bucket_name).paths(1)
         self.logger.info(f"Found {len(final_files_paths_first)} files for the first format.")
         return final_files_paths_first
 
@@ -88,8 +98,8 @@ class FileNameBuilder:
         """
         Retrieves file paths from the S3 bucket that match the second format criteria.
 
-        The second format includes files from the years 2018 (after week 19) to 2024. It filters files based 
-        on their extensions (.xls, .xlsx).
+        The second format includes files from 2018 (after week 19) onwards. Paths are read from the
+        cached bucket inventory.
 
         Args:
             bucket_name (str): The name of the S3 bucket containing the files.
@@ -98,29 +108,6 @@ class FileNameBuilder:
             List[str]: A list of file paths matching the second format criteria.
         """
         self.logger.info(f"Fetching second format paths from bucket: {bucket_name}")
-        bucket = self.s3.Bucket(bucket_name)
-        object_names = [obj.key for obj in bucket.objects.all() if obj.key.endswith(('.xls', '.xlsx'))]
-
-        second_format_years = {'2018', '2019', '2020', '2021', '2022', '2023', '2024', '2025'}
-        final_files_paths_second = []
-
-        for path in object_names:
-            try:
-                parts = Path(path).parts
-                if len(parts) < 2:
-                    continue
-                year = parts[1]
-                week = int(Path(path).stem.split('_')[1])
-
-                if year in second_format_years:
-                    ### week 19 of 2018. Major format change!
-                    if year == '2018' and week <= 19:
-                        continue
-                    final_files_paths_second.append(path)
-                    self.logger.debug(f"File added to second format: {path}")
-
-            except (IndexError, ValueError) as e:
-                self.logger.warning(f"Error processing path {path}: {e}")
-
+        final_files_paths_second = self.bucket_inventory(bucket_name).paths(2)
         self.logger.info(f"Found {len(final_files_paths_second)} files for the second format.")
         return final_files_paths_second
@@ -0,0 +1,746 @@
+
+from typing import List
+from abc import ABC, abstractmethod
+import boto3
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+import time
+import pandas as pd
+import sqlalchemy
+from io import BytesIO
+from botocore.exceptions import ClientError
+
+class FilesTracker(ABC):
+    """
+    Abstract base class of the files tracker backends.
+
+    The files tracker holds one row per downloaded workbook, keyed by its file name, with the link it was
+    downloaded from, the date it was added, its size and hash, and its RDS load status. The S3 backends keep
+    the tracker locally and write it back at checkpoints. Transactional backends live in the target database
+    and record the load of a file in the transaction inserting its rows.
+
+    Attributes:
+        s3 (boto3.resource): An S3 resource object to interact with AWS S3.
+        logger (logging.Logger): Logger instance for logging messages.
+        bucket_name (str): The name of the S3 bucket holding the tracker.
+        transactional (bool): Whether updates can join a database transaction with `upsert_in_transaction`.
+
+    Methods:
+        load() -> pd.DataFrame:
+            Returns the whole tracker, reading it from S3 when it is not held locally.
+
+        save(df: pd.DataFrame):
+            Writes the rows of a DataFrame into the tracker and checkpoints it.
+
+        get(file_name: str) -> dict:
+            Returns the row of a file.
+
+        upsert(file_name: str, **fields):
+            Inserts the row of a file or updates some of its fields.
+
+        checkpoint():
+            Writes the tracker back to S3.
+
+        refresh() -> bool:
+            Merges the updates written by other runs since the tracker was read.
+
+        upsert_in_transaction(connection: sqlalchemy.engine.Connection, file_name: str, **fields):
+            Inserts or updates the row of a file as part of a database transaction.
+    """
+    COLUMNS = ['file', 'link', 'date_added']
+    transactional = False
+
+    def __init__(self, s3: boto3.resource, logger: logging.Logger, bucket_name: str):
+        """
+        Initializes the tracker of a bucket, without loading it.
+
+        Args:
+            s3 (boto3.resource): An S3 resource object to interact with AWS S3.
+            logger (logging.Logger): Logger instance for logging messages.
+            bucket_name (str): The name of the S3 bucket holding the tracker.
+        """
+        self.s3 = s3
+        self.logger = logger
+        self.bucket_name = bucket_name
+
+    @abstractmethod
+    def load(self) -> pd.DataFrame:
+        pass
+
+    @abstractmethod
+    def save(self, df: pd.DataFrame):
+        pass
+
+    @abstractmethod
+    def get(self, file_name: str) -> dict:
+        pass
+
+    @abstractmethod
+    def upsert(self, file_name: str, **fields):
+        pass
+
+    @abstractmethod
+    def checkpoint(self):
+        pass
+
+    def refresh(self) -> bool:
+        return False
+
+    def upsert_in_transaction(self, connection: sqlalchemy.engine.Connection, file_name: str, **fields):
+        raise NotImplementedError(f"The {self.name} files tracker does not live in the database.")
+
+    @staticmethod
+    def _clean(value):
+        # pandas hands out NaN for missing values and numpy scalars: store plain Python values
+        if hasattr(value, 'item'):
+            value = value.item()
+        if isinstance(value, float) and math.isnan(value):
+            return None
+        return value
+
+    @staticmethod
+    def _quoted(columns: List[str]) -> List[str]:
+        return ['"' + str(column).replace('"', '""') + '"' for column in columns]
+
+
+class S3FilesTracker(FilesTracker):
+    """
+    Abstract base of the backends kept as one object of the bucket, read whole and written back whole at checkpoints.
+
+    Writes are conditional on the ETag of the version read (If-Match, or If-None-Match when the object does not
+    exist yet), so overlapping runs, e.g. a manual backfill during the scheduled run, never overwrite each other's
+    updates. When the object changed since it was read, it is read again, the updates of this run are replayed
+    on it and the write is retried. Replayed updates only set values, a missing value never erases one written by
+    another run, so both runs end up with the union of their updates.
+
+    Attributes:
+        tracker_name (str): The key of the tracker in the bucket.
+        etag (str): The ETag of the version of the tracker held locally, None if it is not in S3 yet.
+        changes (dict): The values set by this run since its last write, keyed by file name.
+        conflicts (int): Number of writes retried after a concurrent update.
+    """
+    MAX_ATTEMPTS = 5
+    CONFLICT_CODES = ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409', 'NoSuchKey', '404')
+
+    def __init__(self, s3: boto3.resource, logger: logging.Logger, bucket_name: str, tracker_name: str):
+        super().__init__(s3, logger, bucket_name)
+        self.tracker_name = tracker_name
+        self.etag = None
+        self.changes = {}
+        self.conflicts = 0
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.changes)
+
+    def save(self, df: pd.DataFrame):
+        """
+        Upserts the rows of a DataFrame into the tracker and checkpoints it. Only the values that differ from the
+        tracker are recorded as updates of this run.
+
+        Args:
+            df (pd.DataFrame): The DataFrame containing file tracking information to update.
+        """
+        if not self.loaded:
+            self._read()
+        rows = []
+        for row in df.to_dict('records'):
+            current = self.get(row['file']) or {}
+            changed = {column: value for column, value in row.items()
+                       if column != 'file' and self._clean(value) is not None and current.get(column) != self._clean(value)}
+            if changed or not current:
+                rows.append({'file': row['file'], **changed})
+        self._record(rows)
+        self._apply(rows)
+        self.checkpoint()
+
+    def upsert(self, file_name: str, **fields):
+        if not self.loaded:
+            self._read()
+        row = {'file': file_name, **fields}
+        self._record([row])
+        self._apply([row])
+
+    def checkpoint(self):
+        """
+        Writes the tracker back to S3 if this run changed it, merging the updates of concurrent runs first when
+        the object changed since it was read.
+
+        Raises:
+            ClientError: If S3 refuses the write, or the tracker kept changing for `MAX_ATTEMPTS` attempts.
+        """
+        if not self.loaded or not self.changes:
+            return
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            condition = {'IfMatch': self.etag} if self.etag is not None else {'IfNoneMatch': '*'}
+            try:
+                response = self.s3.Object(self.bucket_name, self.tracker_name).put(Body=self._serialize(), **condition)
+            except ClientError as e:
+                if e.response['Error']['Code'] not in self.CONFLICT_CODES or attempt == self.MAX_ATTEMPTS:
+                    self.logger.error(f"Failed to update files tracker in S3 bucket {self.bucket_name}: {e}")
+                    raise
+                self.conflicts += 1
+                self.logger.warning(f"{self.tracker_name} was updated by another run, merging its updates "
+                                    f"(attempt {attempt}).")
+                self._merge()
+                continue
+            self.etag = response['ETag']
+            self.changes = {}
+            return
+
+    def refresh(self) -> bool:
+        """
+        Merges the updates written to S3 by other runs since the tracker was read, if any.
+
+        Returns:
+            bool: Whether the tracker changed in S3.
+        """
+        if not self.loaded:
+            return False
+        try:
+            etag = self.s3.meta.client.head_object(Bucket=self.bucket_name, Key=self.tracker_name)['ETag']
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                raise
+            etag = None
+        if etag == self.etag:
+            return False
+        self._merge()
+        return True
+
+    def _record(self, rows: List[dict]):
+        for row in rows:
+            fields = self.changes.setdefault(row['file'], {})
+            fields.update({column: self._clean(value) for column, value in row.items()
+                           if column != 'file' and self._clean(value) is not None})
+
+    def _merge(self):
+        # Read the version in S3 and replay the updates of this run on it
+        self._read()
+        self._apply([{'file': file_name, **fields} for file_name, fields in self.changes.items()])
+        self.logger.info(f"Merged {len(self.changes)} updated files into the latest {self.tracker_name}.")
+
+    @property
+    @abstractmethod
+    def loaded(self) -> bool:
+        pass
+
+    @abstractmethod
+    def _read(self):
+        pass
+
+    @abstractmethod
+    def _apply(self, rows: List[dict]):
+        pass
+
+    @abstractmethod
+    def _serialize(self) -> bytes:
+        pass
+
+
+class CsvFilesTracker(S3FilesTracker):
+    """
+    Files tracker stored as `files_tracker.csv`, read whole with pandas and rewritten whole at every checkpoint.
+    """
+    name = 'csv'
+
+    def __init__(self, s3: boto3.resource, logger: logging.Logger, bucket_name: str,
+                 tracker_name: str = 'files_tracker.csv'):
+        super().__init__(s3, logger, bucket_name, tracker_name)
+        self._df = None
+        self._positions = {}
+
+    def load(self) -> pd.DataFrame:
+        """
+        Loads the files_tracker.csv from S3, with the updates of this run not written back yet, or creates a new
+        DataFrame if it does not exist.
+
+        Returns:
+            pd.DataFrame: A DataFrame containing the file tracking information.
+        """
+        if self.changes:
+            self._merge()
+        else:
+            self._read()
+        return self._df.copy()
+
+    def get(self, file_name: str) -> dict:
+        if self._df is None:
+            self._read()
+        position = self._positions.get(file_name)
+        if position is None:
+            return None
+        return {column: self._clean(value) for column, value in self._df.iloc[position].items()}
+
+    @property
+    def loaded(self) -> bool:
+        return self._df is not None
+
+    def _read(self):
+        try:
+            response = self.s3.Object(self.bucket_name, self.tracker_name).get()
+            tracker_df = pd.read_csv(BytesIO(response['Body'].read()))
+            self.etag = response.get('ETag')
+            self.logger.info("Loaded existing files tracker from S3.")
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchKey':
+                tracker_df = pd.DataFrame(columns=self.COLUMNS)
+                self.etag = None
+                self.logger.info("No existing files tracker found in S3. Creating a new one.")
+            else:
+                self.logger.error(f"ClientError when accessing {self.tracker_name}: {e}")
+                raise
+        self._set(tracker_df)
+
+    def _apply(self, rows: List[dict]):
+        new_rows = {}
+        for row in rows:
+            for column in row:
+                if column not in self._df.columns:
+                    self._df[column] = None
+            position = self._positions.get(row['file'])
+            if position is None:
+                new_rows.setdefault(row['file'], {}).update(row)
+                continue
+            for column, value in row.items():
+                if column == 'file':
+                    continue
+                if self._df[column].dtype != object:
+                    self._df[column] = self._df[column].astype(object)
+                self._df.iat[position, self._df.columns.get_loc(column)] = value
+        if new_rows:
+            added = pd.DataFrame(list(new_rows.values()))
+            if self._df.empty:
+                self._set(added.reindex(columns=list(dict.fromkeys([*self._df.columns, *added.columns]))))
+            else:
+                self._set(pd.concat([self._df, added], ignore_index=True))
+
+    def _serialize(self) -> bytes:
+        buffer = BytesIO()
+        self._df.to_csv(buffer, index=False)
+        return buffer.getvalue()
+
+    def _set(self, df: pd.DataFrame):
+        self._df = df.reset_index(drop=True)
+        self._positions = {file_name: position for position, file_name in enumerate(self._df['file'])}
+
+
+class SqliteFilesTracker(S3FilesTracker):
+    """
+    Files tracker stored as an SQLite database indexed on the file name, synced to S3 at checkpoints.
+
+    Lookups and upserts of a file go through the primary key index (O(log n)) of a local copy of the
+    database. The copy is uploaded only when `checkpoint` is called and something changed. When the bucket
+    holds no SQLite tracker yet, the existing files_tracker.csv is imported on load. From then on the CSV is
+    rewritten from the tracker after every write, so readers of the CSV, e.g. the app, see the loads recorded
+    since the migration.
+
+    Attributes:
+        csv_tracker_name (str): The key of the CSV tracker migrated on first use and exported at checkpoints.
+    """
+    name = 'sqlite'
+
+    def __init__(self, s3: boto3.resource, logger: logging.Logger, bucket_name: str,
+                 tracker_name: str = 'files_tracker.sqlite', csv_tracker_name: str = 'files_tracker.csv'):
+        super().__init__(s3, logger, bucket_name, tracker_name)
+        self.csv_tracker_name = csv_tracker_name
+        self._path = None
+        self._connection = None
+        self._columns = []
+
+    def checkpoint(self):
+        """
+        Writes the tracker back to S3 if this run changed it, then exports it to the CSV tracker.
+
+        Raises:
+            ClientError: If S3 refuses the write of the SQLite tracker. A failed export is only logged, the
+                next checkpoint exports the tracker again.
+        """
+        if not self.dirty:
+            return
+        super().checkpoint()
+        # The CSV is a copy of the merged tracker for readers only, the last export is the most complete one
+        buffer = BytesIO()
+        self.load().to_csv(buffer, index=False)
+        try:
+            self.s3.Object(self.bucket_name, self.csv_tracker_name).put(Body=buffer.getvalue())
+        except ClientError as e:
+            self.logger.warning(f"Failed to export the files tracker to {self.csv_tracker_name}: {e}")
+
+    def load(self) -> pd.DataFrame:
+        """
+        Returns the whole tracker, downloading the database from S3 on first use.
+
+        Returns:
+            pd.DataFrame: A DataFrame containing the file tracking information, in insertion order.
+        """
+        if self._connection is None:
+            self._read()
+        cursor = self._connection.execute(f"SELECT {', '.join(self._quoted(self._columns))} FROM files ORDER BY rowid")
+        return pd.DataFrame(cursor.fetchall(), columns=self._columns)
+
+    def get(self, file_name: str) -> dict:
+        if self._connection is None:
+            self._read()
+        row = self._connection.execute(
+            f"SELECT {', '.join(self._quoted(self._columns))} FROM files WHERE file = ?", (file_name,)).fetchone()
+        return dict(zip(self._columns, row)) if row is not None else None
+
+    @property
+    def loaded(self) -> bool:
+        return self._connection is not None
+
+    def _read(self):
+        if self._connection is not None:
+            self._connection.close()
+            os.remove(self._path)
+        fd, self._path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        migrate = False
+        try:
+            # The ETag is read first: if the tracker is replaced before the download, the next conditional write
+            # fails and merges again, it never overwrites the newer version
+            self.etag = self.s3.meta.client.head_object(Bucket=self.bucket_name, Key=self.tracker_name)['ETag']
+            self.s3.meta.client.download_file(self.bucket_name, self.tracker_name, self._path)
+            self.logger.info("Loaded existing files tracker from S3.")
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                self.logger.error(f"ClientError when accessing {self.tracker_name}: {e}")
+                raise
+            self.etag = None
+            migrate = True
+
+        # The asyncio crawler updates the tracker from an executor thread
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS files (file TEXT PRIMARY KEY, link TEXT, date_added TEXT)")
+        self._columns = [row[1] for row in self._connection.execute("PRAGMA table_info(files)")]
+
+        if migrate:
+            rows = CsvFilesTracker(self.s3, self.logger, self.bucket_name, self.csv_tracker_name).load().to_dict('records')
+            self._record(rows)
+            self._apply(rows)
+            self.logger.info(f"Migrated {len(rows)} rows of {self.csv_tracker_name} to {self.tracker_name}.")
+
+    def _apply(self, rows: List[dict]):
+        with self._connection:
+            for row in rows:
+                for column in row:
+                    if column not in self._columns:
+                        self._connection.execute(f"ALTER TABLE files ADD COLUMN {self._quoted([column])[0]}")
+                        self._columns.append(column)
+                columns = list(row)
+                quoted = self._quoted(columns)
+                updates = ', '.join(f"{column} = excluded.{column}" for column in quoted if column != '"file"')
+                self._connection.execute(
+                    f"INSERT INTO files ({', '.join(quoted)}) VALUES ({', '.join('?' * len(columns))}) "
+                    f"ON CONFLICT(file) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING"),
+                    [self._clean(row[column]) for column in columns])
+
+    def _serialize(self) -> bytes:
+        self._connection.commit()
+        with open(self._path, 'rb') as file:
+            return file.read()
+
+
+class WriteBehindTracker:
+    """
+    A write-behind buffer in front of a files tracker, checkpointing it every few files or seconds.
+
+    Updates go to the wrapped tracker right away, so lookups always see them, but the tracker is only written
+    back to S3 once `max_pending` files were updated or `max_seconds` went by since the last write. A crash
+    therefore loses at most the updates of one window, whose files are then processed again on the next run.
+    Updates written by other runs are looked for at most once every `max_seconds` as well: every write merges
+    them, and in between a refresh is answered from the tracker held locally without a request to S3.
+
+    Attributes:
+        tracker (FilesTracker): The wrapped files tracker.
+        logger (logging.Logger): Logger instance for logging messages.
+        max_pending (int): Number of updated files after which the tracker is written back.
+        max_seconds (float): Time in seconds after which pending updates are written back.
+        pending (int): Number of files updated since the last write.
+        checkpoints (int): Number of times the tracker was written back.
+
+    Methods:
+        load() -> pd.DataFrame:
+            Writes pending updates back and returns the whole tracker.
+
+        get(file_name: str) -> dict:
+            Returns the row of a file, including updates not written back yet.
+
+        upsert(file_name: str, **fields):
+            Inserts or updates the row of a file, without writing the tracker back.
+
+        upsert_in_transaction(connection: sqlalchemy.engine.Connection, file_name: str, **fields):
+            Inserts or updates the row of a file in a transactional tracker, committed with the transaction.
+
+        checkpoint():
+            Writes the tracker back if the current window is full or expired.
+
+        refresh() -> bool:
+            Merges the updates written by other runs, at most once every `max_seconds`.
+
+        flush():
+            Writes the tracker back if any update is pending.
+    """
+    def __init__(self, tracker: FilesTracker, logger: logging.Logger, max_pending: int = 50, max_seconds: float = 60.0):
+        """
+        Initializes the buffer in front of a tracker.
+
+        Args:
+            tracker (FilesTracker): The wrapped files tracker.
+            logger (logging.Logger): Logger instance for logging messages.
+            max_pending (int, optional): Number of updated files after which the tracker is written back. Defaults to 50.
+            max_seconds (float, optional): Time in seconds after which pending updates are written back. Defaults to 60.
+        """
+        self.tracker = tracker
+        self.logger = logger
+        self.max_pending = max(1, max_pending)
+        self.max_seconds = max_seconds
+        self.pending = 0
+        self.checkpoints = 0
+        self._window_start = time.monotonic()
+        self._last_refresh = time.monotonic()
+
+    def load(self) -> pd.DataFrame:
+        # The CSV backend reads the tracker from S3 again on load, which would drop pending updates
+        self.flush()
+        return self.tracker.load()
+
+    def get(self, file_name: str) -> dict:
+        return self.tracker.get(file_name)
+
+    @property
+    def transactional(self) -> bool:
+        return self.tracker.transactional
+
+    def upsert_in_transaction(self, connection: sqlalchemy.engine.Connection, file_name: str, **fields):
+        # Committed with the transaction, nothing is left to write back
+        self.tracker.upsert_in_transaction(connection, file_name, **fields)
+
+    def refresh(self) -> bool:
+        """
+        Merges the updates written by other runs if `max_seconds` went by since the tracker was last read or
+        written back. Pending updates are kept: they are replayed on the latest version of the tracker.
+
+        Returns:
+            bool: Whether the tracker changed in S3.
+        """
+        if time.monotonic() - self._last_refresh < self.max_seconds:
+            return False
+        self._last_refresh = time.monotonic()
+        return self.tracker.refresh()
+
+    def upsert(self, file_name: str, **fields):
+        if self.pending == 0:
+            self._window_start = time.monotonic()
+        self.tracker.upsert(file_name, **fields)
+        self.pending += 1
+
+    def checkpoint(self):
+        """
+        Writes the tracker back if `max_pending` files were updated or `max_seconds` went by since the first
+        pending update.
+        """
+        if self.pending >= self.max_pending or \
+                (self.pending and time.monotonic() - self._window_start >= self.max_seconds):
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the tracker back if any update is pending.
+        """
+        if not self.pending:
+            return
+        self.tracker.checkpoint()
+        # A write conflicting with another run merges its updates, so the tracker is as fresh as a refresh
+        self._last_refresh = time.monotonic()
+        self.logger.info(f"Files tracker checkpointed with {self.pending} updated files.")
+        self.pending = 0
+        self.checkpoints += 1
+
+
+class DatabaseFilesTracker(FilesTracker):
+    """
+    Files tracker stored as a table of the target database (PostgreSQL), next to the loaded data.
+
+    The load of a file can be recorded with `upsert_in_transaction` in the transaction inserting the rows of
+    the file, so rows and status commit or roll back together and each file is loaded exactly once, with no S3
+    write per file. When the table is empty on first use, the tracker kept in S3 is imported (the SQLite
+    tracker, itself imported from files_tracker.csv if needed).
+
+    Attributes:
+        engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine of the target database.
+        table_name (str): The name of the tracker table.
+    """
+    name = 'postgres'
+    transactional = True
+    SCHEMA = {
+        'file': 'TEXT PRIMARY KEY',
+        'link': 'TEXT',
+        'date_added': 'TEXT',
+        'year': 'TEXT',
+        'size': 'BIGINT',
+        'sha256': 'TEXT',
+        'alias_of': 'TEXT',
+        'rds_load': 'TEXT',
+    }
+
+    def __init__(self, s3: boto3.resource, logger: logging.Logger, bucket_name: str,
+                 engine: sqlalchemy.engine.base.Engine, table_name: str = 'files_tracker'):
+        super().__init__(s3, logger, bucket_name)
+        self.engine = engine
+        self.table_name = table_name
+        self._columns = None
+
+    def load(self) -> pd.DataFrame:
+        """
+        Returns the whole tracker, ordered by date added and file name.
+
+        Returns:
+            pd.DataFrame: A DataFrame containing the file tracking information.
+        """
+        self._ensure_table()
+        with self.engine.connect() as connection:
+            result = connection.execute(sqlalchemy.text(
+                f"SELECT {', '.join(self._quoted(self._columns))} FROM {self._quoted([self.table_name])[0]} "
+                f"ORDER BY date_added, file"))
+            return pd.DataFrame(result.fetchall(), columns=self._columns)
+
+    def save(self, df: pd.DataFrame):
+        """
+        Upserts the rows of a DataFrame into the tracker in one transaction. As with the S3 backends, only the
+        values that differ from the table are written, and a missing value never erases one, so saving a
+        snapshot read earlier keeps the updates committed since, e.g. the loads recorded by another run.
+
+        Args:
+            df (pd.DataFrame): The DataFrame containing file tracking information to update.
+        """
+        self._ensure_table()
+        with self.engine.begin() as connection:
+            result = connection.execute(sqlalchemy.text(
+                f"SELECT {', '.join(self._quoted(self._columns))} FROM {self._quoted([self.table_name])[0]}"))
+            current = {row[0]: dict(zip(self._columns, row)) for row in result}
+            rows = []
+            for row in df.to_dict('records'):
+                existing = current.get(row['file'])
+                changed = {column: self._clean(value) for column, value in row.items()
+                           if column != 'file' and self._clean(value) is not None
+                           and (existing is None or existing.get(column) != self._clean(value))}
+                if changed or existing is None:
+                    rows.append({'file': row['file'], **changed})
+            self._upsert_rows(connection, rows)
+
+    def get(self, file_name: str) -> dict:
+        self._ensure_table()
+        with self.engine.connect() as connection:
+            row = connection.execute(sqlalchemy.text(
+                f"SELECT {', '.join(self._quoted(self._columns))} FROM {self._quoted([self.table_name])[0]} "
+                f"WHERE file = :file"), {'file': file_name}).fetchone()
+        return dict(zip(self._columns, row)) if row is not None else None
+
+    def upsert(self, file_name: str, **fields):
+        self._ensure_table()
+        with self.engine.begin() as connection:
+            self._upsert_rows(connection, [{'file': file_name, **fields}])
+
+    def upsert_in_transaction(self, connection: sqlalchemy.engine.Connection, file_name: str, **fields):
+        """
+        Inserts or updates the row of a file as part of a database transaction, committed by the caller.
+
+        Args:
+            connection (sqlalchemy.engine.Connection): A connection with an open transaction.
+            file_name (str): The name of the file.
+            **fields: The columns to set.
+        """
+        self._ensure_table()
+        self._upsert_rows(connection, [{'file': file_name, **fields}])
+
+    def checkpoint(self):
+        """
+        Does nothing: every update is committed to the database.
+        """
+
+    def _ensure_table(self):
+        if self._columns is not None:
+            return
+        table = self._quoted([self.table_name])[0]
+        with self.engine.begin() as connection:
+            connection.execute(sqlalchemy.text(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                f"({', '.join(f'{column} {ddl}' for column, ddl in self.SCHEMA.items())})"))
+            self._columns = [column['name'] for column in sqlalchemy.inspect(connection).get_columns(self.table_name)]
+            empty = connection.execute(sqlalchemy.text(f"SELECT 1 FROM {table} LIMIT 1")).fetchone() is None
+
+        if empty:
+            s3_df = SqliteFilesTracker(self.s3, self.logger, self.bucket_name).load()
+            if not s3_df.empty:
+                with self.engine.begin() as connection:
+                    self._upsert_rows(connection, s3_df.to_dict('records'))
+                self.logger.info(f"Imported {len(s3_df)} rows of the S3 files tracker into the {self.table_name} table.")
+
+    def _upsert_rows(self, connection: sqlalchemy.engine.Connection, rows: List[dict]):
+        # Rows setting the same columns are written with one statement executed for all of them
+        table = self._quoted([self.table_name])[0]
+        batches = {}
+        for row in rows:
+            self._add_columns(row)
+            batches.setdefault(tuple(row), []).append(row)
+        for columns, batch in batches.items():
+            updates = ', '.join(f"{column} = excluded.{column}" for column in self._quoted(columns) if column != '"file"')
+            parameters = [{f'p{i}': self._clean(row[column]) for i, column in enumerate(columns)} for row in batch]
+            connection.execute(sqlalchemy.text(
+                f"INSERT INTO {table} ({', '.join(self._quoted(columns))}) "
+                f"VALUES ({', '.join(f':p{i}' for i in range(len(columns)))}) "
+                f"ON CONFLICT (file) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING")), parameters)
+
+    def _add_columns(self, row: dict):
+        # Added in their own transaction, so the columns stay even if the caller's transaction is rolled back
+        missing = [(column, value) for column, value in row.items() if column not in self._columns]
+        if not missing:
+            return
+        table = self._quoted([self.table_name])[0]
+        with self.engine.begin() as connection:
+            for column, value in missing:
+                value = self._clean(value)
+                ddl = 'BIGINT' if isinstance(value, int) else 'DOUBLE PRECISION' if isinstance(value, float) else 'TEXT'
+                connection.execute(sqlalchemy.text(f"ALTER TABLE {table} ADD COLUMN {self._quoted([column])[0]} {ddl}"))
+        self._columns.extend(column for column, _ in missing)
+
+
+TRACKER_BACKENDS = {
+    CsvFilesTracker.name: CsvFilesTracker,
+    SqliteFilesTracker.name: SqliteFilesTracker,
+    DatabaseFilesTracker.name: DatabaseFilesTracker,
+}
+
+
+def get_files_tracker(backend: str, s3: boto3.resource, logger: logging.Logger, bucket_name: str,
+                      engine: sqlalchemy.engine.base.Engine = None) -> FilesTracker:
+    """
+    Returns a files tracker for the requested backend.
+
+    Args:
+        backend (str): 'sqlite', 'csv' or 'postgres'.
+        s3 (boto3.resource): An S3 resource object to interact with AWS S3.
+        logger (logging.Logger): Logger instance for logging messages.
+        bucket_name (str): The name of the S3 bucket holding the tracker.
+        engine (sqlalchemy.engine.base.Engine, optional): The engine of the target database, required by the
+            'postgres' backend. Defaults to None.
+
+    Returns:
+        FilesTracker: The files tracker, not loaded yet.
+
+    Raises:
+        ValueError: If the backend is unknown, or is 'postgres' without an engine.
+    """
+    if backend not in TRACKER_BACKENDS:
+        raise ValueError(f"Unknown files tracker backend {backend}, expected one of {sorted(TRACKER_BACKENDS)}")
+    if TRACKER_BACKENDS[backend].transactional:
+        if engine is None:
+            raise ValueError(f"The {backend} files tracker needs a database engine.")
+        return TRACKER_BACKENDS[backend](s3, logger, bucket_name, engine)
+    return TRACKER_BACKENDS[backend](s3, logger, bucket_name)
@@ -0,0 +1,184 @@
+
+from typing import NamedTuple, Tuple
+import logging
+import threading
+import zipfile
+from io import StringIO
+import openpyxl
+import xlrd
+from openpyxl.utils.exceptions import InvalidFileException
+from src.WorkbookSession import workbook_stream
+
+class WorkbookSignature(NamedTuple):
+    """
+    The template of a DANE workbook, as read from its sheet names and a few header cells.
+
+    Attributes:
+        file_format (int): 1 for the single tab DANE format, 2 for the one tab per food class format,
+            None if the template is not recognised.
+        layout (str): 'single_tab', 'food_class_tabs', 'market_column' (one tab per food class with a
+            'Mercado mayorista' column, as in week 20 of 2018) or 'unknown'.
+        container (str): 'xlsx', 'xls' or 'unknown', from the magic bytes of the file.
+        sheet_names (Tuple[str, ...]): The names of the sheets of the workbook.
+        header (Tuple[str, ...]): The first row of the first food class sheet (the only sheet in the first format).
+    """
+    file_format: int
+    layout: str
+    container: str
+    sheet_names: Tuple[str, ...]
+    header: Tuple[str, ...]
+
+
+class FormatDetector:
+    """
+    Identifies the template of DANE workbooks without parsing them, so each workbook is routed to the right parser.
+
+    Only the workbook structure and the first row of one sheet are read: xlsx files in openpyxl read-only mode,
+    xls files with xlrd loading sheets on demand. Workbooks with a sheet per food class (a summary sheet followed
+    by at least eight food class sheets) are in the second format, any other readable workbook is in the first
+    format. Signatures are cached per S3 ETag, and stored in the bucket manifest by the wrangler, so a workbook
+    is fingerprinted once per version across runs.
+
+    Attributes:
+        logger (logging.Logger): Logger instance for logging messages.
+        signatures (dict): Signatures of the workbooks seen so far, keyed by ETag.
+        layouts (set): The (layout, header) pairs seen so far, to log new templates once.
+
+    Methods:
+        __init__(logger: logging.Logger):
+            Initializes an empty detector.
+
+        detect(data: bytes, etag: str = None) -> WorkbookSignature:
+            Returns the signature of a workbook, from the cache when its ETag was seen before.
+
+        cached(etag: str) -> WorkbookSignature:
+            Returns the cached signature of a workbook version, None if it was not detected yet.
+
+        remember(etag: str, signature: WorkbookSignature):
+            Caches the signature of a workbook version detected elsewhere, e.g. by a parse worker process.
+    """
+    FOOD_CLASS_SHEETS = 8
+    MARKET_COLUMN = 'mercado mayorista'
+
+    def __init__(self, logger: logging.Logger):
+        """
+        Initializes an empty detector.
+
+        Args:
+            logger (logging.Logger): Logger instance for logging messages.
+        """
+        self.logger = logger
+        self.signatures = {}
+        self.layouts = set()
+        self._lock = threading.Lock()
+
+    def detect(self, data: bytes, etag: str = None) -> WorkbookSignature:
+        """
+        Returns the signature of a workbook, from the cache when its ETag was seen before.
+
+        Args:
+            data (bytes): The content of the workbook (bytes or a memory map).
+            etag (str, optional): The ETag of the S3 object, used as cache key. Defaults to None (no caching).
+
+        Returns:
+            WorkbookSignature: The template of the workbook. Unreadable workbooks get the 'unknown' layout.
+        """
+        signature = self.cached(etag)
+        if signature is not None:
+            return signature
+
+        container = self.container(data)
+        try:
+            if container == 'xls':
+                sheet_names, header = self._read_xls(data)
+            else:
+                sheet_names, header = self._read_xlsx(data)
+        except (zipfile.BadZipFile, InvalidFileException, xlrd.XLRDError, OSError, KeyError, ValueError, IndexError) as e:
+            self.logger.warning(f"Could not read the structure of a {container} workbook: {e}")
+            return WorkbookSignature(None, 'unknown', container, (), ())
+
+        if len(sheet_names) > self.FOOD_CLASS_SHEETS:
+            file_format = 2
+            layout = 'market_column' if self.MARKET_COLUMN in (cell.lower() for cell in header) else 'food_class_tabs'
+        else:
+            file_format, layout = (1, 'single_tab') if sheet_names else (None, 'unknown')
+        signature = WorkbookSignature(file_format, layout, container, tuple(sheet_names), tuple(header))
+
+        with self._lock:
+            if etag is not None:
+                self.signatures[etag] = signature
+            if (layout, signature.header) not in self.layouts:
+                self.layouts.add((layout, signature.header))
+                self.logger.info(f"New workbook template: format {file_format}, layout {layout}, "
+                                 f"{len(sheet_names)} sheets, header {list(signature.header)}.")
+        return signature
+
+    def cached(self, etag: str) -> WorkbookSignature:
+        """
+        Returns the cached signature of a workbook version, None if it was not detected yet.
+
+        Args:
+            etag (str): The ETag of the S3 object.
+
+        Returns:
+            WorkbookSignature: The cached signature, or None.
+        """
+        if etag is None:
+            return None
+        with self._lock:
+            return self.signatures.get(etag)
+
+    def remember(self, etag: str, signature: WorkbookSignature):
+        """
+        Caches the signature of a workbook version detected elsewhere, e.g. by a parse worker process.
+
+        Args:
+            etag (str): The ETag of the S3 object. Nothing is cached when it is None.
+            signature (WorkbookSignature): The signature of the workbook.
+        """
+        if etag is None:
+            return
+        with self._lock:
+            self.signatures[etag] = signature
+            self.layouts.add((signature.layout, signature.header))
+
+    @staticmethod
+    def container(data: bytes) -> str:
+        """
+        Returns the container of a workbook from its magic bytes: 'xlsx' (ZIP), 'xls' (OLE2) or 'unknown'.
+        """
+        magic = bytes(data[:8])
+        if magic.startswith(b'PK\x03\x04'):
+            return 'xlsx'
+        if magic == b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1':
+            return 'xls'
+        return 'unknown'
+
+    def _sheet_index(self, sheet_names) -> int:
+        # The first food class sheet follows the summary sheet in the second format
+        return 1 if len(sheet_names) > self.FOOD_CLASS_SHEETS else 0
+
+    def _read_xlsx(self, data: bytes) -> tuple:
+        workbook = openpyxl.load_workbook(workbook_stream(data), read_only=True, data_only=True)
+        try:
+            sheet_names = workbook.sheetnames
+            if not sheet_names:
+                return [], []
+            sheet = workbook.worksheets[self._sheet_index(sheet_names)]
+            first_row = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+            return sheet_names, [str(cell).strip() for cell in first_row if cell is not None]
+        finally:
+            workbook.close()
+
+    def _read_xls(self, data: bytes) -> tuple:
+        # xlrd closes the memory maps it is given when releasing the book, so it reads a copy
+        book = xlrd.open_workbook(file_contents=bytes(data), on_demand=True, logfile=StringIO())
+        try:
+            sheet_names = book.sheet_names()
+            if not sheet_names:
+                return [], []
+            sheet = book.sheet_by_index(self._sheet_index(sheet_names))
+            first_row = sheet.row_values(0) if sheet.nrows else []
+            return sheet_names, [str(cell).strip() for cell in first_row if cell not in (None, '')]
+        finally:
+            book.release_resources()
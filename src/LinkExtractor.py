@@ -0,0 +1,146 @@
+
+import re
+from typing import List, NamedTuple
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:  # lxml is optional, BeautifulSoup is used when it is missing
+    lxml_html = None
+
+class Link(NamedTuple):
+    """
+    A link extracted from a DANE page.
+
+    Besides tuple unpacking, it supports the `link['href']`, `link.text` and `link.get_text()` accessors of
+    the BeautifulSoup tags it replaces, so it can be used wherever those tags were expected.
+
+    Attributes:
+        href (str): The href attribute of the link.
+        text (str): The text content of the link.
+    """
+    href: str
+    text: str
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+    def get_text(self) -> str:
+        return self.text
+
+
+class BeautifulSoupLinkExtractor:
+    """
+    Link extractor based on BeautifulSoup and the pure-Python html.parser.
+
+    This is the reference implementation: other extractors must return the same links.
+
+    Methods:
+        year_links(content: bytes) -> List[Link]:
+            Extracts the links whose text is a year from the DANE landing page.
+
+        report_links(content: bytes) -> List[Link]:
+            Extracts the 'Anexo' report links opening in a new tab from a DANE year page.
+    """
+    name = 'bs4'
+    year_pattern = re.compile(r'^\d+$')
+
+    def year_links(self, content: bytes) -> List[Link]:
+        """
+        Extracts the links whose text is a year from the DANE landing page.
+
+        Args:
+            content (bytes): The HTML of the page.
+
+        Returns:
+            List[Link]: The year links, in document order.
+        """
+        soup = BeautifulSoup(content, "html.parser")
+        return [Link(tag.get('href'), tag.get_text()) for tag in soup.find_all('a')
+                if tag.get('href') and self.year_pattern.match(tag.get_text().strip())]
+
+    def report_links(self, content: bytes) -> List[Link]:
+        """
+        Extracts the 'Anexo' report links opening in a new tab from a DANE year page.
+
+        Args:
+            content (bytes): The HTML of the page.
+
+        Returns:
+            List[Link]: The report links, in document order.
+        """
+        soup_year = BeautifulSoup(content, "html.parser")
+        return [Link(item.get('href'), item.text) for item in soup_year.find_all(target='_blank')
+                if item.get('href') and 'Anexo' in item.text]
+
+
+class LxmlLinkExtractor(BeautifulSoupLinkExtractor):
+    """
+    Link extractor based on the lxml (libxml2) HTML parser and precompiled XPath selectors.
+
+    It returns the same links as BeautifulSoupLinkExtractor, an order of magnitude faster.
+
+    Methods:
+        year_links(content: bytes) -> List[Link]:
+            Extracts the links whose text is a year from the DANE landing page.
+
+        report_links(content: bytes) -> List[Link]:
+            Extracts the 'Anexo' report links opening in a new tab from a DANE year page.
+    """
+    name = 'lxml'
+
+    def __init__(self):
+        if lxml_html is None:
+            raise ImportError("lxml is required by LxmlLinkExtractor")
+        self.anchors = etree.XPath("//a[@href != '']")
+        self.anexo_targets = etree.XPath("//*[@target='_blank'][@href != ''][contains(string(.), 'Anexo')]")
+
+    def _parse(self, content: bytes):
+        if not content or not content.strip():
+            return None
+        return lxml_html.document_fromstring(content)
+
+    def year_links(self, content: bytes) -> List[Link]:
+        document = self._parse(content)
+        if document is None:
+            return []
+        links = []
+        for anchor in self.anchors(document):
+            text = str(anchor.text_content())
+            if self.year_pattern.match(text.strip()):
+                links.append(Link(anchor.get('href'), text))
+        return links
+
+    def report_links(self, content: bytes) -> List[Link]:
+        document = self._parse(content)
+        if document is None:
+            return []
+        return [Link(item.get('href'), str(item.text_content())) for item in self.anexo_targets(document)]
+
+
+LINK_EXTRACTORS = {
+    BeautifulSoupLinkExtractor.name: BeautifulSoupLinkExtractor,
+    LxmlLinkExtractor.name: LxmlLinkExtractor,
+}
+
+
+def get_link_extractor(backend: str = None) -> BeautifulSoupLinkExtractor:
+    """
+    Returns a link extractor for the requested backend.
+
+    Args:
+        backend (str, optional): 'lxml' or 'bs4'. Defaults to lxml when it is installed, BeautifulSoup otherwise.
+
+    Returns:
+        BeautifulSoupLinkExtractor: The link extractor.
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+    if backend is None:
+        backend = LxmlLinkExtractor.name if lxml_html is not None else BeautifulSoupLinkExtractor.name
+    if backend not in LINK_EXTRACTORS:
+        raise ValueError(f"Unknown link extractor backend {backend}, expected one of {sorted(LINK_EXTRACTORS)}")
+    return LINK_EXTRACTORS[backend]()
@@ -0,0 +1,349 @@
+
+from typing import List
+import boto3
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+from botocore.exceptions import ClientError
+
+class Manifest:
+    """
+    A persistent record of the workbooks stored in the bucket, kept as an SQLite sidecar next to the files tracker.
+
+    Each row holds the key, size, ETag, last modification time, detected format, year, week and parse status
+    of a workbook. The manifest is updated from listings of a few prefixes at a time: rows whose ETag or size
+    changed go back to the 'pending' parse status, rows of deleted objects are removed, and every other row,
+    including its parse status, is left untouched. The time of the last listing of the whole bucket is kept
+    too, so the inventory can tell when a full listing is due.
+
+    Like the files tracker, the manifest is written back conditionally on the ETag of the version read, so
+    overlapping runs never overwrite each other's updates. When the object changed since it was read, it is
+    read again, the updates of this run are replayed on it and the write is retried. A parse status is only
+    replayed on the version of the workbook it was recorded for.
+
+    The template detected for a workbook is stored with its row too, and dropped when its ETag changes, so
+    later runs route a workbook version without opening it again. A recognised template replaces the format
+    given by the path of the workbook, until the workbook is republished.
+
+    Attributes:
+        s3 (boto3.resource): An S3 resource object to interact with AWS S3.
+        logger (logging.Logger): Logger instance for logging messages.
+        bucket_name (str): The name of the S3 bucket.
+        manifest_name (str): The key of the SQLite file in the bucket.
+        loaded (bool): Whether the manifest has been loaded from S3.
+        dirty (bool): Whether the manifest changed since it was last saved to S3.
+        etag (str): The ETag of the version of the manifest held locally, None if it is not in S3 yet.
+        conflicts (int): Number of saves retried after a concurrent update.
+
+    Methods:
+        __init__(s3: boto3.resource, logger: logging.Logger, bucket_name: str, manifest_name: str = 'manifest.sqlite'):
+            Initializes the manifest of a bucket, without loading it.
+
+        load():
+            Downloads the manifest from S3, or starts an empty one if it does not exist.
+
+        save():
+            Uploads the manifest to S3 if it changed, merging the updates of concurrent runs first.
+
+        apply_listing(prefixes: List[str], entries: List[dict], full: bool = False) -> dict:
+            Updates the rows under the listed prefixes to match a listing.
+
+        last_full_listing() -> datetime.datetime:
+            Returns when the whole bucket was last listed.
+
+        rows() -> List[dict]:
+            Returns every row of the manifest in key order.
+
+        set_parse_status(key: str, status: str):
+            Records the parse status of a workbook.
+
+        signature(key: str, etag: str) -> dict:
+            Returns the template stored for a version of a workbook.
+
+        set_signature(key: str, etag: str, signature: dict):
+            Stores the template detected for a version of a workbook.
+
+        is_empty() -> bool:
+            Checks if the manifest holds no workbook.
+    """
+    COLUMNS = ('key', 'year', 'week', 'file_format', 'size', 'etag', 'last_modified', 'parse_status')
+    MAX_ATTEMPTS = 5
+    CONFLICT_CODES = ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409', 'NoSuchKey', '404')
+
+    def __init__(self,
+                 s3: boto3.resource,
+                 logger: logging.Logger,
+                 bucket_name: str,
+                 manifest_name: str = 'manifest.sqlite'):
+        """
+        Initializes the manifest of a bucket, without loading it.
+
+        Args:
+            s3 (boto3.resource): An S3 resource object to interact with AWS S3.
+            logger (logging.Logger): Logger instance for logging messages.
+            bucket_name (str): The name of the S3 bucket.
+            manifest_name (str, optional): The key of the SQLite file in the bucket. Defaults to 'manifest.sqlite'.
+        """
+        self.s3 = s3
+        self.logger = logger
+        self.bucket_name = bucket_name
+        self.manifest_name = manifest_name
+        self.loaded = False
+        self.dirty = False
+        self.etag = None
+        self.conflicts = 0
+        self._path = None
+        self._connection = None
+        # The updates of this run since its last save, replayed when another run saved in between
+        self._listed = {}
+        self._removed = set()
+        self._statuses = {}
+        self._signatures = {}
+        self._properties = {}
+
+    def load(self):
+        """
+        Downloads the manifest from S3, or starts an empty one if it does not exist.
+        """
+        if self._connection is not None:
+            self._connection.close()
+            os.remove(self._path)
+        fd, self._path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        try:
+            # The ETag is read first: if the manifest is replaced before the download, the next conditional save
+            # fails and merges again, it never overwrites the newer version
+            self.etag = self.s3.meta.client.head_object(Bucket=self.bucket_name, Key=self.manifest_name)['ETag']
+            self.s3.meta.client.download_file(self.bucket_name, self.manifest_name, self._path)
+            self.logger.info(f"Loaded existing manifest {self.manifest_name} from S3.")
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                self.logger.error(f"ClientError when accessing {self.manifest_name}: {e}")
+                raise
+            self.logger.info("No existing manifest found in S3. Creating a new one.")
+            self.etag = None
+            open(self._path, 'wb').close()
+
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS objects (
+                key TEXT PRIMARY KEY,
+                year TEXT NOT NULL,
+                week INTEGER NOT NULL,
+                file_format INTEGER NOT NULL,
+                size INTEGER,
+                etag TEXT,
+                last_modified TEXT,
+                parse_status TEXT NOT NULL DEFAULT 'pending',
+                signature TEXT
+            )""")
+        # Manifests written before templates were stored lack the column
+        if 'signature' not in [row[1] for row in self._connection.execute("PRAGMA table_info(objects)")]:
+            self._connection.execute("ALTER TABLE objects ADD COLUMN signature TEXT")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS properties (name TEXT PRIMARY KEY, value TEXT)")
+        self._connection.commit()
+        self.loaded = True
+
+    def save(self):
+        """
+        Uploads the manifest to S3 if it changed, merging the updates of concurrent runs first when the object
+        changed since it was read.
+
+        Raises:
+            ClientError: If S3 refuses the upload, or the manifest kept changing for `MAX_ATTEMPTS` attempts. The
+                manifest stays dirty, so a later save uploads it again.
+        """
+        if not self.dirty:
+            return
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            self._connection.commit()
+            with open(self._path, 'rb') as f:
+                body = f.read()
+            condition = {'IfMatch': self.etag} if self.etag is not None else {'IfNoneMatch': '*'}
+            try:
+                response = self.s3.Object(self.bucket_name, self.manifest_name).put(Body=body, **condition)
+            except ClientError as e:
+                if e.response['Error']['Code'] not in self.CONFLICT_CODES or attempt == self.MAX_ATTEMPTS:
+                    self.logger.error(f"Failed to update manifest in S3 bucket {self.bucket_name}: {e}")
+                    raise
+                self.conflicts += 1
+                self.logger.warning(f"{self.manifest_name} was updated by another run, merging its updates "
+                                    f"(attempt {attempt}).")
+                self._merge()
+                continue
+            self.etag = response['ETag']
+            self.dirty = False
+            self._listed, self._removed, self._statuses, self._signatures, self._properties = {}, set(), {}, {}, {}
+            return
+
+    def apply_listing(self, prefixes: List[str], entries: List[dict], full: bool = False) -> dict:
+        """
+        Updates the rows under the listed prefixes to match a listing.
+
+        Args:
+            prefixes (List[str]): The prefixes that were listed. Rows under other prefixes are left untouched.
+            entries (List[dict]): The classified workbooks found under those prefixes, with the manifest columns
+                except `parse_status`.
+            full (bool, optional): Whether the listing covers the whole bucket. Rows under any other prefix, e.g.
+                a year folder that was deleted, are removed and the time of the listing is recorded. Defaults to False.
+
+        Returns:
+            dict: The number of `added`, `changed` and `removed` rows.
+        """
+        listed = {entry['key']: entry for entry in entries}
+        if full:
+            known = {key: (size, etag) for key, size, etag in self._connection.execute(
+                "SELECT key, size, etag FROM objects")}
+        else:
+            known = {}
+            for prefix in prefixes:
+                known.update((key, (size, etag)) for key, size, etag in self._connection.execute(
+                    "SELECT key, size, etag FROM objects WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)))
+
+        removed = [key for key in known if key not in listed]
+        added = [entry for key, entry in listed.items() if key not in known]
+        changed = [entry for key, entry in listed.items()
+                   if key in known and known[key] != (entry['size'], entry['etag'])]
+
+        listed_rows = [{**entry, 'last_modified': self._timestamp(entry['last_modified'])} for entry in added + changed]
+        properties = {'full_listing': datetime.datetime.now(datetime.timezone.utc).isoformat()} if full else {}
+        self._replay(listed_rows, removed, {}, {}, properties)
+        self._listed.update((row['key'], row) for row in listed_rows)
+        self._removed.difference_update(row['key'] for row in listed_rows)
+        self._removed.update(removed)
+        self._properties.update(properties)
+        if full:
+            self.dirty = True
+
+        counts = {'added': len(added), 'changed': len(changed), 'removed': len(removed)}
+        if any(counts.values()):
+            self.dirty = True
+        self.logger.info(f"Manifest updated from {len(prefixes)} prefixes: {counts['added']} added, "
+                         f"{counts['changed']} changed, {counts['removed']} removed.")
+        return counts
+
+    def last_full_listing(self) -> datetime.datetime:
+        """
+        Returns when the whole bucket was last listed.
+
+        Returns:
+            datetime.datetime: The time of the last full listing, in UTC, or None if the bucket was never listed whole.
+        """
+        row = self._connection.execute("SELECT value FROM properties WHERE name = 'full_listing'").fetchone()
+        return datetime.datetime.fromisoformat(row[0]) if row is not None else None
+
+    def rows(self) -> List[dict]:
+        """
+        Returns every row of the manifest in key order.
+
+        Returns:
+            List[dict]: The manifest columns of each workbook.
+        """
+        cursor = self._connection.execute(f"SELECT {', '.join(self.COLUMNS)} FROM objects ORDER BY key")
+        rows = [dict(zip(self.COLUMNS, row)) for row in cursor]
+        for row in rows:
+            if row['last_modified'] is not None:
+                row['last_modified'] = datetime.datetime.fromisoformat(row['last_modified'])
+        return rows
+
+    def set_parse_status(self, key: str, status: str):
+        """
+        Records the parse status of a workbook.
+
+        Args:
+            key (str): The S3 key of the workbook.
+            status (str): The new status, e.g. 'loaded' or 'empty'.
+        """
+        row = self._connection.execute("SELECT etag, parse_status FROM objects WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] == status:
+            return
+        with self._connection:
+            self._connection.execute("UPDATE objects SET parse_status = ? WHERE key = ?", (status, key))
+        self._statuses[key] = (status, row[0])
+        self.dirty = True
+
+    def signature(self, key: str, etag: str) -> dict:
+        """
+        Returns the template stored for a version of a workbook.
+
+        Args:
+            key (str): The S3 key of the workbook.
+            etag (str): The ETag of the version.
+
+        Returns:
+            dict: The stored template, or None if that version was not detected yet.
+        """
+        row = self._connection.execute(
+            "SELECT signature FROM objects WHERE key = ? AND etag IS ?", (key, etag)).fetchone()
+        return json.loads(row[0]) if row is not None and row[0] is not None else None
+
+    def set_signature(self, key: str, etag: str, signature: dict):
+        """
+        Stores the template detected for a version of a workbook, and its format when it was recognised.
+        Nothing is stored if the manifest holds another version of it.
+
+        Args:
+            key (str): The S3 key of the workbook.
+            etag (str): The ETag of the version that was detected.
+            signature (dict): The template, as JSON serializable values, with its `file_format`.
+        """
+        value = json.dumps(signature)
+        with self._connection:
+            updated = self._connection.execute(
+                "UPDATE objects SET signature = ?, file_format = coalesce(?, file_format) "
+                "WHERE key = ? AND etag IS ? AND signature IS NOT ?",
+                (value, signature.get('file_format'), key, etag, value))
+        if updated.rowcount:
+            self._signatures[key] = (value, etag)
+            self.dirty = True
+
+    def is_empty(self) -> bool:
+        """
+        Checks if the manifest holds no workbook.
+
+        Returns:
+            bool: True if the manifest has no row.
+        """
+        return self._connection.execute("SELECT 1 FROM objects LIMIT 1").fetchone() is None
+
+    def _merge(self):
+        # Read the version in S3 and replay the updates of this run on it
+        self.load()
+        self._replay(list(self._listed.values()), self._removed, self._statuses, self._signatures, self._properties)
+        self.logger.info(f"Merged {len(self._listed) + len(self._removed) + len(self._statuses)} updated workbooks "
+                         f"into the latest {self.manifest_name}.")
+
+    def _replay(self, listed: List[dict], removed, statuses: dict, signatures: dict, properties: dict):
+        # A listed workbook goes back to 'pending', and its template is dropped, unless the manifest already
+        # holds that version of it
+        with self._connection:
+            self._connection.executemany("DELETE FROM objects WHERE key = ?", [(key,) for key in removed])
+            self._connection.executemany(
+                "INSERT INTO objects (key, year, week, file_format, size, etag, last_modified, parse_status) "
+                "VALUES (:key, :year, :week, :file_format, :size, :etag, :last_modified, 'pending') "
+                "ON CONFLICT(key) DO UPDATE SET year = excluded.year, week = excluded.week, "
+                "file_format = CASE "
+                "WHEN objects.etag IS excluded.etag AND objects.size IS excluded.size THEN objects.file_format "
+                "ELSE excluded.file_format END, size = excluded.size, etag = excluded.etag, "
+                "last_modified = excluded.last_modified, parse_status = CASE "
+                "WHEN objects.etag IS excluded.etag AND objects.size IS excluded.size THEN objects.parse_status "
+                "ELSE 'pending' END, signature = CASE "
+                "WHEN objects.etag IS excluded.etag AND objects.size IS excluded.size THEN objects.signature "
+                "ELSE NULL END", listed)
+            self._connection.executemany(
+                "UPDATE objects SET parse_status = ? WHERE key = ? AND etag IS ?",
+                [(status, key, etag) for key, (status, etag) in statuses.items()])
+            self._connection.executemany(
+                "UPDATE objects SET signature = ?, file_format = coalesce(?, file_format) WHERE key = ? AND etag IS ?",
+                [(signature, json.loads(signature).get('file_format'), key, etag)
+                 for key, (signature, etag) in signatures.items()])
+            self._connection.executemany(
+                "INSERT INTO properties (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = excluded.value", list(properties.items()))
+
+    @staticmethod
+    def _timestamp(value) -> str:
+        return value.isoformat() if hasattr(value, 'isoformat') else value
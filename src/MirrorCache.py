@@ -0,0 +1,174 @@
+
+import boto3
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from botocore.exceptions import ClientError
+
+class MirrorCache:
+    """
+    A size-bounded local mirror of the raw workbooks stored in S3.
+
+    Each workbook is stored once per S3 key and ETag, so a new version of an object is fetched again while
+    unchanged objects are served from disk. Cached files are read through memory maps and evicted in least
+    recently used order once the cache grows beyond `max_bytes`. The access order is kept in the file
+    modification times, so it survives between runs and reprocessing the archive on the same machine
+    costs no S3 GET after the first pass. An object replaced since the ETag given for it was listed is looked
+    up again, and its current version is mirrored.
+
+    Attributes:
+        s3 (boto3.resource): An S3 resource object to interact with AWS S3.
+        logger (logging.Logger): Logger instance for logging messages.
+        cache_dir (Path): Directory holding the cached workbooks.
+        max_bytes (int): Maximum total size in bytes of the cached workbooks.
+        entries (OrderedDict): Cached file names mapped to their size, least recently used first.
+        hits (int): Number of workbooks served from disk.
+        misses (int): Number of workbooks fetched from S3.
+        evictions (int): Number of workbooks removed to stay under `max_bytes`.
+
+    Methods:
+        __init__(s3: boto3.resource, logger: logging.Logger, cache_dir: str, max_bytes: int = 2 * 1024 ** 3):
+            Initializes the cache and indexes the workbooks already on disk.
+
+        open(bucket_name: str, key: str, etag: str = None) -> mmap.mmap:
+            Returns a read-only memory map of a workbook, fetching it from S3 on a miss.
+
+        stats() -> dict:
+            Returns the size and counters of the cache.
+    """
+    def __init__(self,
+                 s3: boto3.resource,
+                 logger: logging.Logger,
+                 cache_dir: str,
+                 max_bytes: int = 2 * 1024 ** 3):
+        """
+        Initializes the cache and indexes the workbooks already on disk.
+
+        Args:
+            s3 (boto3.resource): An S3 resource object to interact with AWS S3.
+            logger (logging.Logger): Logger instance for logging messages.
+            cache_dir (str): Directory holding the cached workbooks, created if missing.
+            max_bytes (int, optional): Maximum total size in bytes of the cached workbooks. Defaults to 2 GiB.
+        """
+        self.s3 = s3
+        self.logger = logger
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        files = sorted((path for path in self.cache_dir.iterdir() if path.is_file() and not path.name.startswith('.')),
+                       key=lambda path: path.stat().st_mtime)
+        self.entries = OrderedDict((path.name, path.stat().st_size) for path in files)
+        self._size = sum(self.entries.values())
+        self._evict()
+
+    def open(self, bucket_name: str, key: str, etag: str = None) -> mmap.mmap:
+        """
+        Returns a read-only memory map of a workbook, fetching it from S3 on a miss.
+
+        Args:
+            bucket_name (str): The name of the S3 bucket.
+            key (str): The S3 key of the workbook.
+            etag (str, optional): The ETag of the object, as returned by a bucket listing. If None, or if the
+                object was replaced since it was listed, the current one is looked up with a HEAD request.
+
+        Returns:
+            mmap.mmap: A read-only memory map of the workbook content. Empty objects and objects larger than
+                the cache are returned as bytes.
+        """
+        client = self.s3.meta.client
+        if etag is None:
+            etag = client.head_object(Bucket=bucket_name, Key=key)['ETag']
+        name = self._entry_name(bucket_name, key, etag)
+        path = self.cache_dir / name
+
+        with self._lock:
+            if name in self.entries and path.exists():
+                self.entries.move_to_end(name)
+                self.hits += 1
+                os.utime(path)
+                return self._map(path)
+
+        try:
+            response = client.get_object(Bucket=bucket_name, Key=key, IfMatch=etag)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('PreconditionFailed', '412'):
+                raise
+            self.logger.info(f"{key} was replaced since it was listed, mirroring its current version.")
+            return self.open(bucket_name, key, client.head_object(Bucket=bucket_name, Key=key)['ETag'])
+        with self._lock:
+            self.misses += 1
+        if response.get('ContentLength', 0) > self.max_bytes:
+            self.logger.warning(f"{key} is larger than the mirror cache, reading it from S3 without caching.")
+            return response['Body'].read()
+
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, prefix='.download-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                shutil.copyfileobj(response['Body'], tmp, 1024 * 1024)
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+            # Older versions of the same key can never be served again
+            prefix = name.split('.', 1)[0]
+            for stale in [entry for entry in self.entries if entry.startswith(prefix) and entry != name]:
+                self._remove(stale)
+            self._size += path.stat().st_size - self.entries.pop(name, 0)
+            self.entries[name] = path.stat().st_size
+            self._evict()
+            self.logger.debug(f"Mirrored {key} ({self.entries[name]} bytes), cache holds {self._size} bytes.")
+        return self._map(path)
+
+    def stats(self) -> dict:
+        """
+        Returns the size and counters of the cache.
+
+        Returns:
+            dict: `files`, `bytes`, `hits`, `misses` and `evictions`.
+        """
+        with self._lock:
+            return {
+                'files': len(self.entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    @staticmethod
+    def _entry_name(bucket_name: str, key: str, etag: str) -> str:
+        key_hash = hashlib.sha256(f'{bucket_name}/{key}'.encode('utf-8')).hexdigest()
+        return key_hash + '.' + etag.strip('"')
+
+    @staticmethod
+    def _map(path: Path):
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _remove(self, name: str):
+        self._size -= self.entries.pop(name)
+        try:
+            (self.cache_dir / name).unlink(missing_ok=True)
+        except OSError as e:  # The file may still be mapped on platforms that forbid deleting it
+            self.logger.debug(f"Could not remove {name} from the mirror cache: {e}")
+
+    def _evict(self):
+        # The most recent entry stays, even alone above the limit, since it is about to be read
+        while self._size > self.max_bytes and len(self.entries) > 1:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
@@ -4,6 +4,9 @@ from src.DataWrangler import DataWrangler
 from src.FileNameBuilder import FileNameBuilder
 from src.DataValidator import DataValidator
 from src.DataIngestor import DataIngestor
+from src.FilesTracker import WriteBehindTracker
+from src.WorkQueue import WorkQueue
+from src.FormatDetector import WorkbookSignature
 
 # from DataCollector import DataCollector
 # from DataWrangler import DataWrangler
@@ -11,6 +14,11 @@ from src.DataIngestor import DataIngestor
 # from DataValidator import DataValidator
 # from DataIngestor import DataIngestor
 
+from typing import Iterable
+import datetime
+import os
+import socket
+import uuid
 import pandas as pd
 from tqdm import tqdm
 from pathlib import Path
@@ -37,27 +45,77 @@ class ProcessHandler(DataWrangler, DataIngestor, DataCollector, DataValidator, F
         bucket_name (str): The name of the S3 bucket to interact with.
         table_name (str): The name of the PostgreSQL table to which data will be ingested.
         logger (logging.Logger): Logger instance for logging process information.
-        files_tracker_df (pd.DataFrame): DataFrame tracking processed files and their status.
+        files_tracker (WriteBehindTracker): Keyed store tracking processed files and their RDS load status,
+            written back to S3 every `checkpoint_files` loaded files or `checkpoint_seconds` seconds.
+        max_workers (int): Number of concurrent downloads used when collecting files from DANE.
+        async_crawl (bool): Whether DANE year pages are crawled concurrently and streamed into the downloads.
+        session (requests.Session): Pooled HTTP session used for every request to the DANE website.
+        incremental (bool): Whether only the most recent DANE years are crawled.
+        mirror_cache (MirrorCache): Local mirror of the workbooks read from S3, None when disabled.
+        replace_on_load (set): Names of the files whose rows may already be in the table, left in flight by a run
+            that stopped or loaded by this handler. Their rows are deleted before they are loaded again.
+        run_id (str): Identifier of this run, recorded as the owner of the files it marks in flight.
+        IN_FLIGHT_TIMEOUT (datetime.timedelta): Age after which a file marked in flight by another run is taken
+            as left behind by a run that stopped, and its rows are replaced.
 
     Methods:
-        __init__(self, s3, engine, bucket_name, table_name, logger):
+        __init__(self, s3, engine, bucket_name, table_name, logger, max_workers=1, async_crawl=False, pool_size=10,
+                 incremental=False, cache_dir=None, tracker_backend='sqlite', checkpoint_files=50,
+                 checkpoint_seconds=60.0, excel_engine='standard', parse_workers=1):
             Initializes the ProcessHandler with necessary attributes and loads the file tracker.
 
         executing_process(self, output_dataframe: bool = False) -> pd.DataFrame:
             Executes the data processing workflow, including data extraction, transformation, validation, and ingestion.
 
+        rds_load_status(self) -> dict:
+            Returns the RDS load status of every tracked file, read from the files tracker in one pass.
+
         update_files_tracker_with_rds_load(self, file_name: str):
-            Updates the file tracker in S3 with the status of files loaded into the RDS.
+            Records the RDS load of a file in the files tracker, written back to S3 in batches.
+
+        mark_in_flight(self, file_names: Iterable[str], rds_status: dict, leased: bool = False) -> set:
+            Records the files about to be loaded as in flight, before any of their rows is inserted.
+
+        release_in_flight(self):
+            Clears the in flight mark of the files this run marked but did not load.
+
+        parse_file(self, file_path: str, default_format: int = None) -> tuple:
+            Extracts, transforms and validates a file with the parser of its detected template.
+
+        validated(self, signature: WorkbookSignature, dataframe: pd.DataFrame) -> tuple:
+            Validates the data parsed from a workbook.
+
+        process_queue(self, work_queue: WorkQueue, batch_size: int = 1, enqueue: bool = True) -> dict:
+            Processes the workbooks of a work queue shared with other workers, until none is left to claim.
+
+        load_into_db(self, file_path: str, dataframe: pd.DataFrame, work_queue: WorkQueue = None) -> bool:
+            Inserts the rows of a file into the database and records the load in the files tracker.
+
+        delete_previous_load(self, file_path: str, connection: sqlalchemy.engine.Connection = None):
+            Deletes the rows of a file already in the database, e.g. left by a run that stopped before recording it.
 
         querying_db(self, query: str) -> pd.DataFrame:
             Executes a query on the PostgreSQL database and returns the result as a DataFrame.
     """
+
+    IN_FLIGHT_TIMEOUT = datetime.timedelta(hours=12)
+
     def __init__(self, 
                  s3:boto3.resource, 
                  engine:sqlalchemy.engine.base.Engine, 
                  bucket_name:str, 
                  table_name:str, 
-                 logger:logging.Logger):
+                 logger:logging.Logger,
+                 max_workers:int = 1,
+                 async_crawl:bool = False,
+                 pool_size:int = 10,
+                 incremental:bool = False,
+                 cache_dir:str = None,
+                 tracker_backend:str = 'sqlite',
+                 checkpoint_files:int = 50,
+                 checkpoint_seconds:float = 60.0,
+                 excel_engine:str = 'standard',
+                 parse_workers:int = 1):
         """
         Initializes the ProcessHandler with necessary resources and configurations.
 
@@ -67,14 +125,35 @@ class ProcessHandler(DataWrangler, DataIngestor, DataCollector, DataValidator, F
             bucket_name (str): The name of the S3 bucket.
             table_name (str): The name of the table in the PostgreSQL database.
             logger (logging.Logger): Logger instance for logging information.
+            max_workers (int, optional): Number of concurrent downloads used when collecting files. Defaults to 1.
+            async_crawl (bool, optional): Crawl year pages concurrently and stream them into the downloads. Defaults to False.
+            pool_size (int, optional): Number of keep-alive connections kept open to the DANE website. Defaults to 10.
+            incremental (bool, optional): Only crawl the current and previous year, skipping years already complete
+                in the tracker. Defaults to False.
+            cache_dir (str, optional): Directory of the local mirror of the workbooks, so reprocessing does not
+                download them from S3 again. Defaults to None (no mirror).
+            tracker_backend (str, optional): Storage of the files tracker, 'sqlite', 'csv' or 'postgres'. The SQLite
+                tracker is indexed on the file name and imports files_tracker.csv on first use. The 'postgres' tracker
+                is a table of the target database, updated in the transaction loading each file. Defaults to 'sqlite'.
+            checkpoint_files (int, optional): Number of loaded files after which the files tracker is written back
+                to S3. Defaults to 50.
+            checkpoint_seconds (float, optional): Time in seconds after which loaded files are recorded in S3
+                even if fewer than `checkpoint_files` were loaded, and after which the tracker is read again for
+                files loaded by other runs. Defaults to 60.
+            excel_engine (str, optional): Excel reader, 'calamine' (requires python-calamine) or 'standard'
+                (openpyxl for xlsx, xlrd for xls files). Defaults to 'standard'.
+            parse_workers (int, optional): Number of processes parsing workbooks in executing_process, None for
+                one per available CPU. More than one is experimental. Defaults to 1 (parsed in this process).
 
         Initializes the base classes and sets up the files tracker.
         """
         # Initialize DataCollector and other base classes
         
-        DataCollector.__init__(self, s3, logger)
+        DataCollector.__init__(self, s3, logger, max_workers, async_crawl, pool_size, incremental=incremental,
+                               tracker_backend=tracker_backend)
         DataIngestor.__init__(self, engine, logger)
-        DataWrangler.__init__(self, bucket_name, s3, logger)
+        DataWrangler.__init__(self, bucket_name, s3, logger, cache_dir=cache_dir, excel_engine=excel_engine,
+                              parse_workers=parse_workers)
         DataValidator.__init__(self, logger)
         FileNameBuilder.__init__(self, s3, logger)
         # Set class attributes
@@ -84,12 +163,13 @@ class ProcessHandler(DataWrangler, DataIngestor, DataCollector, DataValidator, F
         self.table_name = table_name
         self.logger = logger
 
-        # Load files tracker after initializing the DataCollector
-        self.files_tracker_df = self.load_files_tracker(self.bucket_name)  
-        
-        # Ensure 'rds_load' column exists in the files_tracker_df
-        if 'rds_load' not in self.files_tracker_df.columns:
-            self.files_tracker_df['rds_load'] = 'no'
+        # Share the files tracker of the DataCollector, so files added by get_files are seen when processing,
+        # and write the RDS load statuses back in batches
+        self.files_tracker = WriteBehindTracker(self.tracker_store(self.bucket_name), logger,
+                                                max_pending=checkpoint_files, max_seconds=checkpoint_seconds)
+        self.replace_on_load = set()
+        self.run_id = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._in_flight = set()
         
 #         self.data_validator = DataValidator()  # Initialize the DataValidator
 
@@ -110,113 +190,341 @@ class ProcessHandler(DataWrangler, DataIngestor, DataCollector, DataValidator, F
         # Fetch all files from the S3 bucket
         self.get_files(self.bucket_name)
 
+        # Update the manifest with the years that received new files; both path methods read from it
+        inventory = self.bucket_inventory(self.bucket_name, refresh=True, years=self.updated_years)
+
         # Generate paths for the different file formats
         first_format_paths_aws = self.first_format_paths(bucket_name=self.bucket_name)
         second_format_paths_aws = self.second_format_paths(bucket_name=self.bucket_name)
 
-        first_format_final = pd.DataFrame()
-        self.logger.info('Started working on first batch of files')
+        # Index the S3 file names and the RDS load status of the tracked files once, for constant time lookups
+        first_format_names = {Path(f).name for f in first_format_paths_aws}
+        second_format_names = {Path(f).name for f in second_format_paths_aws}
+        rds_status = self.rds_load_status()
 
-        # Process files in the first format
-        for file_path in tqdm(first_format_paths_aws):
-            file_name = Path(file_path).name
+        # Record the files about to be loaded before inserting any row, so the next run knows what to clean up
+        busy = self.mark_in_flight((Path(f).name for f in first_format_paths_aws + second_format_paths_aws),
+                                   rds_status)
 
-            # Check if the file is already in the S3 bucket, if not, download it from SIPSA
-            if file_name not in [Path(f).name for f in first_format_paths_aws]:
-                self.logger.info(f"Downloading {file_name} from SIPSA webpage as it is not present in S3.")
-                self.download_file_from_sipsa(file_name)
+        # Write the tracker back every few loaded files, and whatever is pending when the run ends or fails
+        batches = (('first', 1, first_format_paths_aws, first_format_names),
+                   ('second', 2, second_format_paths_aws, second_format_names))
 
-            # Skip files already loaded into RDS
-            try:
-                if not self.files_tracker_df.empty and self.files_tracker_df.loc[self.files_tracker_df['file'] == file_name, 'rds_load'].values[0] == 'yes':
-                    self.logger.info(f"Skipping file {file_name} as it is already loaded into RDS.")
-                    continue
-            except: 
-                None
+        def files_to_parse():
+            # Files are checked right before they are handed to the parser, which only runs a few files ahead
+            for batch, path_format, paths_aws, names_aws in batches:
+                self.logger.info(f'Started working on {batch} batch of files')
+
+                for file_path in tqdm(paths_aws):
+                    file_name = Path(file_path).name
+
+                    # Check if the file is already in the S3 bucket, if not, download it from SIPSA
+                    if file_name not in names_aws:
+                        self.logger.info(f"Downloading {file_name} from SIPSA webpage as it is not present in S3.")
+                        self.download_file_from_sipsa(file_name)
+
+                    # Skip files already loaded into RDS
+                    if file_name not in rds_status:
+                        self.logger.info(f"{file_name} not found in the files tracker. Proceeding with processing.")
+                    elif rds_status[file_name] == 'yes':
+                        self.logger.info(f"Skipping file {file_name} as it is already loaded into RDS.")
+                        inventory.set_parse_status(file_path, 'loaded')
+                        continue
 
-            # Extract data from the first format file
-            dataframe = self.first_format_data_extraction(file_path)
-            if not dataframe.empty:
-                transformed_df = self.first_format_data_transformation(dataframe, file_path)
+                    # Skip files another run loaded and checkpointed since the tracker was read. The tracker is
+                    # looked up in memory, and only read from S3 again once per checkpoint window
+                    self.files_tracker.refresh()
+                    if (self.files_tracker.get(file_name) or {}).get('rds_load') == 'yes':
+                        self.logger.info(f"Skipping file {file_name} as another run loaded it into RDS.")
+                        inventory.set_parse_status(file_path, 'loaded')
+                        continue
+
+                    # Leave the files another live run is loading to that run
+                    if file_name in busy:
+                        self.logger.info(f"Skipping file {file_name} as another run is loading it into RDS.")
+                        continue
 
-                # Validate DataFrame before inserting into the database
-                valid_df = self.validate_dataframe(transformed_df)
+                    yield file_path, path_format
+
+        frames = []
+        try:
+            # Parse the files with the parser of their template (in parse_workers processes), in order
+            for file_path, signature, dataframe in self.parse_workbooks(files_to_parse()):
+                parsed = self.validated(signature, dataframe)
+                if parsed is None:
+                    inventory.set_parse_status(file_path, 'empty')
+                    continue
+                dataframe, valid_df = parsed
 
                 if output_dataframe:
-                    first_format_final = pd.concat([first_format_final, transformed_df], ignore_index=True)
+                    frames.append(dataframe)
 
                 # Insert into the database and update the tracker
-                self.insert_dataframe_to_db(dataframe=valid_df, table_name=self.table_name)
-                self.update_files_tracker_with_rds_load(file_name)  # Update tracker after successful load
+                self.load_into_db(file_path, valid_df)
+                inventory.set_parse_status(file_path, 'loaded')
+        finally:
+            # Files skipped, parsed empty or not reached are not in flight anymore
+            self.release_in_flight()
+            self.files_tracker.flush()
+
+            # Persist the parse statuses recorded in the manifest
+            inventory.save()
 
-        self.logger.info('Started working on second batch of files')
-        second_format_final = pd.DataFrame()
+        # Return the complete report if requested
+        if output_dataframe:
+            # Concatenated once, instead of copying the report for each file
+            complete_report = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            return complete_report
 
-        # Process files in the second format
-        for file_path in tqdm(second_format_paths_aws):
-            file_name = Path(file_path).name
 
-            # Check if the file is already in the S3 bucket, if not, download it from SIPSA
-            if file_name not in [Path(f).name for f in second_format_paths_aws]:
-                self.logger.info(f"Downloading {file_name} from SIPSA webpage as it is not present in S3.")
-                self.download_file_from_sipsa(file_name)
 
-            try:
-                if not self.files_tracker_df.empty and file_name in self.files_tracker_df['file'].values:
-                    if self.files_tracker_df.loc[self.files_tracker_df['file'] == file_name, 'rds_load'].values[0] == 'yes':
-                        self.logger.info(f"Skipping file {file_name} as it is already loaded into RDS.")
-                        continue
-                else:
-                    self.logger.info(f"{file_name} not found in the files tracker. Proceeding with processing.")
-            except IndexError:
-                self.logger.warning(f"IndexError encountered when checking RDS load status for {file_name}. Proceeding with processing.")
+    def parse_file(self, file_path: str, default_format: int = None) -> tuple:
+        """
+        Extracts, transforms and validates a file with the parser of its detected template.
 
-            # # Skip files already loaded into RDS
-            # if not self.files_tracker_df.empty and \
-            #         self.files_tracker_df.loc[self.files_tracker_df['file'] == file_name, 'rds_load'].values[0] == 'yes':
-            #     self.logger.info(f"Skipping file {file_name} as it is already loaded into RDS.")
-            #     continue
+        Args:
+            file_path (str): The S3 key of the file.
+            default_format (int, optional): The format assumed when the template is not recognised, e.g. the
+                one given by the path of the file. Defaults to None.
 
-            # Extract data from the second format file
-            dataframe = self.second_format_data_extraction(file_path)
+        Returns:
+            tuple: The parsed DataFrame and its validated version, or None if the workbook holds no data.
+        """
+        # Route the file to the parser of its template; the path only decides when it is not recognised
+        signature = self.workbook_signature(file_path, default_format=default_format)
+        return self.validated(signature, self.parse_workbook(file_path, signature))
 
-            # Validate DataFrame before inserting into the database
-            valid_df = self.validate_dataframe(dataframe)
+    def validated(self, signature: WorkbookSignature, dataframe: pd.DataFrame) -> tuple:
+        """
+        Validates the data parsed from a workbook.
 
-            # Insert into the database and update the tracker
-            self.insert_dataframe_to_db(dataframe=valid_df, table_name=self.table_name)
-            self.update_files_tracker_with_rds_load(file_name)  # Update tracker after successful load
+        Args:
+            signature (WorkbookSignature): The template the workbook was parsed with.
+            dataframe (pd.DataFrame): The parsed data.
 
-            if output_dataframe:
-                second_format_final = pd.concat([second_format_final, dataframe], ignore_index=True)
+        Returns:
+            tuple: The parsed DataFrame and its validated version, or None if a first format workbook holds no data.
+        """
+        if signature.file_format == 1 and dataframe.empty:
+            return None
+        return dataframe, self.validate_dataframe(dataframe)
 
-        # Return the complete report if requested
-        if output_dataframe:
-            complete_report = pd.concat([first_format_final, second_format_final], ignore_index=True)
-            return complete_report
+    def process_queue(self, work_queue: WorkQueue, batch_size: int = 1, enqueue: bool = True) -> dict:
+        """
+        Processes the workbooks of a work queue shared with other workers, until none is left to claim.
+
+        Each worker leases a few workbooks at a time and keeps its lease alive while parsing them. A workbook
+        whose lease was lost (expired and claimed by another worker) is not loaded. The rows of a workbook are
+        replaced when it is loaded again, and with the 'postgres' files tracker the load and its status commit
+        together, so no workbook is loaded twice. Workbooks that fail are retried by any worker, up to the
+        queue's maximum number of attempts.
 
+        Args:
+            work_queue (WorkQueue): The queue shared by the workers.
+            batch_size (int, optional): Number of workbooks leased at a time. Defaults to 1.
+            enqueue (bool, optional): Add the workbooks of the bucket inventory not loaded into RDS yet to the
+                queue first. Workbooks already queued are left as they are. Defaults to True.
 
+        Returns:
+            dict: The number of workbooks in each status of the queue once this worker stops.
+        """
+        inventory = self.bucket_inventory(self.bucket_name)
+        formats = {entry.key: entry.file_format for entry in inventory.entries}
+        rds_status = self.rds_load_status()
+        if enqueue:
+            work_queue.enqueue((entry.key for entry in inventory.entries if rds_status.get(Path(entry.key).name) != 'yes'),
+                               etags={entry.key: entry.etag for entry in inventory.entries})
+        # Workbooks are only loaded under their lease, so marks of other runs are never waited for
+        self.mark_in_flight((Path(entry.key).name for entry in inventory.entries), rds_status, leased=True)
+
+        processed = 0
+        try:
+            while True:
+                keys = work_queue.claim(batch_size)
+                if not keys:
+                    break
+                for key in keys:
+                    try:
+                        # The lease is renewed until the workbook is loaded, and checked in the loading transaction
+                        with work_queue.keep_alive(key):
+                            parsed = self.parse_file(key, default_format=formats.get(key))
+                            held = (work_queue.heartbeat(key) if parsed is None
+                                    else self.load_into_db(key, parsed[1], work_queue=work_queue))
+                        if not held:
+                            self.logger.warning(f"Lease of {key} lost before loading it, leaving it to its new worker.")
+                            continue
+                    except Exception as e:
+                        self.logger.error(f"Failed to process {key}: {e}")
+                        work_queue.fail(key, repr(e))
+                        continue
+                    if work_queue.complete(key):
+                        processed += 1
+        finally:
+            self.release_in_flight()
+            self.files_tracker.flush()
+
+            # Persist the templates detected in the manifest
+            inventory.save()
+
+        stats = work_queue.stats()
+        self.logger.info(f"Worker {work_queue.worker_id} processed {processed} workbooks, queue: {stats}.")
+        return stats
+
+    def rds_load_status(self) -> dict:
+        """
+        Returns the RDS load status of every tracked file, read from the files tracker in one pass.
+
+        Returns:
+            dict: File names mapped to their 'rds_load' value, None for files never loaded.
+        """
+        tracker_df = self.files_tracker.load()
+        if 'rds_load' not in tracker_df.columns:
+            return dict.fromkeys(tracker_df['file'])
+        return {file_name: (status if isinstance(status, str) else None)
+                for file_name, status in zip(tracker_df['file'], tracker_df['rds_load'])}
 
     def update_files_tracker_with_rds_load(self, file_name: str):
         """
         Updates the 'rds_load' status in the files tracker to 'yes' after successful insertion into the RDS.
 
+        The tracker is written back to S3 every `checkpoint_files` files or `checkpoint_seconds` seconds, and
+        at the end of `executing_process`.
+
         Args:
             file_name (str): The name of the file to update in the files tracker.
 
         Returns:
             None
         """
-        # Check if the file is already present in the tracker and update it
-        if file_name in self.files_tracker_df['file'].values:
-            self.files_tracker_df.loc[self.files_tracker_df['file'] == file_name, 'rds_load'] = 'yes'
-        else:
-            # If not present, add a new entry
-            new_entry = pd.DataFrame({'file': [file_name], 'rds_load': ['yes']})
-            self.files_tracker_df = pd.concat([self.files_tracker_df, new_entry], ignore_index=True)
-        
-        # Update the tracker in S3
-        self.update_files_tracker(self.files_tracker_df, self.bucket_name)
+        # Update the row of the file, or add it if it is not tracked yet
+        self.files_tracker.upsert(file_name, rds_load='yes')
+
+        # Update the tracker in S3 once the checkpoint window is full
+        self.files_tracker.checkpoint()
+
+    def mark_in_flight(self, file_names: Iterable[str], rds_status: dict, leased: bool = False) -> set:
+        """
+        Records the files about to be loaded as in flight, before any of their rows is inserted.
+
+        Loads are written to the files tracker in batches, so a run that stops may leave rows of files whose
+        load was never recorded. The files not loaded yet are marked 'pending' in a single tracker write ahead
+        of the inserts, with the id of this run and the time of the mark. A later run finds the files whose mark
+        is older than `IN_FLIGHT_TIMEOUT` still pending and replaces their rows, while files marked recently by
+        another run are left to it. The rows of every other file are inserted without looking for a previous
+        load. A database tracker records each load in the transaction inserting its rows, so nothing is marked.
+
+        Args:
+            file_names (Iterable[str]): The names of the files about to be loaded.
+            rds_status (dict): The RDS load status of the tracked files, as returned by `rds_load_status`.
+            leased (bool, optional): The files are only loaded under a lease of a work queue, so a pending file
+                is never loaded by another worker at the same time. Defaults to False.
+
+        Returns:
+            set: The names of the files another live run is loading, to be skipped.
+        """
+        stale_before = datetime.datetime.now(datetime.timezone.utc) - self.IN_FLIGHT_TIMEOUT
+        left_in_flight, busy = set(), set()
+        for file_name, status in rds_status.items():
+            if status != 'pending':
+                continue
+            row = self.files_tracker.get(file_name) or {}
+            owner, started = row.get('load_owner'), row.get('load_started')
+            if not leased and isinstance(owner, str) and owner != self.run_id and isinstance(started, str) \
+                    and datetime.datetime.fromisoformat(started) > stale_before:
+                busy.add(file_name)
+            else:
+                left_in_flight.add(file_name)
+        if left_in_flight:
+            self.logger.info(f"{len(left_in_flight)} files were left in flight by a previous run, "
+                             f"their rows will be replaced.")
+        if busy:
+            self.logger.info(f"{len(busy)} files are being loaded by another run, they will be skipped.")
+        self.replace_on_load.update(left_in_flight)
+        if self.files_tracker.transactional:
+            return busy
+
+        started = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        for file_name in file_names:
+            if rds_status.get(file_name) != 'yes' and file_name not in busy:
+                self.files_tracker.upsert(file_name, rds_load='pending', load_owner=self.run_id, load_started=started)
+                self._in_flight.add(file_name)
+        self.files_tracker.flush()
+        return busy
+
+    def release_in_flight(self):
+        """
+        Clears the in flight mark of the files this run marked but did not start loading, e.g. skipped, parsed
+        empty or failed to parse, so later runs do not replace rows they never had. Files whose insert failed
+        keep their mark, as do files taken over by another run.
+        """
+        for file_name in self._in_flight:
+            row = self.files_tracker.get(file_name) or {}
+            if row.get('rds_load') == 'pending' and row.get('load_owner') == self.run_id:
+                self.files_tracker.upsert(file_name, rds_load='no')
+        self._in_flight.clear()
+
+    def load_into_db(self, file_path: str, dataframe: pd.DataFrame, work_queue: WorkQueue = None) -> bool:
+        """
+        Inserts the rows of a file into the database and records the load in the files tracker.
+
+        The rows are stored with the S3 key of their file. Only files that may already have rows in the table
+        (see `replace_on_load`) have them deleted first, with a lookup on the indexed `source_file` column.
+        With a tracker living in the database, the previous rows of the file are deleted, the new rows inserted
+        and the load recorded in a single transaction, so a file is loaded exactly once even if the run stops.
+        Otherwise the load is recorded after the insert and written to S3 at the next checkpoint.
+
+        A file leased from a work queue is only loaded while this worker holds its lease: the lease is renewed
+        in the transaction inserting the rows, which keeps the queue row locked until they are committed.
+
+        Args:
+            file_path (str): The S3 key of the file.
+            dataframe (pd.DataFrame): The validated rows of the file.
+            work_queue (WorkQueue, optional): The queue the file was leased from, stored in the same database.
+                Defaults to None.
+
+        Returns:
+            bool: False if the lease of the file was lost and nothing was loaded.
+        """
+        file_name = Path(file_path).name
+        replace = file_name in self.replace_on_load
+        # Once rows may be inserted the file stays in flight until its load is recorded
+        self._in_flight.discard(file_name)
+        if not self.files_tracker.transactional and work_queue is None:
+            if replace:
+                self.delete_previous_load(file_path)
+            self.insert_dataframe_to_db(dataframe=dataframe, table_name=self.table_name, source_file=file_path)
+            self.replace_on_load.add(file_name)
+            self.update_files_tracker_with_rds_load(file_name)  # Update tracker after successful load
+            return True
+
+        with self.engine.begin() as connection:
+            if work_queue is not None and not work_queue.heartbeat(file_path, connection=connection):
+                return False
+            if replace:
+                self.delete_previous_load(file_path, connection=connection)
+            self.insert_dataframe_to_db(dataframe=dataframe, table_name=self.table_name, connection=connection,
+                                        source_file=file_path)
+            if self.files_tracker.transactional:
+                self.files_tracker.upsert_in_transaction(connection, file_name, rds_load='yes')
+        self.replace_on_load.add(file_name)
+        if not self.files_tracker.transactional:
+            self.update_files_tracker_with_rds_load(file_name)
+        return True
+
+    def delete_previous_load(self, file_path: str, connection: sqlalchemy.engine.Connection = None):
+        """
+        Deletes the rows of a file already in the database, e.g. left by a run that stopped before recording
+        the load, so they are replaced instead of duplicated.
+
+        The rows are found by the S3 key of the file they were loaded from, in the indexed `source_file` column,
+        so files of different year folders with the same year and week in their names are told apart. Rows
+        loaded before the column existed have no key and are left as they are.
+
+        Args:
+            file_path (str): The S3 key of the file about to be loaded.
+            connection (sqlalchemy.engine.Connection, optional): The transaction loading the file. Defaults to None.
+        """
+        self.delete_rows(self.table_name, connection=connection, source_file=file_path)
 
     def querying_db(self, query: str) -> pd.DataFrame:
         """
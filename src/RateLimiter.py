@@ -0,0 +1,296 @@
+
+import logging
+import random
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+class RateLimiter:
+    """
+    A token-bucket rate limiter combined with an adaptive concurrency controller.
+
+    Every request to the DANE website takes a concurrency slot and a token before it is sent. Tokens are
+    refilled at `rate` per second, and at most `concurrency` requests are in flight at the same time.
+    Both limits follow an additive-increase / multiplicative-decrease policy: they are halved when the
+    server answers 429 or 503, or when the latency of a request rises well above its running average,
+    and they grow back step by step while requests keep succeeding. This keeps the collector at the
+    highest throughput the website tolerates without getting blocked.
+
+    Attributes:
+        logger (logging.Logger): Logger instance for logging messages.
+        rate (float): Current number of requests allowed per second.
+        min_rate (float): Lowest rate the controller can back off to.
+        max_rate (float): Highest rate the controller can ramp up to.
+        concurrency (int): Current number of requests allowed in flight.
+        min_concurrency (int): Lowest concurrency the controller can back off to.
+        max_concurrency (int): Highest concurrency the controller can ramp up to.
+        latency_factor (float): A request slower than this multiple of the average latency triggers a back off.
+        cooldown (float): Minimum number of seconds between two back offs.
+        in_flight (int): Number of requests currently in flight.
+        peak_in_flight (int): Highest number of requests in flight observed.
+        requests (int): Number of completed requests.
+        throttled (int): Number of 429/503 answers received.
+        backoff_events (int): Number of times the limits were decreased.
+        latency_ewma (float): Exponentially weighted moving average of the request latency in seconds.
+
+    Methods:
+        __init__(logger: logging.Logger, rate: float = 5.0, min_rate: float = 0.5, max_rate: float = 20.0,
+                 max_concurrency: int = 8, min_concurrency: int = 1, latency_factor: float = 3.0, cooldown: float = 1.0):
+            Initializes the rate limiter.
+
+        acquire():
+            Blocks until a concurrency slot and a token are available.
+
+        release(status_code: int, latency: float):
+            Frees a concurrency slot and adapts the limits to the outcome of the request.
+
+        stats() -> dict:
+            Returns the current limits and counters.
+    """
+    THROTTLE_STATUS_CODES = (429, 503)
+
+    def __init__(self,
+                 logger: logging.Logger,
+                 rate: float = 5.0,
+                 min_rate: float = 0.5,
+                 max_rate: float = 20.0,
+                 max_concurrency: int = 8,
+                 min_concurrency: int = 1,
+                 latency_factor: float = 3.0,
+                 cooldown: float = 1.0):
+        """
+        Initializes the rate limiter.
+
+        Concurrency starts at half of `max_concurrency` and ramps up from there.
+
+        Args:
+            logger (logging.Logger): Logger instance for logging messages.
+            rate (float, optional): Initial number of requests per second. Defaults to 5.0.
+            min_rate (float, optional): Lowest rate reachable by backing off. Defaults to 0.5.
+            max_rate (float, optional): Highest rate reachable by ramping up. Defaults to 20.0.
+            max_concurrency (int, optional): Highest number of requests in flight. Defaults to 8.
+            min_concurrency (int, optional): Lowest number of requests in flight. Defaults to 1.
+            latency_factor (float, optional): Latency multiple of the running average considered congestion. Defaults to 3.0.
+            cooldown (float, optional): Minimum number of seconds between two back offs. Defaults to 1.0.
+        """
+        self.logger = logger
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.concurrency = max(self.min_concurrency, self.max_concurrency // 2)
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.backoff_events = 0
+        self.latency_ewma = None
+
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._last_backoff = float('-inf')
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Blocks until a concurrency slot and a token are available.
+        """
+        with self._condition:
+            while self.in_flight >= self.concurrency:
+                self._condition.wait()
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+            while True:
+                now = time.monotonic()
+                # The bucket holds a single token: requests are paced, never sent in bursts
+                self._tokens = min(1.0, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                self._condition.wait((1.0 - self._tokens) / self.rate)
+
+    def release(self, status_code: int, latency: float):
+        """
+        Frees a concurrency slot and adapts the limits to the outcome of the request.
+
+        Args:
+            status_code (int): The HTTP status of the answer, or None if the request failed.
+            latency (float): The time in seconds until the answer headers were received.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            self.requests += 1
+
+            if status_code in self.THROTTLE_STATUS_CODES:
+                self.throttled += 1
+                self._back_off(f"HTTP {status_code}")
+            elif self.latency_ewma is not None and latency > self.latency_factor * self.latency_ewma:
+                self._back_off(f"latency {latency:.2f}s vs {self.latency_ewma:.2f}s average")
+            elif status_code is not None and status_code < 500:
+                self._ramp_up()
+
+            self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """
+        Returns the current limits and counters.
+
+        Returns:
+            dict: `rate`, `concurrency`, `in_flight`, `peak_in_flight`, `requests`, `throttled` and `backoff_events`.
+        """
+        with self._condition:
+            return {
+                'rate': self.rate,
+                'concurrency': self.concurrency,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'backoff_events': self.backoff_events,
+            }
+
+    def _back_off(self, reason: str):
+        now = time.monotonic()
+        self._successes = 0
+        if now - self._last_backoff < self.cooldown:
+            return
+        self._last_backoff = now
+        self.backoff_events += 1
+        self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.logger.warning(f"Backing off ({reason}): rate {self.rate:.2f} req/s, concurrency {self.concurrency}, "
+                            f"{self.in_flight} in flight, {self.backoff_events} backoff events.")
+
+    def _ramp_up(self):
+        self._successes += 1
+        if self._successes >= self.concurrency:
+            self._successes = 0
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            self.rate = min(self.max_rate, self.rate + 1.0)
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    An HTTP adapter sending every request through a RateLimiter.
+
+    For streamed responses the concurrency slot is held until the response is closed, so workbook
+    downloads count as in flight for as long as their body is being read.
+
+    Throttled GET and HEAD requests (429 or 503) are retried here rather than by the urllib3 Retry of the
+    adapter, so every attempt takes a token and reports its status and latency to the rate limiter, which
+    backs off as soon as the server pushes back. The wait honours the Retry-After header, and otherwise grows
+    exponentially with a random jitter.
+
+    Attributes:
+        rate_limiter (RateLimiter): The rate limiter governing the requests.
+        throttle_retries (int): Number of retries of a throttled request.
+        backoff_factor (float): Base delay in seconds between the retries of a throttled request.
+    """
+    RETRY_METHODS = ('GET', 'HEAD')
+    MAX_RETRY_AFTER = 120.0
+
+    def __init__(self, rate_limiter: RateLimiter, throttle_retries: int = 0, backoff_factor: float = 0.5, **kwargs):
+        """
+        Initializes the adapter.
+
+        Args:
+            rate_limiter (RateLimiter): The rate limiter governing the requests.
+            throttle_retries (int, optional): Number of retries of a throttled request. Defaults to 0.
+            backoff_factor (float, optional): Base delay in seconds between the retries of a throttled request.
+                Defaults to 0.5.
+            **kwargs: Passed on to requests.adapters.HTTPAdapter (pool sizes, retries). The Retry passed as
+                `max_retries` should not retry 429 and 503 answers, or its retries would bypass the rate limiter.
+        """
+        self.rate_limiter = rate_limiter
+        self.throttle_retries = throttle_retries
+        self.backoff_factor = backoff_factor
+        super().__init__(**kwargs)
+
+    def send(self, request, stream=False, **kwargs):
+        attempt = 0
+        while True:
+            response = self._send_limited(request, stream=stream, **kwargs)
+            if (response.status_code not in RateLimiter.THROTTLE_STATUS_CODES or attempt >= self.throttle_retries
+                    or request.method not in self.RETRY_METHODS):
+                return response
+            delay = self._throttle_delay(response, attempt)
+            response.close()
+            attempt += 1
+            time.sleep(delay)
+
+    def _throttle_delay(self, response, attempt: int) -> float:
+        retry_after = response.headers.get('Retry-After')
+        try:
+            return min(max(float(retry_after), 0.0), self.MAX_RETRY_AFTER)
+        except (TypeError, ValueError):
+            return self.backoff_factor * 2 ** attempt + random.uniform(0, self.backoff_factor)
+
+    def _send_limited(self, request, stream=False, **kwargs):
+        self.rate_limiter.acquire()
+        start = time.monotonic()
+        try:
+            response = super().send(request, stream=stream, **kwargs)
+        except Exception:
+            self.rate_limiter.release(None, time.monotonic() - start)
+            raise
+
+        latency = time.monotonic() - start
+        if not stream:
+            self.rate_limiter.release(response.status_code, latency)
+            return response
+
+        released = threading.Event()
+        close = response.close
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if not released.is_set():
+                    released.set()
+                    self.rate_limiter.release(response.status_code, latency)
+
+        response.close = close_and_release
+        return response
+
+
+class JitteredRetry(Retry):
+    """
+    A urllib3 Retry adding a random jitter to its exponential backoff, so retrying clients do not hit the server
+    in lockstep.
+
+    urllib3 only takes a `backoff_jitter` argument from version 2, while botocore pins urllib3 below 1.27 on
+    Python < 3.10. The jitter is added in `get_backoff_time`, which both versions call before each retry.
+
+    Attributes:
+        jitter (float): Upper bound in seconds of the random delay added to each backoff.
+    """
+    def __init__(self, *args, jitter: float = 0.0, **kwargs):
+        """
+        Initializes the retry policy.
+
+        Args:
+            *args: Passed on to urllib3.util.retry.Retry.
+            jitter (float, optional): Upper bound in seconds of the random delay added to each backoff. Defaults to 0.
+            **kwargs: Passed on to urllib3.util.retry.Retry.
+        """
+        self.jitter = jitter
+        super().__init__(*args, **kwargs)
+
+    def new(self, **kwargs):
+        # urllib3 creates a new Retry after each attempt, from the arguments it knows of
+        kwargs.setdefault('jitter', self.jitter)
+        return super().new(**kwargs)
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return backoff + random.uniform(0, self.jitter) if backoff > 0 else backoff
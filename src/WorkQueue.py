@@ -0,0 +1,272 @@
+
+from typing import Iterable, List
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import sqlalchemy
+
+class WorkQueue:
+    """
+    A queue of workbooks shared by several pipeline workers, stored as a table of a database.
+
+    Workers claim workbooks by taking a lease on them. A lease lasts `lease_seconds` and is renewed by a
+    heartbeat while the workbook is processed. A workbook whose lease expired (its worker died or stalled) can
+    be claimed by another worker. Claims are compare-and-set updates of a single row, so any number of worker
+    processes, on one host or several, never hold the same workbook at the same time. It works with PostgreSQL
+    for shared workers and with SQLite for local runs and tests.
+
+    Each row holds the key of a workbook, the ETag of the version queued, its status ('pending', 'leased',
+    'done' or 'failed'), the worker holding it, the expiry time of the lease, the number of attempts and the
+    last error. A workbook queued again with another ETag, i.e. republished, goes back to pending once no
+    worker holds it.
+
+    Attributes:
+        engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine of the queue database.
+        logger (logging.Logger): Logger instance for logging messages.
+        table_name (str): The name of the queue table.
+        lease_seconds (float): Duration of a lease without heartbeat.
+        max_attempts (int): Number of failed attempts after which a workbook is marked as failed.
+        worker_id (str): The identifier of this worker.
+
+    Methods:
+        __init__(engine, logger, table_name='work_queue', lease_seconds=300, max_attempts=3, worker_id=None):
+            Initializes the queue, creating its table if needed.
+
+        enqueue(keys: Iterable[str], etags: dict = None) -> int:
+            Adds workbooks to the queue, and queues again those republished since they were queued.
+
+        claim(limit: int = 1) -> List[str]:
+            Leases up to `limit` pending workbooks, or workbooks whose lease expired.
+
+        heartbeat(key: str, connection: sqlalchemy.engine.Connection = None) -> bool:
+            Renews the lease of a workbook held by this worker, within a transaction if given.
+
+        keep_alive(key: str):
+            Context manager renewing the lease of a workbook in the background while it is processed.
+
+        complete(key: str) -> bool:
+            Marks a workbook held by this worker as done.
+
+        fail(key: str, error: str) -> bool:
+            Releases a workbook held by this worker after a failure, to be retried or marked as failed.
+
+        stats() -> dict:
+            Returns the number of workbooks in each status.
+    """
+    def __init__(self,
+                 engine: sqlalchemy.engine.base.Engine,
+                 logger: logging.Logger,
+                 table_name: str = 'work_queue',
+                 lease_seconds: float = 300,
+                 max_attempts: int = 3,
+                 worker_id: str = None):
+        """
+        Initializes the queue, creating its table if needed.
+
+        Args:
+            engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine of the queue database.
+            logger (logging.Logger): Logger instance for logging messages.
+            table_name (str, optional): The name of the queue table. Defaults to 'work_queue'.
+            lease_seconds (float, optional): Duration of a lease without heartbeat. Defaults to 300.
+            max_attempts (int, optional): Number of failed attempts after which a workbook is marked as failed.
+                Defaults to 3.
+            worker_id (str, optional): The identifier of this worker. Defaults to the host name, process id and
+                a random suffix.
+        """
+        self.engine = engine
+        self.logger = logger
+        self.table_name = table_name
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._table = '"' + table_name.replace('"', '""') + '"'
+
+        with self.engine.begin() as connection:
+            connection.execute(sqlalchemy.text(f"""
+                CREATE TABLE IF NOT EXISTS {self._table} (
+                    key TEXT PRIMARY KEY,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    owner TEXT,
+                    lease_expires DOUBLE PRECISION,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    etag TEXT
+                )"""))
+            # Queues created before the ETag was recorded lack the column
+            if 'etag' not in [column['name'] for column in sqlalchemy.inspect(connection).get_columns(table_name)]:
+                connection.execute(sqlalchemy.text(f"ALTER TABLE {self._table} ADD COLUMN etag TEXT"))
+
+    def enqueue(self, keys: Iterable[str], etags: dict = None) -> int:
+        """
+        Adds workbooks to the queue, and queues again those republished since they were queued.
+
+        A workbook already in the queue is left as it is, whatever its status, unless it is given another ETag
+        than the one it was queued with: it then goes back to pending with no attempt, unless a worker holds it.
+        A leased workbook keeps its former ETag, so it is queued again by the next enqueue once released.
+
+        Args:
+            keys (Iterable[str]): The S3 keys of the workbooks.
+            etags (dict, optional): The ETag of each workbook, keyed by S3 key. Defaults to None (workbooks
+                already queued are never queued again).
+
+        Returns:
+            int: The number of workbooks added or queued again.
+        """
+        etags = etags or {}
+        added = 0
+        with self.engine.begin() as connection:
+            for key in keys:
+                result = connection.execute(sqlalchemy.text(
+                    f"INSERT INTO {self._table} (key, etag) VALUES (:key, :etag) ON CONFLICT (key) DO UPDATE SET "
+                    f"status = 'pending', etag = excluded.etag, owner = NULL, lease_expires = NULL, attempts = 0, "
+                    f"error = NULL WHERE excluded.etag IS NOT NULL AND {self._table}.status != 'leased' "
+                    f"AND ({self._table}.etag IS NULL OR {self._table}.etag != excluded.etag)"),
+                    {'key': key, 'etag': etags.get(key)})
+                added += result.rowcount
+        self.logger.info(f"Added {added} workbooks to the {self.table_name} queue.")
+        return added
+
+    def claim(self, limit: int = 1) -> List[str]:
+        """
+        Leases up to `limit` pending workbooks, or workbooks whose lease expired, in key order.
+
+        Args:
+            limit (int, optional): The maximum number of workbooks to lease. Defaults to 1.
+
+        Returns:
+            List[str]: The keys of the leased workbooks, empty when nothing is left to claim.
+        """
+        claimed = []
+        while len(claimed) < limit:
+            now = time.time()
+            with self.engine.connect() as connection:
+                candidates = [row[0] for row in connection.execute(sqlalchemy.text(
+                    f"SELECT key FROM {self._table} "
+                    f"WHERE status = 'pending' OR (status = 'leased' AND lease_expires < :now) "
+                    f"ORDER BY key LIMIT :limit"), {'now': now, 'limit': limit - len(claimed)})]
+            if not candidates:
+                break
+            for key in candidates:
+                # Only one worker can move a row out of the claimable states
+                with self.engine.begin() as connection:
+                    result = connection.execute(sqlalchemy.text(
+                        f"UPDATE {self._table} SET status = 'leased', owner = :owner, lease_expires = :expires, "
+                        f"attempts = attempts + 1 "
+                        f"WHERE key = :key AND (status = 'pending' OR (status = 'leased' AND lease_expires < :now))"),
+                        {'owner': self.worker_id, 'expires': now + self.lease_seconds, 'key': key, 'now': now})
+                if result.rowcount == 1:
+                    claimed.append(key)
+        if claimed:
+            self.logger.debug(f"Worker {self.worker_id} leased {len(claimed)} workbooks.")
+        return claimed
+
+    def heartbeat(self, key: str, connection: sqlalchemy.engine.Connection = None) -> bool:
+        """
+        Renews the lease of a workbook held by this worker.
+
+        Within the transaction of a connection to the queue database, the row of the workbook stays locked
+        until the transaction ends, so no other worker can claim it before, e.g., the rows of the workbook
+        inserted in that transaction are committed.
+
+        Args:
+            key (str): The S3 key of the workbook.
+            connection (sqlalchemy.engine.Connection, optional): A connection with an open transaction to renew
+                the lease in. Defaults to None (renewed in its own transaction).
+
+        Returns:
+            bool: False if the lease was lost, e.g. it expired and another worker claimed the workbook.
+        """
+        if connection is None:
+            with self.engine.begin() as connection:
+                return self.heartbeat(key, connection=connection)
+        result = connection.execute(sqlalchemy.text(
+            f"UPDATE {self._table} SET lease_expires = :expires "
+            f"WHERE key = :key AND status = 'leased' AND owner = :owner"),
+            {'expires': time.time() + self.lease_seconds, 'key': key, 'owner': self.worker_id})
+        return result.rowcount == 1
+
+    @contextmanager
+    def keep_alive(self, key: str):
+        """
+        Context manager renewing the lease of a workbook in the background while it is processed.
+
+        The lease is renewed every third of `lease_seconds`, so a worker busy on a large workbook keeps it,
+        while a worker that died stops renewing and its workbook is claimed again once the lease expires.
+
+        Args:
+            key (str): The S3 key of the workbook.
+        """
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    held = self.heartbeat(key)
+                except sqlalchemy.exc.OperationalError as e:
+                    # e.g. SQLite busy while the workbook is loaded, its lease is renewed by the load itself
+                    self.logger.warning(f"Worker {self.worker_id} could not renew the lease of {key}: {e}")
+                    continue
+                if not held:
+                    self.logger.warning(f"Worker {self.worker_id} lost the lease of {key}.")
+                    return
+
+        thread = threading.Thread(target=beat, name=f'lease-{key}', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, key: str) -> bool:
+        """
+        Marks a workbook held by this worker as done.
+
+        Args:
+            key (str): The S3 key of the workbook.
+
+        Returns:
+            bool: False if the lease was lost before completion.
+        """
+        return self._finish(key, "status = 'done', owner = NULL, lease_expires = NULL, error = NULL", {})
+
+    def fail(self, key: str, error: str) -> bool:
+        """
+        Releases a workbook held by this worker after a failure. It goes back to pending to be retried by any
+        worker, or is marked as failed after `max_attempts` attempts.
+
+        Args:
+            key (str): The S3 key of the workbook.
+            error (str): A description of the failure.
+
+        Returns:
+            bool: False if the lease was lost before the failure was recorded.
+        """
+        return self._finish(key, "status = CASE WHEN attempts >= :max_attempts THEN 'failed' ELSE 'pending' END, "
+                                 "owner = NULL, lease_expires = NULL, error = :error",
+                            {'max_attempts': self.max_attempts, 'error': str(error)[:1000]})
+
+    def stats(self) -> dict:
+        """
+        Returns the number of workbooks in each status.
+
+        Returns:
+            dict: Statuses mapped to their number of workbooks.
+        """
+        with self.engine.connect() as connection:
+            rows = connection.execute(sqlalchemy.text(f"SELECT status, COUNT(*) FROM {self._table} GROUP BY status"))
+            return {status: count for status, count in rows}
+
+    def _finish(self, key: str, assignments: str, parameters: dict) -> bool:
+        with self.engine.begin() as connection:
+            result = connection.execute(sqlalchemy.text(
+                f"UPDATE {self._table} SET {assignments} WHERE key = :key AND status = 'leased' AND owner = :owner"),
+                {**parameters, 'key': key, 'owner': self.worker_id})
+        if result.rowcount != 1:
+            self.logger.warning(f"Worker {self.worker_id} no longer holds the lease of {key}.")
+            return False
+        return True
@@ -0,0 +1,190 @@
+
+from typing import List, Sequence, Tuple, Union
+import io
+import logging
+import mmap
+import pandas as pd
+
+try:
+    import python_calamine
+except ImportError:  # python-calamine is optional, openpyxl and xlrd are used when it is missing
+    python_calamine = None
+
+# The readers of each container, as sniffed from the magic bytes by FormatDetector.container
+STANDARD_ENGINES = {
+    'xlsx': ('openpyxl',),
+    'xls': ('xlrd',),
+    'unknown': ('openpyxl', 'xlrd'),
+}
+EXCEL_ENGINES = ('calamine', 'standard')
+
+
+def excel_engines(container: str, engine: str = 'standard') -> Tuple[str, ...]:
+    """
+    Returns the pandas engines to read a workbook with, in the order to try them.
+
+    The standard readers are picked from the container: openpyxl for xlsx (ZIP) files and xlrd for xls (OLE2)
+    files, so legacy files do not pay for a failed openpyxl parse. Both are tried when the container is unknown.
+    The Rust-backed calamine reader handles both containers, the standard reader follows it in case it fails.
+    Calamine is opt-in: it has not been checked against the whole SIPSA archive, so the standard readers,
+    which the parsers were written against, stay the default even when python-calamine is installed.
+
+    Args:
+        container (str): 'xlsx', 'xls' or 'unknown'.
+        engine (str, optional): 'calamine' or 'standard'. Defaults to 'standard'.
+
+    Returns:
+        Tuple[str, ...]: The names of the pandas engines.
+
+    Raises:
+        ValueError: If the engine is unknown.
+        ImportError: If the calamine engine is requested without python-calamine installed.
+    """
+    if engine not in EXCEL_ENGINES:
+        raise ValueError(f"Unknown Excel engine {engine}, expected one of {sorted(EXCEL_ENGINES)}")
+    standard = STANDARD_ENGINES.get(container, STANDARD_ENGINES['unknown'])
+    if engine == 'calamine':
+        if python_calamine is None:
+            raise ImportError("python-calamine is required by the calamine Excel engine")
+        return ('calamine',) + standard
+    return standard
+
+
+def workbook_stream(data) -> io.RawIOBase:
+    """
+    Returns a seekable stream over the content of a workbook, without copying it.
+
+    A memory map is read in place, so a workbook served by the mirror cache is parsed from the page cache
+    instead of being copied into memory first. Bytes are wrapped in a BytesIO, which shares their buffer.
+
+    Args:
+        data (Union[bytes, mmap.mmap]): The content of the workbook.
+
+    Returns:
+        io.RawIOBase: A stream positioned at the start of the workbook.
+    """
+    if isinstance(data, mmap.mmap):
+        return _MappedWorkbook(data)
+    return io.BytesIO(data)
+
+
+class _MappedWorkbook(io.RawIOBase):
+    # A read-only file over a memory map, with its own position: a map is no file object to the readers
+    # before Python 3.13 (no seekable), and the detector and the parser each read it from the start
+    def __init__(self, data: mmap.mmap):
+        super().__init__()
+        self._data = data
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        chunk = self._data[self._position:self._position + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def readall(self) -> bytes:
+        chunk = self._data[self._position:]
+        self._position += len(chunk)
+        return chunk
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._data)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+class WorkbookSession:
+    """
+    A workbook opened once, handing out its sheets as DataFrames on demand.
+
+    `pd.read_excel` decompresses and parses the whole workbook (shared strings, styles and sheet index) on every
+    call, so reading the eight food class sheets of a second format workbook one call at a time parses it eight
+    times. A session opens the workbook once and parses each sheet only when it is requested, from the same
+    parsed workbook.
+
+    Attributes:
+        logger (logging.Logger): Logger instance for logging messages.
+        file_path (str): The path of the workbook, used in log messages.
+        engine (str): The pandas engine that opened the workbook.
+
+    Methods:
+        __init__(data: bytes, logger: logging.Logger, file_path: str = None, engines: Sequence[str] = ('openpyxl', 'xlrd')):
+            Opens a workbook with the first engine able to read it.
+
+        sheet_names -> List[str]:
+            The names of the sheets of the workbook.
+
+        sheet(sheet: Union[int, str], **kwargs) -> pd.DataFrame:
+            Parses a sheet of the workbook.
+
+        close():
+            Releases the workbook.
+    """
+    ENGINES = ('openpyxl', 'xlrd')
+
+    def __init__(self, data: bytes, logger: logging.Logger, file_path: str = None, engines: Sequence[str] = ENGINES):
+        """
+        Opens a workbook with the first engine able to read it.
+
+        Args:
+            data (bytes): The content of the workbook (bytes or a memory map).
+            logger (logging.Logger): Logger instance for logging messages.
+            file_path (str, optional): The path of the workbook, used in log messages. Defaults to None.
+            engines (Sequence[str], optional): The pandas engines to try, in order. Defaults to openpyxl, then xlrd.
+
+        Raises:
+            ValueError: If no engine can read the workbook.
+        """
+        self.logger = logger
+        self.file_path = file_path
+        self.engine = None
+        self._book = None
+        for engine in engines:
+            try:
+                self._book = pd.ExcelFile(workbook_stream(data), engine=engine)
+                self.engine = engine
+                break
+            except Exception as e:
+                self.logger.debug(f"{engine} failed for {file_path}: {e}")
+        if self._book is None:
+            raise ValueError(f"Could not read {file_path} with any of the engines {list(engines)}")
+
+    @property
+    def sheet_names(self) -> List[str]:
+        return self._book.sheet_names
+
+    def sheet(self, sheet: Union[int, str], **kwargs) -> pd.DataFrame:
+        """
+        Parses a sheet of the workbook.
+
+        Args:
+            sheet (Union[int, str]): The position or the name of the sheet.
+            **kwargs: Options passed to `pd.ExcelFile.parse`, e.g. `header` or `usecols`.
+
+        Returns:
+            pd.DataFrame: The content of the sheet, a new DataFrame on every call.
+        """
+        sheet_name = self.sheet_names[sheet] if isinstance(sheet, int) else sheet
+        return self._book.parse(sheet_name, **kwargs)
+
+    def close(self):
+        """
+        Releases the workbook.
+        """
+        if self._book is not None:
+            self._book.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
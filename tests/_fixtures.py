@@ -0,0 +1,134 @@
+"""
+Synthetic DANE sheets and reference implementations shared by the tests and the benchmarks.
+
+first_format_frame builds first format sheets as first_format_data_extraction returns them, and
+legacy_first_format_transformation is the row by row implementation of first_format_data_transformation,
+kept as the golden reference of the vectorized one.
+"""
+import logging
+import random
+import re
+from pathlib import Path
+import pandas as pd
+from config import CATEGORIES_DICT
+
+
+def legacy_first_format_transformation(dataframe: pd.DataFrame, file_path: str) -> pd.DataFrame:
+    """The row by row implementation of first_format_data_transformation, kept as the golden reference."""
+    logger = logging.getLogger('test_logger')
+    # Keep only the first five columns and rename them
+    dataframe = dataframe.iloc[:, 0:5]
+    dataframe.columns = ['ciudad', 'precio_minimo', 'precio_maximo', 'precio_medio', 'tendencia']
+    dataframe['ciudad'] = dataframe['ciudad'].str.lower().str.replace('bogotá, d.c.', 'bogota')
+
+    # Remove rows where 'ciudad' is null
+    dataframe = dataframe[~dataframe['ciudad'].isnull()]
+
+    # Get row indexes where the word 'cuadro' is present
+    index_cuadro = dataframe[dataframe['ciudad'].str.contains('cuadro', case=False, na=False)].index.tolist()
+
+    if not index_cuadro:
+        logger.warning(f"No 'cuadro' titles found in {file_path}")
+        return pd.DataFrame()  # Return empty DataFrame if no categories found
+
+    # Create target dataframe for all data
+    df_final = pd.DataFrame()
+
+    # Iterate over food categories
+    for i_categoria in range(len(index_cuadro) + 1):
+        try:
+            if i_categoria == 0:
+                dataframe_categoria = dataframe.iloc[1:index_cuadro[i_categoria]]
+            elif i_categoria <= 6:
+                dataframe_categoria = dataframe.iloc[index_cuadro[i_categoria - 1] + 2:index_cuadro[i_categoria]]
+            else:
+                dataframe_categoria = dataframe.iloc[index_cuadro[i_categoria - 1] + 2:]
+
+            # Add category name
+            dataframe_categoria = dataframe_categoria.copy()
+            dataframe_categoria['categoria'] = CATEGORIES_DICT.get(i_categoria + 1, 'unknown')
+
+            # Identify products within category
+            index_producto = dataframe_categoria[dataframe_categoria['precio_minimo'].isnull()].index.tolist()
+            if not index_producto:
+                continue
+
+            df_categoria_final = pd.DataFrame()
+
+            for i_producto in range(len(index_producto)):
+                if i_producto < len(index_producto) - 1:
+                    start_idx = index_producto[i_producto]
+                    end_idx = index_producto[i_producto + 1]
+                else:
+                    start_idx = index_producto[i_producto]
+                    end_idx = None
+
+                dataframe_producto = dataframe_categoria.loc[start_idx:end_idx].reset_index(drop=True)
+
+                # Add product name
+                producto_name = dataframe_producto.at[0, 'ciudad']
+                dataframe_producto['producto'] = producto_name
+
+                # Clean city names
+                dataframe_producto['ciudad'] = dataframe_producto['ciudad'].str.replace(r'\s*\([^)]*\)', '', regex=True)
+
+                # Extract marketplace if present
+                dataframe_producto['mercado'] = dataframe_producto['ciudad'].str.extract(r',\s*(.*)')[0]
+                dataframe_producto['ciudad'] = dataframe_producto['ciudad'].str.split(',').str[0].str.strip()
+                dataframe_producto = dataframe_producto[~dataframe_producto['precio_medio'].isnull()]
+
+                # Drop first row (product name)
+                dataframe_producto = dataframe_producto.iloc[1:].reset_index(drop=True)
+
+                df_categoria_final = pd.concat([df_categoria_final, dataframe_producto], ignore_index=True)
+
+            df_final = pd.concat([df_final, df_categoria_final], ignore_index=True)
+
+        except Exception as e:
+            logger.error(f"Error processing category {i_categoria} in file {file_path}: {e}")
+            continue
+
+    if df_final.empty:
+        logger.warning(f"No data extracted from {file_path} after transformation.")
+        return df_final
+
+    # Add timestamps
+    try:
+        df_final['anho'] = Path(file_path).stem[-4:]
+        df_final['semana_no'] = int(Path(file_path).stem.split('_')[1])
+
+    except Exception as e:
+        logger.error(f"Error extracting week and year from {file_path}: {e}")
+        df_final['semana_no'] = None
+        df_final['anho'] = None
+
+    # Reorder columns
+    df_final = df_final[['producto', 'ciudad', 'precio_minimo', 'precio_maximo', 'precio_medio',
+                         'tendencia', 'categoria', 'mercado', 'semana_no', 'anho']]
+
+    df_final= df_final[~df_final['precio_medio'].isnull()]
+
+    return df_final
+
+
+def first_format_frame(products_per_category: int, titles: int = 7, seed: int = 0) -> pd.DataFrame:
+    """Builds a first format sheet as returned by first_format_data_extraction, with the quirks of the DANE files."""
+    rng = random.Random(seed)
+    cities = ['Bogotá, D.C., Corabastos', 'Medellín, Central Mayorista de Antioquia', 'Cali, Cavasa', 'Barranquilla',
+              'Tunja (Boyacá), Complejo de Servicios del Sur', 'Pasto (Nariño)', 'Cúcuta, Cenabastos']
+    rows = [['Verduras y hortalizas', None, None, None, None]]
+    for category in range(titles + 1):
+        if category:
+            rows += [[None] * 5, [f'Cuadro {category + 1}. Precios mayoristas', None, None, None, None],
+                     ['Producto y mercado', 'Mínimo', 'Máximo', 'Medio', 'Tendencia']]
+        for product in range(products_per_category):
+            # Product rows have no minimum price, a few carry a mean price
+            rows.append([f'Producto {category}-{product}', None, None, rng.choice([None, None, 'n.d.']), None])
+            for city in rng.sample(cities, rng.randint(1, len(cities))):
+                price = rng.randint(5, 60) * 100
+                rows.append([city, price, price + 200, rng.choice([price + 100, price + 100, None]), rng.choice('+-=')])
+            if rng.random() < 0.2:
+                rows.append([rng.randint(1, 9), None, None, None, None])  # Footnote calls, dropped on extraction
+    dataframe = pd.DataFrame(rows[1:], columns=['Precios mayoristas', 'b', 'c', 'd', 'e'])
+    return dataframe[dataframe[dataframe.columns[0]].apply(
+        lambda x: bool(re.search(r'[a-zA-Z]', str(x))) and pd.notna(x))]
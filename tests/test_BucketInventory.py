@@ -0,0 +1,140 @@
+import pytest
+import datetime
+import threading
+import time
+import boto3
+from unittest.mock import MagicMock
+from moto import mock_aws
+from src.BucketInventory import BucketInventory
+from src.FileNameBuilder import FileNameBuilder
+
+KEYS = [
+    'reports/2012/week_10_file1.xls',
+    'reports/2018/week_19_file2.xlsx',
+    'reports/2018/week_20_file3.xlsx',
+    'reports/2026/week_1_file4.xlsx',
+    'reports/2024/week_x_file5.xlsx',
+    'reports/2024/notes.txt',
+    'files_tracker.csv',
+    'logfile',
+]
+
+
+@pytest.fixture
+def s3_bucket():
+    """Fixture providing a local S3 stand-in with workbooks, the tracker and a log file."""
+    with mock_aws():
+        s3 = boto3.resource('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='test-bucket')
+        for key in KEYS:
+            s3.Object('test-bucket', key).put(Body=key.encode('utf-8'))
+        yield s3
+
+
+def test_refresh_classifies_workbooks(s3_bucket):
+    """Test that workbooks are classified around the 2018 week 19 cutover and other keys are skipped."""
+    logger = MagicMock()
+    inventory = BucketInventory(s3_bucket, logger, 'test-bucket')
+    entries = inventory.refresh()
+
+    assert [(entry.key, entry.year, entry.week, entry.file_format) for entry in entries] == [
+        ('reports/2012/week_10_file1.xls', '2012', 10, 1),
+        ('reports/2018/week_19_file2.xlsx', '2018', 19, 1),
+        ('reports/2018/week_20_file3.xlsx', '2018', 20, 2),
+        ('reports/2026/week_1_file4.xlsx', '2026', 1, 2),
+    ]
+    assert inventory.paths(1) == ['reports/2012/week_10_file1.xls', 'reports/2018/week_19_file2.xlsx']
+    assert entries[0].size == len(KEYS[0])
+    assert inventory.etag(KEYS[0]) == s3_bucket.Object('test-bucket', KEYS[0]).e_tag
+    assert inventory.etag('files_tracker.csv') is None
+    logger.warning.assert_called_once_with(
+        "Error processing path reports/2024/week_x_file5.xlsx: invalid literal for int() with base 10: 'x'")
+
+
+def test_paths_share_a_single_listing(s3_bucket, mocker):
+    """Test that both format path methods are served by one listing until a refresh is requested."""
+    file_name_builder = FileNameBuilder(s3=s3_bucket, logger=MagicMock())
+    spy_refresh = mocker.spy(BucketInventory, 'refresh')
+
+    assert len(file_name_builder.first_format_paths('test-bucket')) == 2
+    assert len(file_name_builder.second_format_paths('test-bucket')) == 2
+    assert spy_refresh.call_count == 1
+
+    s3_bucket.Object('test-bucket', 'reports/2026/week_2_file6.xlsx').put(Body=b'new')
+    assert len(file_name_builder.second_format_paths('test-bucket')) == 2
+    file_name_builder.bucket_inventory('test-bucket', refresh=True)
+    assert len(file_name_builder.second_format_paths('test-bucket')) == 3
+    assert spy_refresh.call_count == 2
+
+
+def test_year_prefixes_are_listed_concurrently(s3_bucket, mocker):
+    """Test that every year folder is listed by its own thread and merged in key order."""
+    for year in range(2012, 2025):
+        for week in (1, 2):
+            s3_bucket.Object('test-bucket', f'reports/{year}/week_{week}_{year}.xlsx').put(Body=b'x')
+    serial = BucketInventory(s3_bucket, MagicMock(), 'test-bucket', max_workers=1).refresh()
+
+    inventory = BucketInventory(s3_bucket, MagicMock(), 'test-bucket', max_workers=8)
+    list_prefix = inventory.list_prefix
+    in_flight, peak, lock = [0], [0], threading.Lock()
+
+    def slow_list_prefix(prefix):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.02)
+        try:
+            return list_prefix(prefix)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+    mocker.patch.object(inventory, 'list_prefix', side_effect=slow_list_prefix)
+
+    assert inventory.year_prefixes() == [f'reports/{year}/' for year in range(2012, 2027) if year != 2025]
+    assert inventory.refresh() == serial
+    assert inventory.list_prefix.call_count == 14
+    assert peak[0] > 1
+
+
+def test_refresh_delta_listing_from_manifest(s3_bucket, mocker):
+    """Test that once the manifest holds the archive, only the changed years are listed again."""
+    file_name_builder = FileNameBuilder(s3=s3_bucket, logger=MagicMock())
+    inventory = file_name_builder.bucket_inventory('test-bucket')
+    inventory.set_parse_status('reports/2012/week_10_file1.xls', 'loaded')
+    inventory.save()
+
+    s3_bucket.Object('test-bucket', 'reports/2012/week_11_file7.xls').put(Body=b'not listed')
+    s3_bucket.Object('test-bucket', 'reports/2026/week_2_file6.xlsx').put(Body=b'new')
+
+    # A new process starts from the manifest stored in the bucket
+    file_name_builder = FileNameBuilder(s3=s3_bucket, logger=MagicMock())
+    spy_list = mocker.spy(BucketInventory, 'list_prefix')
+    inventory = file_name_builder.bucket_inventory('test-bucket', refresh=True, years={'2026'})
+
+    assert [call.args[1] for call in spy_list.call_args_list] == ['reports/2026/']
+    assert 'reports/2026/week_2_file6.xlsx' in file_name_builder.second_format_paths('test-bucket')
+    assert 'reports/2012/week_11_file7.xls' not in file_name_builder.first_format_paths('test-bucket')
+    assert inventory.entries[0].parse_status == 'loaded'
+    assert inventory.etag('reports/2026/week_2_file6.xlsx') == s3_bucket.Object(
+        'test-bucket', 'reports/2026/week_2_file6.xlsx').e_tag
+
+
+def test_refresh_lists_the_whole_bucket_when_the_full_listing_is_stale(s3_bucket, mocker):
+    """Test that objects changed outside the delta years are picked up once the last full listing is too old."""
+    file_name_builder = FileNameBuilder(s3=s3_bucket, logger=MagicMock())
+    inventory = file_name_builder.bucket_inventory('test-bucket')
+    s3_bucket.Object('test-bucket', 'reports/2012/week_11_file7.xls').put(Body=b'uploaded by hand')
+    s3_bucket.Object('test-bucket', 'reports/2018/week_20_file3.xlsx').delete()
+
+    inventory.refresh(years={'2026'})
+    assert 'reports/2012/week_11_file7.xls' not in inventory.paths(1)
+
+    mocker.patch.object(inventory.manifest, 'last_full_listing',
+                        return_value=datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=8))
+    spy_list = mocker.spy(BucketInventory, 'list_prefix')
+    inventory.refresh(years={'2026'})
+
+    assert [call.args[1] for call in spy_list.call_args_list] == [
+        'reports/2012/', 'reports/2018/', 'reports/2024/', 'reports/2026/']
+    assert 'reports/2012/week_11_file7.xls' in inventory.paths(1)
+    assert 'reports/2018/week_20_file3.xlsx' not in inventory.paths(2)
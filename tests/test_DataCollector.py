@@ -1,11 +1,20 @@
 import pytest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, ANY
 import pandas as pd
 from bs4 import BeautifulSoup
 from botocore.exceptions import ClientError
 from io import BytesIO
 import requests
+import time
+import datetime
+import asyncio
+import threading
+import hashlib
+import boto3
+from moto import mock_aws
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from src.DataCollector import DataCollector  
+from src.LinkExtractor import Link
 
 
 @pytest.fixture
@@ -20,6 +29,95 @@ def mock_logger():
     return MagicMock()
 
 
+@pytest.fixture
+def s3_bucket(mocker):
+    """Fixture providing a local S3 stand-in with an empty bucket and small multipart parts allowed."""
+    mocker.patch('moto.s3.models.S3_UPLOAD_PART_MIN_SIZE', 1)
+    mocker.patch.object(DataCollector, 'MIN_PART_SIZE', 1)
+    with mock_aws():
+        s3 = boto3.resource('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='test-bucket')
+        yield s3
+
+
+WORKBOOK_BYTES = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def dane_fixture_server():
+    """Fixture serving a minimal copy of the DANE landing page, year pages and workbooks on localhost."""
+    pages = {
+        '/sipsa': "<a href='/sipsa/2012'>2012</a><a href='/sipsa/2013'>2013</a><a href='/otro'>Otro</a>",
+        '/sipsa/2012': "<a target='_blank' href='/files/a_2012.xlsx'>Anexo</a>"
+                       "<a target='_blank' href='/files/b_2012.xlsx'>Anexo</a>",
+        '/sipsa/2013': "<a target='_blank' href='/files/a_2013.xlsx'>Anexo</a>"
+                       "<a target='_blank' href='/files/boletin.pdf'>Boletin</a>",
+    }
+
+    failures = {'/flaky': 2, '/throttled': 2, '/gateway': 2}
+    statuses = {'/flaky': 503, '/throttled': 429, '/gateway': 502}
+    drops = {'/drop.xlsx': 1}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if failures.get(self.path, 0) > 0:
+                failures[self.path] -= 1
+                self.send_response(statuses[self.path])
+                self.send_header('Content-Length', '0')
+                if self.path == '/throttled':
+                    self.send_header('Retry-After', '0')
+                self.end_headers()
+                return
+            if self.path in ('/big.xlsx', '/copy/big.xlsx', '/drop.xlsx'):
+                start = int(self.headers['Range'][6:-1]) if 'Range' in self.headers else 0
+                self.send_response(206 if start else 200)
+                if start:
+                    self.send_header('Content-Range', f'bytes {start}-{len(WORKBOOK_BYTES) - 1}/{len(WORKBOOK_BYTES)}')
+                self.send_header('Content-Length', str(len(WORKBOOK_BYTES) - start))
+                self.end_headers()
+                if drops.get(self.path, 0) > 0:
+                    # Drop the connection in the middle of the body
+                    drops[self.path] -= 1
+                    self.wfile.write(WORKBOOK_BYTES[start:700])
+                    self.close_connection = True
+                    return
+                self.wfile.write(WORKBOOK_BYTES[start:])
+                return
+            if self.path.startswith('/files/') or self.path in statuses:
+                body = self.path.encode('utf-8')
+            elif self.path in pages:
+                body = pages[self.path].encode('utf-8')
+            else:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            etag = f'"{len(body)}"'
+            if self.path in pages and self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
 @pytest.fixture
 def data_collector(mock_s3, mock_logger):
     """Fixture to create a DataCollector instance with mocked S3 and logger."""
@@ -31,7 +129,7 @@ def test_all_years_links(data_collector, mocker):
     mock_html = "<a href='/link1'>2012</a><a href='/link2'>2013</a>"
     mock_response = MagicMock()
     mock_response.content = mock_html.encode('utf-8')
-    mocker.patch('requests.get', return_value=mock_response)
+    mocker.patch.object(data_collector.session, 'get', return_value=mock_response)
 
     years_links = data_collector.all_years_links()
     assert len(years_links) == 2
@@ -48,7 +146,7 @@ def test_links_per_year(data_collector, mocker):
     """
     mock_response = MagicMock()
     mock_response.content = mock_html.encode('utf-8')
-    mocker.patch('requests.get', return_value=mock_response)
+    mocker.patch.object(data_collector.session, 'get', return_value=mock_response)
     
     # Define the year link with the necessary 'href' attribute
     year_link = BeautifulSoup('<a href="/year/2012">2012</a>', 'html.parser').find('a')
@@ -101,8 +199,10 @@ def test_update_files_tracker(data_collector, mock_s3):
         'date_added': ['2023-09-13']
     })
 
+    mock_s3.Object().get.side_effect = ClientError({'Error': {'Code': 'NoSuchKey'}}, 'get')
+
     data_collector.update_files_tracker(df, 'bucket')
-    mock_s3.Bucket().put_object.assert_called_once()
+    mock_s3.Object().put.assert_called_once_with(Body=ANY, IfNoneMatch='*')
 
 
 def test_upload_or_update_dataframe_to_s3(data_collector, mock_s3):
@@ -126,20 +226,46 @@ def test_download_files_per_year(data_collector, mocker):
     mocker.patch.object(data_collector, 'links_per_year', return_value=mock_links)
     mocker.patch.object(data_collector, 'load_files_tracker', return_value=pd.DataFrame(columns=['file', 'link', 'date_added']))
 
-    # Create a mock response and explicitly call raise_for_status
-    mock_response = MagicMock()
-    mock_response.raise_for_status = MagicMock()  # Ensures raise_for_status is available
-    mocker.patch('requests.get', return_value=mock_response)
+    mocker.patch.object(data_collector, 'update_files_tracker')
+    mocker.patch.object(data_collector, 'upload_stream_to_s3', return_value={'size': 10, 'sha256': 'abc'})
 
-    # Manually trigger the raise_for_status
     data_collector.download_files_per_year(mock_links[0], 'bucket')
 
-    # Manually call the raise_for_status on mock_response
-    mock_response.raise_for_status()
+    # Verify that the file was streamed to S3 and tracked with its size and checksum
+    data_collector.upload_stream_to_s3.assert_called_once_with(
+        'https://www.dane.gov.co/file1.xlsx', 'bucket', 'reports/Anexo 1/week_1_file1.xlsx')
+    tracker_df = data_collector.update_files_tracker.call_args[0][0]
+    assert tracker_df[['file', 'size', 'sha256']].values.tolist() == [['week_1_file1.xlsx', 10, 'abc']]
+
+
+
+def test_download_files_per_year_concurrent(mock_s3, mock_logger, mocker):
+    """Test that concurrent downloads merge tracker rows in page order."""
+    data_collector = DataCollector(s3=mock_s3, logger=mock_logger, max_workers=4)
+    year_link = BeautifulSoup('<a href="/year/2013">2013</a>', 'html.parser').find('a')
+    mock_links = [BeautifulSoup(f'<a href="/file{i}.xlsx">Anexo {i}</a>', 'html.parser').find('a') for i in range(6)]
 
-    # Verify that the necessary calls were made
-    mock_response.raise_for_status.assert_called_once()
-    data_collector.s3.Bucket().upload_fileobj.assert_called_once()
+    mocker.patch.object(data_collector, 'links_per_year', return_value=mock_links)
+    mocker.patch.object(data_collector, 'load_files_tracker', return_value=pd.DataFrame({
+        'file': ['week_6_file0.xlsx'], 'link': ['link0'], 'date_added': ['2023-09-13']
+    }))
+    mocker.patch.object(data_collector, 'update_files_tracker')
+
+    # Later links finish first and one download fails
+    def fake_fetch(file_link, destination_key, bucket_name=None):
+        time.sleep(0.01 * (6 - int(file_link[-6])))
+        return None if file_link.endswith('file3.xlsx') else {'size': 1, 'sha256': file_link}
+    mocker.patch.object(data_collector, 'fetch_and_upload_file', side_effect=fake_fetch)
+
+    data_collector.download_files_per_year(year_link, 'bucket')
+
+    assert data_collector.fetch_and_upload_file.call_count == 5
+    data_collector.fetch_and_upload_file.assert_any_call(
+        'https://www.dane.gov.co/file1.xlsx', 'reports/2013/week_5_file1.xlsx', 'bucket')
+    tracker_df = data_collector.update_files_tracker.call_args[0][0]
+    assert tracker_df['file'].tolist() == [
+        'week_6_file0.xlsx', 'week_5_file1.xlsx', 'week_4_file2.xlsx', 'week_2_file4.xlsx', 'week_1_file5.xlsx'
+    ]
 
 
 
@@ -149,6 +275,8 @@ def test_get_files(data_collector, mocker):
     mock_years = [BeautifulSoup('<a href="/year/2012">2012</a>', 'html.parser')]
     mocker.patch.object(data_collector, 'all_years_links', return_value=mock_years)
     mocker.patch.object(data_collector, 'download_files_per_year')
+    mocker.patch.object(data_collector, 'load_listing_cache', return_value={})
+    mocker.patch.object(data_collector, 'update_listing_cache')
 
     data_collector.get_files('bucket')
     data_collector.download_files_per_year.assert_called_once_with(mock_years[0], 'bucket')
@@ -162,3 +290,344 @@ def test_display_files_tracker(data_collector, mock_s3):
     tracker_df = data_collector.display_files_tracker('bucket')
     assert isinstance(tracker_df, pd.DataFrame)
     assert tracker_df.iloc[0]['file'] == 'file1'
+
+
+def test_get_files_async_crawl(s3_bucket, mock_logger, dane_fixture_server, mocker):
+    """Test the concurrent crawler end to end against a local HTTP server."""
+    data_collector = DataCollector(s3=s3_bucket, logger=mock_logger, max_workers=2, async_crawl=True)
+    data_collector.url_base = dane_fixture_server
+    data_collector.url = dane_fixture_server + '/sipsa'
+    mocker.patch.object(data_collector, 'update_files_tracker', wraps=data_collector.update_files_tracker)
+
+    data_collector.get_files('test-bucket')
+
+    uploaded = {obj.key: obj.get()['Body'].read() for obj in s3_bucket.Bucket('test-bucket').objects.filter(Prefix='reports/')}
+    assert uploaded == {
+        'reports/2012/week_2_a_2012.xlsx': b'/files/a_2012.xlsx',
+        'reports/2012/week_1_b_2012.xlsx': b'/files/b_2012.xlsx',
+        'reports/2013/week_1_a_2013.xlsx': b'/files/a_2013.xlsx',
+    }
+    assert data_collector.update_files_tracker.call_count == 2
+
+
+def test_crawl_year_pages_streams_results(data_collector, mocker):
+    """Test that year pages are pushed to the queue as soon as each one is parsed."""
+    years = [BeautifulSoup(f'<a href="/year/{y}">{y}</a>', 'html.parser').find('a') for y in ('2012', '2013')]
+
+    def slow_links_per_year(link):
+        if link.text == '2012':
+            time.sleep(0.2)
+        return [link.text]
+    mocker.patch.object(data_collector, 'links_per_year', side_effect=slow_links_per_year)
+
+    async def run():
+        queue = asyncio.Queue()
+        await data_collector.crawl_year_pages(years, queue)
+        items = []
+        while (item := queue.get_nowait()) is not None:
+            items.append(item[1])
+        return items
+
+    assert asyncio.run(run()) == [['2013'], ['2012']]
+
+
+def test_session_reuses_connections(mock_s3, mock_logger, dane_fixture_server):
+    """Test that the pooled session keeps connections alive across requests."""
+    data_collector = DataCollector(s3=mock_s3, logger=mock_logger)
+    for _ in range(5):
+        data_collector.session.get(dane_fixture_server + '/sipsa').raise_for_status()
+
+    stats = data_collector.connection_stats()
+    assert stats == {'requests': 5, 'connections': 1, 'reused': 4}
+    assert data_collector.rate_limiter.stats()['requests'] == 5
+    assert data_collector.session.headers['User-Agent'] == data_collector.headers['User-Agent']
+
+
+def test_session_retries_transient_errors(mock_s3, mock_logger, dane_fixture_server):
+    """Test that transient 5xx answers are retried with backoff."""
+    data_collector = DataCollector(s3=mock_s3, logger=mock_logger, max_retries=3, backoff_factor=0.01)
+    response = data_collector.session.get(dane_fixture_server + '/gateway')
+    assert response.status_code == 200
+    assert response.content == b'/gateway'
+
+    data_collector = DataCollector(s3=mock_s3, logger=mock_logger, max_retries=0)
+    assert data_collector.session.get(dane_fixture_server + '/missing').status_code == 404
+
+
+@pytest.mark.parametrize('path', ['/throttled', '/flaky'])
+def test_session_throttled_retries_go_through_rate_limiter(mock_s3, mock_logger, dane_fixture_server, path):
+    """Test that each retry of a 429/503 answer takes a token and makes the rate limiter back off."""
+    data_collector = DataCollector(s3=mock_s3, logger=mock_logger, max_retries=3, backoff_factor=0.01)
+    data_collector.rate_limiter.cooldown = 0
+    rate = data_collector.rate_limiter.rate
+
+    response = data_collector.session.get(dane_fixture_server + path)
+
+    assert response.status_code == 200
+    assert response.content == path.encode('utf-8')
+    stats = data_collector.rate_limiter.stats()
+    assert stats['requests'] == 3
+    assert stats['throttled'] == 2
+    assert stats['backoff_events'] == 2
+    assert data_collector.rate_limiter.rate < rate
+
+
+def test_links_per_year_conditional_get(mock_s3, mock_logger, dane_fixture_server, mocker):
+    """Test that an unchanged year page is revalidated with a 304 and not parsed again."""
+    data_collector = DataCollector(s3=mock_s3, logger=mock_logger)
+    data_collector.url_base = dane_fixture_server
+    year_link = BeautifulSoup('<a href="/sipsa/2012">2012</a>', 'html.parser').find('a')
+
+    first = data_collector.links_per_year(year_link)
+    cached = data_collector.listing_cache[dane_fixture_server + '/sipsa/2012']
+    assert cached['links'] == [['/files/a_2012.xlsx', 'Anexo'], ['/files/b_2012.xlsx', 'Anexo']]
+
+    spy_get = mocker.spy(data_collector.session, 'get')
+    spy_parse = mocker.spy(data_collector.link_extractor, 'report_links')
+    second = data_collector.links_per_year(year_link)
+
+    assert spy_get.call_args.kwargs['headers'] == {'If-None-Match': cached['etag']}
+    assert spy_get.spy_return.status_code == 304
+    spy_parse.assert_not_called()
+    assert second == first
+
+
+def test_listing_cache_round_trip(data_collector, mock_s3):
+    """Test saving and loading the listing cache next to the files tracker."""
+    data_collector.listing_cache = {'url': {'etag': '"1"', 'last_modified': None, 'links': [['/a.xlsx', 'Anexo']]}}
+    data_collector.update_listing_cache('bucket')
+    body = mock_s3.Bucket().put_object.call_args.kwargs['Body']
+    assert mock_s3.Bucket().put_object.call_args.kwargs['Key'] == 'listing_cache.json'
+
+    mock_s3.Object().get.return_value = {'Body': BytesIO(body)}
+    assert data_collector.load_listing_cache('bucket') == data_collector.listing_cache
+
+    mock_s3.Object().get.side_effect = ClientError({'Error': {'Code': 'NoSuchKey'}}, 'get')
+    assert data_collector.load_listing_cache('bucket') == {}
+
+
+def test_tracked_files_per_year(data_collector):
+    """Test counting tracked files per year from the year column or the file name."""
+    tracker_df = pd.DataFrame({
+        'file': ['week_1_a_2012.xlsx', 'week_1_a_2012.xlsx', 'week_2_b_2012.xls', 'week_1_anexo.xlsx', 'week_2_c_2024.xlsx'],
+        'year': [None, None, None, 2024, 2024],
+    })
+    assert data_collector.tracked_files_per_year(tracker_df) == {'2012': 2, '2024': 2}
+    assert data_collector.tracked_files_per_year(pd.DataFrame(columns=['file'])) == {}
+
+
+def test_get_files_incremental(mock_s3, mock_logger, mocker):
+    """Test that incremental mode only downloads recent years whose link count changed."""
+    data_collector = DataCollector(s3=mock_s3, logger=mock_logger, incremental=True)
+    this_year = datetime.date.today().year
+    years = [BeautifulSoup(f'<a href="/year/{y}">{y}</a>', 'html.parser').find('a')
+             for y in (2012, 2013, this_year - 1, this_year)]
+    tracker_df = pd.DataFrame({
+        'file': ['week_1_a.xlsx', 'week_1_b.xlsx', 'week_2_b.xlsx', 'week_1_c.xlsx'],
+        'year': [2012, this_year - 1, this_year - 1, this_year],
+    })
+    mocker.patch.object(data_collector, 'all_years_links', return_value=years)
+    mocker.patch.object(data_collector, 'load_files_tracker', return_value=tracker_df)
+    mocker.patch.object(data_collector, 'load_listing_cache', return_value={})
+    mocker.patch.object(data_collector, 'update_listing_cache')
+    mocker.patch.object(data_collector, 'links_per_year', side_effect=lambda link: ['x', 'y'])
+    mocker.patch.object(data_collector, 'download_files_per_year')
+
+    data_collector.get_files('bucket')
+
+    # 2012 is closed and tracked, 2013 was never collected, last year is complete, this year has a new file
+    assert [call.args[0].text for call in data_collector.links_per_year.call_args_list] == ['2013', str(this_year - 1), str(this_year)]
+    assert [call.args[0].text for call in data_collector.download_files_per_year.call_args_list] == ['2013', str(this_year)]
+
+
+def test_upload_stream_to_s3_multipart(s3_bucket, mock_logger, dane_fixture_server):
+    """Test that a workbook is streamed in parts with its size and SHA-256 recorded."""
+    data_collector = DataCollector(s3=s3_bucket, logger=mock_logger, part_size=300, upload_concurrency=2)
+    result = data_collector.upload_stream_to_s3(dane_fixture_server + '/big.xlsx', 'test-bucket', 'reports/2024/week_1_big.xlsx')
+
+    assert result == {'size': 1024, 'sha256': hashlib.sha256(WORKBOOK_BYTES).hexdigest()}
+    obj = s3_bucket.Object('test-bucket', 'reports/2024/week_1_big.xlsx')
+    assert obj.get()['Body'].read() == WORKBOOK_BYTES
+    assert obj.e_tag.strip('"').endswith('-4')
+
+
+def test_upload_stream_to_s3_single_put(s3_bucket, mock_logger, dane_fixture_server, mocker):
+    """Test that a workbook smaller than one part is stored with a single PUT."""
+    data_collector = DataCollector(s3=s3_bucket, logger=mock_logger, part_size=2048)
+    client = s3_bucket.meta.client
+    spies = {name: mocker.spy(client, name) for name in ('list_multipart_uploads', 'create_multipart_upload',
+                                                          'upload_part', 'put_object')}
+
+    result = data_collector.upload_stream_to_s3(dane_fixture_server + '/big.xlsx', 'test-bucket', 'reports/2024/week_1_big.xlsx')
+
+    assert result == {'size': 1024, 'sha256': hashlib.sha256(WORKBOOK_BYTES).hexdigest()}
+    assert {name: spy.call_count for name, spy in spies.items()} == {
+        'list_multipart_uploads': 1, 'create_multipart_upload': 0, 'upload_part': 0, 'put_object': 1}
+    assert s3_bucket.Object('test-bucket', 'reports/2024/week_1_big.xlsx').get()['Body'].read() == WORKBOOK_BYTES
+
+
+def test_upload_stream_to_s3_single_put_aborts_unfinished_upload(s3_bucket, mock_logger, dane_fixture_server):
+    """Test that an unfinished upload of a previous run is aborted when the file fits a single PUT."""
+    client = s3_bucket.meta.client
+    key = 'reports/2024/week_1_big.xlsx'
+    upload_id = client.create_multipart_upload(Bucket='test-bucket', Key=key)['UploadId']
+    client.upload_part(Bucket='test-bucket', Key=key, UploadId=upload_id, PartNumber=1, Body=WORKBOOK_BYTES[:300])
+
+    data_collector = DataCollector(s3=s3_bucket, logger=mock_logger, part_size=2048)
+    data_collector.upload_stream_to_s3(dane_fixture_server + '/big.xlsx', 'test-bucket', key)
+
+    assert s3_bucket.Object('test-bucket', key).get()['Body'].read() == WORKBOOK_BYTES
+    assert client.list_multipart_uploads(Bucket='test-bucket').get('Uploads', []) == []
+
+
+def test_part_size_minimum(mock_s3, mock_logger):
+    """Test that parts smaller than the S3 minimum are refused when the collector is built."""
+    with pytest.raises(ValueError):
+        DataCollector(s3=mock_s3, logger=mock_logger, part_size=1024 * 1024)
+    assert DataCollector(s3=mock_s3, logger=mock_logger, part_size=5 * 1024 * 1024).part_size == 5 * 1024 * 1024
+
+
+def test_upload_stream_to_s3_resumes_dropped_download(s3_bucket, mock_logger, dane_fixture_server, mocker):
+    """Test that a dropped connection resumes from the last uploaded part with a Range request."""
+    data_collector = DataCollector(s3=s3_bucket, logger=mock_logger, part_size=300, backoff_factor=0)
+    spy_get = mocker.spy(data_collector.session, 'get')
+    spy_upload = mocker.spy(s3_bucket.meta.client, 'upload_part')
+
+    result = data_collector.upload_stream_to_s3(dane_fixture_server + '/drop.xlsx', 'test-bucket', 'reports/2024/week_1_drop.xlsx')
+
+    assert result == {'size': 1024, 'sha256': hashlib.sha256(WORKBOOK_BYTES).hexdigest()}
+    assert spy_get.call_args_list[1].kwargs['headers']['Range'] == 'bytes=600-'
+    assert [call.kwargs['PartNumber'] for call in spy_upload.call_args_list] == [1, 2, 3, 4]
+    assert s3_bucket.Object('test-bucket', 'reports/2024/week_1_drop.xlsx').get()['Body'].read() == WORKBOOK_BYTES
+
+
+def test_upload_stream_to_s3_resumes_unfinished_upload(s3_bucket, mock_logger, dane_fixture_server, mocker):
+    """Test that an unfinished upload left by a previous run is completed without re-uploading its parts."""
+    client = s3_bucket.meta.client
+    key = 'reports/2024/week_1_big.xlsx'
+    upload_id = client.create_multipart_upload(Bucket='test-bucket', Key=key)['UploadId']
+    client.upload_part(Bucket='test-bucket', Key=key, UploadId=upload_id, PartNumber=1, Body=WORKBOOK_BYTES[:300])
+    client.upload_part(Bucket='test-bucket', Key=key, UploadId=upload_id, PartNumber=2, Body=b'corrupted')
+
+    data_collector = DataCollector(s3=s3_bucket, logger=mock_logger, part_size=300)
+    spy_upload = mocker.spy(client, 'upload_part')
+    data_collector.upload_stream_to_s3(dane_fixture_server + '/big.xlsx', 'test-bucket', key)
+
+    assert [call.kwargs['PartNumber'] for call in spy_upload.call_args_list] == [2, 3, 4]
+    assert s3_bucket.Object('test-bucket', key).get()['Body'].read() == WORKBOOK_BYTES
+    assert client.list_multipart_uploads(Bucket='test-bucket').get('Uploads', []) == []
+
+
+def test_fetch_and_upload_file_incomplete(data_collector, mocker):
+    """Test that an incomplete transfer is reported as a failure."""
+    mocker.patch.object(data_collector, 'upload_stream_to_s3', side_effect=IOError('Read 10 of 20 bytes'))
+    assert data_collector.fetch_and_upload_file('https://x/file.xlsx', 'reports/2024/file.xlsx', 'bucket') is None
+    data_collector.logger.error.assert_called_once()
+
+
+def test_build_content_index(data_collector):
+    """Test that the content index skips rows without a hash and alias rows."""
+    tracker_df = pd.DataFrame({
+        'file': ['week_1_old.xls', 'week_2_a.xlsx', 'week_3_b.xlsx'],
+        'sha256': [None, 'abc', 'abc'],
+        'alias_of': [None, None, 'week_2_a.xlsx'],
+    })
+    assert data_collector.build_content_index(tracker_df) == {'abc': 'week_2_a.xlsx'}
+    assert data_collector.build_content_index(pd.DataFrame(columns=['file', 'link', 'date_added'])) == {}
+
+
+def test_upload_stream_to_s3_known_content_is_aliased(s3_bucket, mock_logger, dane_fixture_server, mocker):
+    """Test that a republished workbook is not stored again and is reported as an alias."""
+    data_collector = DataCollector(s3=s3_bucket, logger=mock_logger, part_size=300)
+    data_collector.content_index = {hashlib.sha256(WORKBOOK_BYTES).hexdigest(): 'week_1_big.xlsx'}
+    spy_upload = mocker.spy(s3_bucket.meta.client, 'upload_part')
+
+    result = data_collector.upload_stream_to_s3(dane_fixture_server + '/big.xlsx', 'test-bucket', 'reports/2024/week_2_big.xlsx')
+
+    assert result == {'size': 1024, 'sha256': hashlib.sha256(WORKBOOK_BYTES).hexdigest(), 'alias_of': 'week_1_big.xlsx'}
+    # The last part is never sent and the upload is aborted, so no object shows up for parsing
+    assert [call.kwargs['PartNumber'] for call in spy_upload.call_args_list] == [1, 2, 3]
+    assert list(s3_bucket.Bucket('test-bucket').objects.all()) == []
+    assert s3_bucket.meta.client.list_multipart_uploads(Bucket='test-bucket').get('Uploads', []) == []
+
+
+def test_download_files_per_year_records_aliases(s3_bucket, mock_logger, dane_fixture_server):
+    """Test that identical workbooks downloaded concurrently are stored once and tracked as an alias."""
+    data_collector = DataCollector(s3=s3_bucket, logger=mock_logger, max_workers=2)
+    data_collector.url_base = dane_fixture_server
+    year_link = Link('/sipsa/2024', '2024')
+    file_links = [Link('/big.xlsx', 'Anexo'), Link('/copy/big.xlsx', 'Anexo')]
+
+    data_collector.download_files_per_year(year_link, 'test-bucket', file_links)
+
+    tracker_df = data_collector.load_files_tracker('test-bucket')
+    assert tracker_df['sha256'].nunique() == 1
+    assert tracker_df['alias_of'].notna().sum() == 1
+    original = tracker_df.loc[tracker_df['alias_of'].isna(), 'file'].item()
+    assert tracker_df['alias_of'].dropna().tolist() == [original]
+    stored = [obj.key for obj in s3_bucket.Bucket('test-bucket').objects.filter(Prefix='reports/')]
+    assert stored == [f'reports/2024/{original}']
+
+
+def test_unhashed_tracked_files_are_backfilled(s3_bucket, mock_logger, dane_fixture_server):
+    """Test that files tracked before content hashes are hashed once, so a republished copy is detected."""
+    s3_bucket.Object('test-bucket', 'reports/2023/week_9_old_2023.xlsx').put(Body=WORKBOOK_BYTES)
+    s3_bucket.Object('test-bucket', 'reports/2023/week_8_other_2023.xlsx').put(Body=b'other content')
+    data_collector = DataCollector(s3=s3_bucket, logger=mock_logger, max_workers=2)
+    data_collector.url_base = dane_fixture_server
+    data_collector.update_files_tracker(pd.DataFrame({
+        'file': ['week_9_old_2023.xlsx', 'week_8_other_2023.xlsx', 'week_7_gone_2023.xlsx'],
+        'link': ['a', 'b', 'c'], 'date_added': ['2023-03-01'] * 3}), 'test-bucket')
+
+    data_collector.download_files_per_year(Link('/sipsa/2024', '2024'), 'test-bucket', [Link('/big.xlsx', 'Anexo')])
+
+    tracker_df = data_collector.load_files_tracker('test-bucket').set_index('file')
+    assert tracker_df.loc['week_9_old_2023.xlsx', 'sha256'] == hashlib.sha256(WORKBOOK_BYTES).hexdigest()
+    assert tracker_df.loc['week_8_other_2023.xlsx', 'sha256'] == hashlib.sha256(b'other content').hexdigest()
+    assert pd.isna(tracker_df.loc['week_7_gone_2023.xlsx', 'sha256'])
+    assert tracker_df.loc['week_1_big.xlsx', 'alias_of'] == 'week_9_old_2023.xlsx'
+    assert [obj.key for obj in s3_bucket.Bucket('test-bucket').objects.filter(Prefix='reports/2024/')] == []
+
+
+def test_backfill_content_hashes_reports_stored_duplicates(s3_bucket, mock_logger):
+    """Test that workbooks already stored twice are reported, the first tracked one being the original."""
+    for key in ('reports/2019/week_3_a_2018.xlsx', 'reports/2018/week_3_a_2018b.xlsx'):
+        s3_bucket.Object('test-bucket', key).put(Body=WORKBOOK_BYTES)
+    data_collector = DataCollector(s3=s3_bucket, logger=mock_logger)
+    tracker_df = pd.DataFrame({'file': ['week_3_a_2018b.xlsx', 'week_3_a_2018.xlsx'], 'link': ['a', 'b']})
+
+    tracker_df = data_collector.backfill_content_hashes(tracker_df, 'test-bucket')
+
+    assert tracker_df['sha256'].nunique() == 1
+    assert data_collector.build_content_index(tracker_df) == {hashlib.sha256(WORKBOOK_BYTES).hexdigest(): 'week_3_a_2018b.xlsx'}
+    mock_logger.warning.assert_called_once()
+
+
+def test_download_workers_do_not_share_the_s3_resource(s3_bucket, mock_logger, dane_fixture_server):
+    """Test that download worker threads only use the thread-safe S3 client, never the shared resource."""
+    class MainThreadResource:
+        def __init__(self, resource):
+            self.meta = resource.meta
+            self._resource = resource
+
+        def __getattr__(self, name):
+            assert threading.current_thread() is threading.main_thread(), f"s3.{name} used from a worker thread"
+            return getattr(self._resource, name)
+
+    data_collector = DataCollector(s3=MainThreadResource(s3_bucket), logger=mock_logger, max_workers=2)
+    data_collector.url_base = dane_fixture_server
+    year_link = Link('/sipsa/2024', '2024')
+
+    data_collector.download_files_per_year(year_link, 'test-bucket', [Link('/big.xlsx', 'Anexo'), Link('/files/a.xlsx', 'Anexo')])
+
+    stored = sorted(obj.key for obj in s3_bucket.Bucket('test-bucket').objects.filter(Prefix='reports/'))
+    assert stored == ['reports/2024/week_1_a.xlsx', 'reports/2024/week_2_big.xlsx']
+
+
+def test_build_session(mock_s3, mock_logger):
+    """Test that the session and its jittered retry policy build with the installed urllib3."""
+    data_collector = DataCollector(s3=mock_s3, logger=mock_logger, max_retries=4, backoff_factor=0.2)
+    retry = data_collector.session.get_adapter('https://www.dane.gov.co').max_retries
+    assert retry.total == 4
+    assert retry.backoff_factor == 0.2
+    assert retry.jitter == 0.2
@@ -1,5 +1,6 @@
 import pytest
 import pandas as pd
+import sqlalchemy
 from sqlalchemy.exc import SQLAlchemyError
 from unittest.mock import MagicMock
 from src.DataIngestor import DataIngestor
@@ -84,3 +85,44 @@ def test_engine_dispose_called(data_ingestor, mocker):
 
     # Check if dispose was called
     mock_dispose.assert_called_once()
+
+def test_delete_rows(mock_logger):
+    """
+    Test deleting the rows of a week before loading it again, on a real (SQLite) database.
+    """
+    engine = sqlalchemy.create_engine('sqlite://')
+    data_ingestor = DataIngestor(engine=engine, logger=mock_logger)
+
+    # Nothing to delete before the table exists
+    assert data_ingestor.delete_rows('test_table', anho='2020', semana_no=5) == 0
+
+    df = pd.DataFrame({'producto': ['papa', 'papa', 'yuca'], 'anho': ['2020', '2020', '2020'], 'semana_no': [5, 6, 5]})
+    df.to_sql('test_table', engine, index=False)
+
+    assert data_ingestor.delete_rows('test_table', anho='2020', semana_no=5) == 2
+    remaining = pd.read_sql('SELECT * FROM test_table', engine)
+    assert remaining.to_dict('records') == [{'producto': 'papa', 'anho': '2020', 'semana_no': 6}]
+
+    with pytest.raises(ValueError):
+        data_ingestor.delete_rows('test_table')
+
+def test_insert_with_source_file_indexes_the_column(mock_logger, tmp_path):
+    """
+    Test that rows are stored with their file, and that a table loaded before gets the column and its index.
+    """
+    # The engine is disposed after inserting, which would drop an in-memory database
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path / "rds.sqlite"}')
+    data_ingestor = DataIngestor(engine=engine, logger=mock_logger)
+    pd.DataFrame({'producto': ['papa'], 'anho': ['2020'], 'semana_no': [5]}).to_sql('test_table', engine, index=False)
+
+    # Rows of a table without the column cannot belong to a file
+    assert data_ingestor.delete_rows('test_table', source_file='reports/2020/week_5_anexo_2020.xlsx') == 0
+
+    df = pd.DataFrame({'producto': ['yuca'], 'anho': ['2020'], 'semana_no': [5]})
+    data_ingestor.insert_dataframe_to_db(df, 'test_table', source_file='reports/2020/week_5_anexo_2020.xlsx')
+
+    indexes = sqlalchemy.inspect(engine).get_indexes('test_table')
+    assert [index['column_names'] for index in indexes] == [['source_file']]
+    assert data_ingestor.delete_rows('test_table', source_file='reports/2020/week_5_anexo_2020.xlsx') == 1
+    remaining = pd.read_sql('SELECT * FROM test_table', engine)
+    assert remaining.to_dict('records') == [{'producto': 'papa', 'anho': '2020', 'semana_no': 5, 'source_file': None}]
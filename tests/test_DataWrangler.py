@@ -5,6 +5,8 @@ from io import BytesIO
 from botocore.exceptions import ClientError
 import logging
 from src.DataWrangler import DataWrangler
+from pathlib import Path
+from tests._fixtures import first_format_frame, legacy_first_format_transformation
 
 import pytest
 import pandas as pd
@@ -39,8 +41,9 @@ def test_first_format_data_extraction():
     mock_object.get.return_value = {'Body': excel_file}
     mock_bucket.Object.return_value = mock_object
 
-    # Initialize DataWrangler with mock S3
-    data_wrangler = DataWrangler(bucket_name='test-bucket', s3=mock_s3, logger=logging.getLogger('test_logger'))
+    # Initialize DataWrangler with mock S3 and the openpyxl/xlrd readers
+    data_wrangler = DataWrangler(bucket_name='test-bucket', s3=mock_s3, logger=logging.getLogger('test_logger'),
+                                 excel_engine='standard')
 
     # Mock the regex filtering to return the sample_df
     with mock.patch('pandas.read_excel') as mock_read_excel:
@@ -57,7 +60,17 @@ def test_first_format_data_extraction():
         filtered_df = sample_df[sample_df['Column1'].str.contains(r'[a-zA-Z]', regex=True)]
         pd.testing.assert_frame_equal(result_df.reset_index(drop=True), filtered_df.reset_index(drop=True))
 
-    # Test fallback to xlrd
+    # Test that legacy xls files go straight to xlrd
+    mock_object.get.return_value = {'Body': BytesIO(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + b'\x00' * 504)}
+    with mock.patch('pandas.read_excel') as mock_read_excel:
+        mock_read_excel.return_value = sample_df.copy()
+
+        result_df = data_wrangler.first_format_data_extraction('path/to/test_file.xls')
+
+        mock_read_excel.assert_called_once_with(mock.ANY, engine='xlrd')
+
+    # Test fallback to xlrd when the file signature is not recognised
+    mock_object.get.return_value = {'Body': BytesIO(b'not a known signature')}
     with mock.patch('pandas.read_excel') as mock_read_excel:
         # Simulate openpyxl failing
         mock_read_excel.side_effect = [Exception("openpyxl error"), sample_df.copy()]
@@ -142,4 +155,263 @@ def test_building_complete_report():
     assert 'Product A' in result_df['producto'].values, "'Product A' should be in the result DataFrame"
     assert 'Product B' in result_df['producto'].values, "'Product B' should be in the result DataFrame"
 
+def test_building_complete_report_empty_bucket():
+    data_wrangler = DataWrangler(bucket_name='test-bucket', s3=None, logger=logging.getLogger('test_logger'))
+    data_wrangler.first_format_paths = mock.Mock(return_value=[])
+    data_wrangler.second_format_paths = mock.Mock(return_value=[])
+
+    result_df = data_wrangler.building_complete_report()
+
+    assert result_df.empty, "The report of an empty bucket should be an empty DataFrame"
+
     
+
+
+def test_workbook_routing_reads_once():
+    """Test that a workbook is read once to detect its template and parse it, without checking its file name."""
+    import openpyxl
+    workbook = openpyxl.Workbook()
+    workbook.active.title = 'Índice'
+    for index in range(1, 9):
+        sheet = workbook.create_sheet(f'Cuadro {index}')
+        sheet.append(['Producto', ' Mercado Mayorista', 'Precio mínimo', 'Precio máximo', 'Precio medio', 'Tendencia'])
+        sheet.append(['Acelga', 'Medellín, Central Mayorista de Antioquia', 1000, 1200, 1100, '+'])
+    buffer = BytesIO()
+    workbook.save(buffer)
+
+    mock_s3 = mock.Mock()
+    mock_object = mock_s3.Bucket.return_value.Object.return_value
+    mock_object.get.return_value = {'Body': BytesIO(buffer.getvalue())}
+    data_wrangler = DataWrangler(bucket_name='test-bucket', s3=mock_s3, logger=logging.getLogger('test_logger'))
+
+    file_path = 'reports/2018/week_21_anexo_2018.xlsx'
+    signature = data_wrangler.workbook_signature(file_path, default_format=1)
+    assert (signature.file_format, signature.layout) == (2, 'market_column')
+
+    result_df = data_wrangler.parse_workbook(file_path, signature)
+    assert mock_object.get.call_count == 1
+    assert len(result_df) == 8
+    assert set(result_df['producto']) == {'Acelga'}
+    assert set(result_df['ciudad']) == {'medellín'}
+    assert list(result_df['categoria']) == [data_wrangler.categories_dict[index] for index in range(1, 9)]
+    assert set(result_df['semana_no']) == {21}
+
+
+def test_workbook_signature_is_stored_in_the_manifest():
+    """Test that a template detected by one run routes the workbook in the next run without reading it, and
+    replaces the format given by its path in the inventory."""
+    import boto3
+    import openpyxl
+    from moto import mock_aws
+    workbook = openpyxl.Workbook()
+    workbook.active.append(['Precios mayoristas'])
+    buffer = BytesIO()
+    workbook.save(buffer)
+    file_path = 'reports/2019/week_1_anexo_2019.xlsx'
+
+    with mock_aws():
+        s3 = boto3.resource('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='test-bucket')
+        s3.Object('test-bucket', file_path).put(Body=buffer.getvalue())
+
+        first_run = DataWrangler(bucket_name='test-bucket', s3=s3, logger=logging.getLogger('test_logger'))
+        inventory = first_run.bucket_inventory('test-bucket')
+        detected = first_run.workbook_signature(file_path)
+        inventory.save()
+        assert (detected.file_format, detected.layout) == (1, 'single_tab')
+
+        assert inventory.paths(1) == [file_path]
+
+        next_run = DataWrangler(bucket_name='test-bucket', s3=s3, logger=logging.getLogger('test_logger'))
+        assert next_run.bucket_inventory('test-bucket').paths(1) == [file_path]
+        next_run.read_workbook = mock.Mock()
+        assert next_run.workbook_signature(file_path) == detected
+        next_run.read_workbook.assert_not_called()
+
+
+FIRST_FORMAT_SHEETS = {'Anexo': [
+    ['Precios mayoristas', None, None, None, None],
+    ['Verduras y hortalizas', None, None, None, None],
+    ['Acelga', None, None, None, None],
+    ['Bogotá, D.C., Corabastos', 1000, 1200, 1100, '+'],
+    ['Medellín, Central Mayorista de Antioquia', 900, 1100, 1000.5, '='],
+    ['Cúcuta (Norte de Santander), Cenabastos', 950, 1150, 1050, '-'],
+    ['Cuadro 2. Frutas frescas', None, None, None, None],
+    ['Producto', 'Mínimo', 'Máximo', 'Medio', 'Tendencia'],
+    ['Banano', None, None, None, None],
+    ['Cali (Valle), Cavasa', 800, 900, 850, '-'],
+]}
+SECOND_FORMAT_SHEETS = {'Índice': [['Contenido']], **{
+    f'Cuadro {index}': [['Boletín semanal']] + [[f'Título {line}'] for line in range(9)] + [[None]] + [
+        [f'Producto {index}', 'Bogotá, D.C., Corabastos', 1000 * index, 1200 * index, 1100.5 * index, '+'],
+        [f'Producto {index}', 'Tunja (Boyacá), Complejo de Servicios del Sur', 900, 1000, 950, '-'],
+    ] for index in range(1, 9)}}
+
+
+def workbook_bytes(sheets: dict, container: str) -> bytes:
+    """Builds an xlsx (openpyxl) or xls (xlwt) workbook from sheet names mapped to their rows."""
+    buffer = BytesIO()
+    if container == 'xls':
+        xlwt = pytest.importorskip('xlwt')
+        workbook = xlwt.Workbook()
+        for name, rows in sheets.items():
+            sheet = workbook.add_sheet(name)
+            for row_index, row in enumerate(rows):
+                for column_index, value in enumerate(row):
+                    if value is not None:
+                        sheet.write(row_index, column_index, value)
+    else:
+        import openpyxl
+        workbook = openpyxl.Workbook()
+        workbook.remove(workbook.active)
+        for name, rows in sheets.items():
+            sheet = workbook.create_sheet(name)
+            for row in rows:
+                sheet.append(row)
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def extract(sheets: dict, container: str, excel_engine: str, file_format: int) -> pd.DataFrame:
+    data = workbook_bytes(sheets, container)
+    data_wrangler = DataWrangler(bucket_name='test-bucket', s3=mock.Mock(), logger=logging.getLogger('test_logger'),
+                                 excel_engine=excel_engine)
+    data_wrangler.read_workbook = mock.Mock(return_value=data)
+    if file_format == 1:
+        file_path = 'reports/2017/week_12_anexo_2017.' + container
+        return data_wrangler.first_format_data_transformation(data_wrangler.first_format_data_extraction(file_path), file_path)
+    return data_wrangler.second_format_data_extraction('reports/2020/week_19_anexo_2020.' + container)
+
+
+@pytest.mark.parametrize('file_format, sheets', [(1, FIRST_FORMAT_SHEETS), (2, SECOND_FORMAT_SHEETS)], ids=['first', 'second'])
+@pytest.mark.parametrize('container, excel_engine', [('xls', 'standard'), ('xlsx', 'calamine'), ('xls', 'calamine')],
+                         ids=['xlrd', 'calamine_xlsx', 'calamine_xls'])
+def test_excel_engine_parity(file_format, sheets, container, excel_engine):
+    """Test that every reader extracts the same data as openpyxl, for both SIPSA formats and containers."""
+    if excel_engine == 'calamine':
+        pytest.importorskip('python_calamine')
+    expected = extract(sheets, 'xlsx', 'standard', file_format)
+    assert not expected.empty
+
+    result = extract(sheets, container, excel_engine, file_format)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+
+def test_second_format_reuses_the_routing_signature():
+    """Test that a workbook routed to the second format parser is not fingerprinted a second time."""
+    data_wrangler = DataWrangler(bucket_name='test-bucket', s3=mock.Mock(), logger=logging.getLogger('test_logger'),
+                                 excel_engine='standard')
+    data_wrangler.read_workbook = mock.Mock(return_value=workbook_bytes(SECOND_FORMAT_SHEETS, 'xlsx'))
+    detect = mock.Mock(wraps=data_wrangler.format_detector.detect)
+    data_wrangler.format_detector.detect = detect
+
+    file_path = 'reports/2020/week_19_anexo_2020.xlsx'
+    signature = data_wrangler.workbook_signature(file_path, default_format=2)
+    dataframe = data_wrangler.parse_workbook(file_path, signature)
+
+    assert not dataframe.empty
+    assert detect.call_count == 1
+
+@pytest.mark.parametrize('titles', [7, 3, 9, 0])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_first_format_transformation_golden(titles, seed):
+    """Test that the vectorized transformation returns exactly what the row by row implementation returned."""
+    data_wrangler = DataWrangler(bucket_name='test-bucket', s3=mock.Mock(), logger=logging.getLogger('test_logger'))
+    dataframe = first_format_frame(12, titles, seed)
+    file_path = 'reports/2016/week_7_anexo_2016.xlsx'
+
+    expected = legacy_first_format_transformation(dataframe.copy(), file_path)
+    result = data_wrangler.first_format_data_transformation(dataframe.copy(), file_path)
+    assert len(expected) > 50 or titles == 0
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_first_format_transformation_without_products():
+    """Test that a sheet with category titles but no product block returns a frame without rows nor columns.
+
+    The row by row implementation returned no row too, but kept the columns of the blocks it had gone through
+    or not depending on where the blocks ended, so only the absence of rows is compared with it.
+    """
+    data_wrangler = DataWrangler(bucket_name='test-bucket', s3=mock.Mock(), logger=logging.getLogger('test_logger'))
+    file_path = 'reports/2016/week_7_anexo_2016.xlsx'
+    for titles in (7, 3):
+        dataframe = first_format_frame(0, titles)
+        result = data_wrangler.first_format_data_transformation(dataframe.copy(), file_path)
+        pd.testing.assert_frame_equal(result, pd.DataFrame())
+        assert legacy_first_format_transformation(dataframe.copy(), file_path).empty
+
+
+def test_first_format_transformation_skips_a_malformed_category(caplog):
+    """Test that a category block failing to transform is logged and skipped, and the other ones are kept."""
+    data_wrangler = DataWrangler(bucket_name='test-bucket', s3=mock.Mock(), logger=logging.getLogger('test_logger'))
+    dataframe = first_format_frame(12)
+    file_path = 'reports/2016/week_7_anexo_2016.xlsx'
+    expected = legacy_first_format_transformation(dataframe.copy(), file_path)
+    malformed = data_wrangler.categories_dict[4]
+
+    class MalformedCategories(dict):
+        def get(self, key, default=None):
+            if key == 4:
+                raise ValueError('malformed cuadro block')
+            return super().get(key, default)
+
+    data_wrangler.categories_dict = MalformedCategories(data_wrangler.categories_dict)
+    with caplog.at_level(logging.ERROR, logger='test_logger'):
+        result = data_wrangler.first_format_data_transformation(dataframe.copy(), file_path)
+
+    expected = expected[expected['categoria'] != malformed].reset_index(drop=True)
+    assert expected['categoria'].nunique() == 7
+    pd.testing.assert_frame_equal(result, expected)
+    assert caplog.messages == [f"Error processing category 3 in file {file_path}: malformed cuadro block"]
+
+def test_parse_workbooks_in_processes(caplog):
+    workbooks = {
+        'reports/2016/week_7_anexo_2016.xlsx': (workbook_bytes(FIRST_FORMAT_SHEETS, 'xlsx'), 1),
+        'reports/2020/week_19_anexo_2020.xlsx': (workbook_bytes(SECOND_FORMAT_SHEETS, 'xlsx'), 2),
+        'reports/2017/week_12_anexo_2017.xls': (workbook_bytes(FIRST_FORMAT_SHEETS, 'xls'), 1),
+        'reports/2021/week_3_anexo_2021.xls': (workbook_bytes(SECOND_FORMAT_SHEETS, 'xls'), 2),
+        'reports/2022/week_5_anexo_2022.xlsx': (b'not a workbook', 2),
+    }
+    jobs = [(file_path, default_format) for file_path, (_, default_format) in workbooks.items()]
+
+    def wrangler(parse_workers):
+        data_wrangler = DataWrangler(bucket_name='test-bucket', s3=mock.Mock(), logger=logging.getLogger('test_logger'),
+                                     excel_engine='standard', parse_workers=parse_workers)
+        data_wrangler.read_workbook = lambda file_path: workbooks[file_path][0]
+        data_wrangler._listed_etag = lambda file_path: f'"{file_path}"'
+        return data_wrangler
+
+    serial = list(wrangler(1).parse_workbooks(jobs))
+    parallel_wrangler = wrangler(2)
+    with caplog.at_level(logging.WARNING, logger='test_logger'):
+        parallel = list(parallel_wrangler.parse_workbooks(iter(jobs)))
+
+    # Results come back in the order of the jobs, identical to those parsed in this process
+    assert [file_path for file_path, _, _ in parallel] == list(workbooks)
+    for (_, serial_signature, serial_df), (_, signature, dataframe) in zip(serial, parallel):
+        assert signature == serial_signature
+        pd.testing.assert_frame_equal(dataframe, serial_df)
+    assert not parallel[0][2].empty and not parallel[1][2].empty
+
+    # The templates detected by the workers are cached in the parent, and their log records reach its logger
+    first_path = 'reports/2016/week_7_anexo_2016.xlsx'
+    assert parallel_wrangler.format_detector.cached(f'"{first_path}"').file_format == 1
+    assert any('week_5_anexo_2022' in message for message in caplog.messages)
+
+
+def test_columnar_batch_round_trip():
+    from src.DataWrangler import _from_columnar, _to_columnar
+    dataframe = pd.DataFrame({
+        'producto': ['Papa', None, 'Papa', float('nan'), 'Yuca'],
+        'precio_medio': [1200.0, 900.5, None, 1500.0, 800.0],
+        'tendencia': [1, 1.0, '+', None, True],
+        'semana_no': [7, 7, 7, 7, 7],
+    }, index=[3, 5, 8, 9, 12])
+
+    result = _from_columnar(_to_columnar(dataframe))
+
+    pd.testing.assert_frame_equal(result, dataframe)
+    assert result['producto'][5] is None and result['producto'][9] != result['producto'][9]
+    assert [type(value) for value in result['tendencia']] == [type(value) for value in dataframe['tendencia']]
+    pd.testing.assert_frame_equal(_from_columnar(_to_columnar(pd.DataFrame())), pd.DataFrame())
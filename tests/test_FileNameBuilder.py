@@ -9,6 +9,10 @@ def mock_s3():
     s3 = MagicMock()
     return s3
 
+def mock_listing(mock_s3, keys):
+    # Every page of the S3 client paginator returns these keys, without year folders
+    mock_s3.meta.client.get_paginator.return_value.paginate.return_value = [{'Contents': [{'Key': key} for key in keys]}]
+
 @pytest.fixture
 def file_name_builder(mock_s3, mocker):
     logger = mocker.MagicMock()  # Mock logger
@@ -16,13 +20,13 @@ def file_name_builder(mock_s3, mocker):
 
 def test_first_format_paths(file_name_builder, mock_s3):
     # Mock bucket objects
-    mock_s3.Bucket().objects.all.return_value = [
-        MagicMock(key='reports/2012/week_10_file1.xls'),
-        MagicMock(key='reports/2013/week_15_file2.xlsx'),
-        MagicMock(key='reports/2018/week_19_file3.xlsx'),
-        MagicMock(key='reports/2018/week_20_file4.xlsx'),
-        MagicMock(key='reports/invalid/file.txt')
-    ]
+    mock_listing(mock_s3, [
+        'reports/2012/week_10_file1.xls',
+        'reports/2013/week_15_file2.xlsx',
+        'reports/2018/week_19_file3.xlsx',
+        'reports/2018/week_20_file4.xlsx',
+        'reports/invalid/file.txt'
+    ])
 
     result = file_name_builder.first_format_paths('test-bucket')
 
@@ -34,13 +38,13 @@ def test_first_format_paths(file_name_builder, mock_s3):
 
 def test_second_format_paths(file_name_builder, mock_s3):
     # Mock bucket objects
-    mock_s3.Bucket().objects.all.return_value = [
-        MagicMock(key='reports/2018/week_19_file1.xls'),
-        MagicMock(key='reports/2018/week_20_file2.xlsx'),
-        MagicMock(key='reports/2020/week_10_file3.xlsx'),
-        MagicMock(key='reports/2024/week_11_file4.xlsx'),
-        MagicMock(key='reports/invalid/file.txt')
-    ]
+    mock_listing(mock_s3, [
+        'reports/2018/week_19_file1.xls',
+        'reports/2018/week_20_file2.xlsx',
+        'reports/2020/week_10_file3.xlsx',
+        'reports/2024/week_11_file4.xlsx',
+        'reports/invalid/file.txt'
+    ])
 
     result = file_name_builder.second_format_paths('test-bucket')
 
@@ -52,10 +56,10 @@ def test_second_format_paths(file_name_builder, mock_s3):
 
 def test_first_format_paths_with_errors(file_name_builder, mock_s3, mocker):
     # Mock bucket objects
-    mock_s3.Bucket().objects.all.return_value = [
-        MagicMock(key='reports/2012/week_10_file1.xls'),
-        MagicMock(key='reports/2013/invalid_name.xlsx')  # Invalid file name
-    ]
+    mock_listing(mock_s3, [
+        'reports/2012/week_10_file1.xls',
+        'reports/2013/invalid_name.xlsx'  # Invalid file name
+    ])
 
     # Mock the logger to check for warnings
     mock_logger = mocker.patch.object(file_name_builder.logger, 'warning')
@@ -70,10 +74,10 @@ def test_first_format_paths_with_errors(file_name_builder, mock_s3, mocker):
 
 def test_second_format_paths_with_errors(file_name_builder, mock_s3, mocker):
     # Mock bucket objects
-    mock_s3.Bucket().objects.all.return_value = [
-        MagicMock(key='reports/2019/week_abc_file1.xls'),  # Invalid week number
-        MagicMock(key='reports/2020/week_10_file2.xlsx')
-    ]
+    mock_listing(mock_s3, [
+        'reports/2019/week_abc_file1.xls',  # Invalid week number
+        'reports/2020/week_10_file2.xlsx'
+    ])
 
     # Mock the logger to check for warnings
     mock_logger = mocker.patch.object(file_name_builder.logger, 'warning')
@@ -0,0 +1,296 @@
+import pytest
+import boto3
+import pandas as pd
+import sqlalchemy
+from io import BytesIO
+from unittest.mock import MagicMock
+from moto import mock_aws
+from src.DataCollector import DataCollector
+from src.FilesTracker import (CsvFilesTracker, DatabaseFilesTracker, FilesTracker, S3FilesTracker, SqliteFilesTracker,
+                               WriteBehindTracker, get_files_tracker)
+
+
+@pytest.fixture
+def mock_logger():
+    """Fixture to mock the logger."""
+    return MagicMock()
+
+
+@pytest.fixture
+def s3_bucket():
+    """Fixture providing a local S3 stand-in with an empty bucket."""
+    with mock_aws():
+        s3 = boto3.resource('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='test-bucket')
+        yield s3
+
+
+def put_csv_tracker(s3, df):
+    buffer = BytesIO()
+    df.to_csv(buffer, index=False)
+    s3.Object('test-bucket', 'files_tracker.csv').put(Body=buffer.getvalue())
+
+
+CSV_TRACKER = pd.DataFrame({
+    'file': ['week_1_a.xlsx', 'week_2_b.xlsx'],
+    'link': ['https://x/a.xlsx', 'https://x/b.xlsx'],
+    'date_added': ['2024-01-01', '2024-01-08'],
+    'rds_load': ['yes', None],
+})
+
+
+def test_sqlite_tracker_migrates_csv(s3_bucket, mock_logger):
+    """Test that the SQLite tracker imports files_tracker.csv on first use and leaves the CSV in place."""
+    put_csv_tracker(s3_bucket, CSV_TRACKER)
+
+    tracker = SqliteFilesTracker(s3_bucket, mock_logger, 'test-bucket')
+    assert tracker.get('week_1_a.xlsx')['rds_load'] == 'yes'
+    assert tracker.get('week_2_b.xlsx')['rds_load'] is None
+    assert tracker.get('week_3_c.xlsx') is None
+    pd.testing.assert_frame_equal(tracker.load(), CSV_TRACKER)
+
+    tracker.checkpoint()
+    keys = {obj.key for obj in s3_bucket.Bucket('test-bucket').objects.all()}
+    assert keys == {'files_tracker.csv', 'files_tracker.sqlite'}
+
+    # The next run reads the SQLite tracker
+    reloaded = SqliteFilesTracker(s3_bucket, mock_logger, 'test-bucket')
+    pd.testing.assert_frame_equal(reloaded.load(), CSV_TRACKER)
+
+
+def test_sqlite_tracker_upsert(s3_bucket, mock_logger):
+    """Test keyed upserts, including new columns, and that only changed trackers are uploaded."""
+    tracker = SqliteFilesTracker(s3_bucket, mock_logger, 'test-bucket')
+    tracker.upsert('week_1_a.xlsx', link='https://x/a.xlsx', date_added='2024-01-01')
+    tracker.upsert('week_1_a.xlsx', rds_load='yes')
+    tracker.upsert('week_2_b.xlsx', rds_load='yes', size=12)
+
+    assert tracker.get('week_1_a.xlsx') == {'file': 'week_1_a.xlsx', 'link': 'https://x/a.xlsx',
+                                            'date_added': '2024-01-01', 'rds_load': 'yes', 'size': None}
+    assert tracker.get('week_2_b.xlsx')['size'] == 12
+    assert list(tracker.load()['file']) == ['week_1_a.xlsx', 'week_2_b.xlsx']
+
+    client = s3_bucket.meta.client
+    tracker.checkpoint()
+    etag = client.head_object(Bucket='test-bucket', Key='files_tracker.sqlite')['ETag']
+    assert not tracker.dirty
+
+    tracker.checkpoint()
+    assert client.head_object(Bucket='test-bucket', Key='files_tracker.sqlite')['ETag'] == etag
+
+    tracker.save(pd.DataFrame({'file': ['week_3_c.xlsx'], 'link': ['https://x/c.xlsx'],
+                               'date_added': ['2024-01-15']}))
+    reloaded = SqliteFilesTracker(s3_bucket, mock_logger, 'test-bucket')
+    assert list(reloaded.load()['file']) == ['week_1_a.xlsx', 'week_2_b.xlsx', 'week_3_c.xlsx']
+
+
+def test_sqlite_tracker_exports_csv(s3_bucket, mock_logger):
+    """Test that readers of files_tracker.csv see the loads recorded by the SQLite tracker after migration."""
+    put_csv_tracker(s3_bucket, CSV_TRACKER)
+    tracker = SqliteFilesTracker(s3_bucket, mock_logger, 'test-bucket')
+    tracker.upsert('week_2_b.xlsx', rds_load='yes')
+    tracker.checkpoint()
+
+    exported = pd.read_csv(BytesIO(s3_bucket.Object('test-bucket', 'files_tracker.csv').get()['Body'].read()))
+    assert list(exported['rds_load']) == ['yes', 'yes']
+    pd.testing.assert_frame_equal(exported, tracker.load())
+
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite'])
+def test_backend_parity(s3_bucket, mock_logger, backend):
+    """Test that both backends answer the same lookups after the same updates."""
+    put_csv_tracker(s3_bucket, CSV_TRACKER)
+    tracker = get_files_tracker(backend, s3_bucket, mock_logger, 'test-bucket')
+
+    tracker.upsert('week_2_b.xlsx', rds_load='yes')
+    tracker.upsert('week_3_c.xlsx', rds_load='yes')
+    tracker.checkpoint()
+
+    assert tracker.get('week_2_b.xlsx') == {'file': 'week_2_b.xlsx', 'link': 'https://x/b.xlsx',
+                                            'date_added': '2024-01-08', 'rds_load': 'yes'}
+    assert tracker.get('week_3_c.xlsx')['rds_load'] == 'yes'
+    assert tracker.get('week_3_c.xlsx')['link'] is None
+    assert list(tracker.load()['file']) == ['week_1_a.xlsx', 'week_2_b.xlsx', 'week_3_c.xlsx']
+
+
+def test_get_files_tracker(mock_logger):
+    """Test selecting the backend."""
+    assert type(get_files_tracker('csv', MagicMock(), mock_logger, 'test-bucket')) is CsvFilesTracker
+    assert type(get_files_tracker('sqlite', MagicMock(), mock_logger, 'test-bucket')) is SqliteFilesTracker
+    engine = MagicMock()
+    assert get_files_tracker('postgres', MagicMock(), mock_logger, 'test-bucket', engine=engine).engine is engine
+    with pytest.raises(ValueError):
+        get_files_tracker('parquet', MagicMock(), mock_logger, 'test-bucket')
+    with pytest.raises(ValueError):
+        get_files_tracker('postgres', MagicMock(), mock_logger, 'test-bucket')
+
+
+def test_write_behind_tracker(mock_logger, mocker):
+    """Test that the buffer writes the tracker back every few files or seconds, and on flush."""
+    clock = mocker.patch('src.FilesTracker.time.monotonic', return_value=0.0)
+    tracker = MagicMock()
+    buffer = WriteBehindTracker(tracker, mock_logger, max_pending=3, max_seconds=10)
+
+    for week in range(1, 4):
+        buffer.upsert(f'week_{week}_a.xlsx', rds_load='yes')
+        buffer.checkpoint()
+    assert tracker.upsert.call_count == 3
+    assert tracker.checkpoint.call_count == 1
+
+    # A window is also closed once it is older than max_seconds
+    clock.return_value = 100.0
+    buffer.upsert('week_4_a.xlsx', rds_load='yes')
+    buffer.checkpoint()
+    assert tracker.checkpoint.call_count == 1
+    clock.return_value = 110.0
+    buffer.checkpoint()
+    assert tracker.checkpoint.call_count == 2
+
+    # Flushing writes only pending updates
+    buffer.flush()
+    assert tracker.checkpoint.call_count == 2
+    buffer.upsert('week_5_a.xlsx', rds_load='yes')
+    buffer.flush()
+    assert tracker.checkpoint.call_count == 3
+    assert buffer.checkpoints == 3
+    assert buffer.get('week_5_a.xlsx') is tracker.get.return_value
+
+
+def test_database_tracker(s3_bucket, mock_logger, tmp_path):
+    """Test the tracker table: import of the S3 tracker, keyed upserts and updates joining a transaction."""
+    put_csv_tracker(s3_bucket, CSV_TRACKER)
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path / "rds.sqlite"}')
+    tracker = DatabaseFilesTracker(s3_bucket, mock_logger, 'test-bucket', engine)
+
+    assert tracker.get('week_1_a.xlsx')['rds_load'] == 'yes'
+    assert list(tracker.load()['file']) == ['week_1_a.xlsx', 'week_2_b.xlsx']
+
+    tracker.upsert('week_2_b.xlsx', rds_load='yes', pages=3)
+    assert tracker.get('week_2_b.xlsx')['pages'] == 3
+
+    # An update made in a transaction is rolled back with it
+    with pytest.raises(RuntimeError):
+        with engine.begin() as connection:
+            tracker.upsert_in_transaction(connection, 'week_3_c.xlsx', rds_load='yes', sheets=9)
+            raise RuntimeError('insert failed')
+    assert tracker.get('week_3_c.xlsx') is None
+
+    with engine.begin() as connection:
+        tracker.upsert_in_transaction(connection, 'week_3_c.xlsx', rds_load='yes', sheets=9)
+    assert tracker.get('week_3_c.xlsx')['sheets'] == 9
+
+    # Nothing is written to S3, and the table is not imported again
+    tracker.checkpoint()
+    keys = {obj.key for obj in s3_bucket.Bucket('test-bucket').objects.all()}
+    assert keys == {'files_tracker.csv'}
+    reloaded = DatabaseFilesTracker(s3_bucket, mock_logger, 'test-bucket', engine)
+    assert len(reloaded.load()) == 3
+
+
+
+def test_database_tracker_keeps_loads_committed_after_a_collector_snapshot(s3_bucket, mock_logger, tmp_path, mocker):
+    """Test that saving a tracker snapshot read before another run recorded a load does not erase the load."""
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path / "rds.sqlite"}')
+    collector = DataCollector(s3_bucket, mock_logger, tracker_backend='postgres')
+    collector.engine = engine
+    tracker = collector.tracker_store('test-bucket')
+    tracker.save(pd.DataFrame({'file': ['week_1_a.xlsx', 'week_2_b.xlsx'], 'link': ['https://x/a', 'https://x/b'],
+                               'date_added': ['2024-01-01', '2024-01-08']}))
+    snapshot = collector.load_files_tracker('test-bucket')
+
+    # Another run loads a file, then the collector saves its snapshot with a new download
+    DatabaseFilesTracker(s3_bucket, mock_logger, 'test-bucket', engine).upsert('week_1_a.xlsx', rds_load='yes')
+    snapshot.loc[snapshot['file'] == 'week_2_b.xlsx', 'rds_load'] = 'pending'
+    snapshot = pd.concat([snapshot, pd.DataFrame({'file': ['week_3_c.xlsx'], 'link': ['https://x/c'],
+                                                  'date_added': ['2024-01-15']})], ignore_index=True)
+    execute = mocker.spy(sqlalchemy.engine.Connection, 'execute')
+    collector.update_files_tracker(snapshot, 'test-bucket')
+
+    assert tracker.get('week_1_a.xlsx')['rds_load'] == 'yes'
+    assert tracker.get('week_2_b.xlsx')['rds_load'] is None
+    assert tracker.get('week_3_c.xlsx')['link'] == 'https://x/c'
+    # Only the new row is written, in a single statement
+    inserts = [call for call in execute.call_args_list if str(call.args[1]).lstrip().startswith('INSERT')]
+    assert len(inserts) == 1 and len(inserts[0].args[2]) == 1
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite'])
+def test_concurrent_runs_merge(s3_bucket, mock_logger, backend):
+    """Test that two runs writing the same tracker keep each other's updates instead of overwriting them."""
+    put_csv_tracker(s3_bucket, CSV_TRACKER)
+    get_files_tracker(backend, s3_bucket, mock_logger, 'test-bucket').save(CSV_TRACKER)
+    scheduled = get_files_tracker(backend, s3_bucket, mock_logger, 'test-bucket')
+    backfill = get_files_tracker(backend, s3_bucket, mock_logger, 'test-bucket')
+    scheduled.load()
+    backfill.load()
+
+    scheduled.upsert('week_2_b.xlsx', rds_load='yes')
+    scheduled.upsert('week_3_c.xlsx', link='https://x/c.xlsx')
+    backfill.upsert('week_4_d.xlsx', rds_load='yes')
+    backfill.upsert('week_3_c.xlsx', rds_load='yes')
+    scheduled.checkpoint()
+    backfill.checkpoint()
+    assert (scheduled.conflicts, backfill.conflicts) == (0, 1)
+
+    # The backfill sees the loads of the scheduled run once merged
+    assert backfill.get('week_2_b.xlsx')['rds_load'] == 'yes'
+    assert backfill.get('week_3_c.xlsx')['link'] == 'https://x/c.xlsx'
+    assert backfill.get('week_3_c.xlsx')['rds_load'] == 'yes'
+
+    # The scheduled run picks the backfill's updates up on refresh, keeping its own pending ones
+    scheduled.upsert('week_5_e.xlsx', rds_load='yes')
+    assert scheduled.refresh()
+    assert not scheduled.refresh()
+    assert scheduled.get('week_4_d.xlsx')['rds_load'] == 'yes'
+    scheduled.checkpoint()
+    assert scheduled.conflicts == 0
+
+    reloaded = get_files_tracker(backend, s3_bucket, mock_logger, 'test-bucket').load()
+    assert list(reloaded['file']) == ['week_1_a.xlsx', 'week_2_b.xlsx', 'week_3_c.xlsx', 'week_4_d.xlsx', 'week_5_e.xlsx']
+    assert list(reloaded['rds_load']) == ['yes'] * 5
+
+
+def test_first_write_is_conditional(s3_bucket, mock_logger):
+    """Test that two runs creating the tracker at the same time both keep their rows."""
+    first = SqliteFilesTracker(s3_bucket, mock_logger, 'test-bucket')
+    second = SqliteFilesTracker(s3_bucket, mock_logger, 'test-bucket')
+    first.upsert('week_1_a.xlsx', rds_load='yes')
+    second.upsert('week_2_b.xlsx', rds_load='yes')
+    first.checkpoint()
+    second.checkpoint()
+
+    assert second.conflicts == 1
+    reloaded = SqliteFilesTracker(s3_bucket, mock_logger, 'test-bucket')
+    assert list(reloaded.load()['file']) == ['week_1_a.xlsx', 'week_2_b.xlsx']
+
+
+def test_tracker_bases_are_abstract(s3_bucket, mock_logger):
+    """Test that the backend bases cannot be used as trackers themselves."""
+    with pytest.raises(TypeError):
+        FilesTracker(s3_bucket, mock_logger, 'test-bucket')
+    with pytest.raises(TypeError):
+        S3FilesTracker(s3_bucket, mock_logger, 'test-bucket', 'files_tracker.csv')
+
+
+def test_write_behind_tracker_throttles_refreshes(mock_logger, mocker):
+    """Test that the tracker is read again at most once per window, and not right after a write."""
+    clock = mocker.patch('src.FilesTracker.time.monotonic', return_value=0.0)
+    tracker = MagicMock()
+    buffer = WriteBehindTracker(tracker, mock_logger, max_pending=3, max_seconds=10)
+
+    for _ in range(100):
+        buffer.refresh()
+    tracker.refresh.assert_not_called()
+
+    clock.return_value = 10.0
+    buffer.refresh()
+    buffer.refresh()
+    assert tracker.refresh.call_count == 1
+
+    clock.return_value = 25.0
+    buffer.upsert('week_1_a.xlsx', rds_load='yes')
+    buffer.flush()
+    buffer.refresh()
+    assert tracker.refresh.call_count == 1
+    clock.return_value = 35.0
+    buffer.refresh()
+    assert tracker.refresh.call_count == 2
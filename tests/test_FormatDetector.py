@@ -0,0 +1,75 @@
+import pytest
+import logging
+import openpyxl
+from io import BytesIO
+from unittest.mock import MagicMock
+from src.FormatDetector import FormatDetector, WorkbookSignature
+
+
+def workbook_bytes(sheets: dict) -> bytes:
+    """Builds an xlsx workbook from sheet names mapped to their rows."""
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for name, rows in sheets.items():
+        sheet = workbook.create_sheet(name)
+        for row in rows:
+            sheet.append(row)
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+FOOD_CLASSES = ['Verduras', 'Frutas', 'Tubérculos', 'Granos', 'Huevos', 'Carnes', 'Pescados', 'Procesados']
+
+SINGLE_TAB = workbook_bytes({'Anexo': [['Precios mayoristas'], ['Cuadro 1. Verduras y hortalizas'], ['Acelga']]})
+FOOD_CLASS_TABS = workbook_bytes({'Índice': [['Contenido']],
+                                  **{name: [['Boletín semanal'], [None], ['Producto', 'Mercado']] for name in FOOD_CLASSES}})
+MARKET_COLUMN = workbook_bytes({'Índice': [['Contenido']],
+                                **{name: [['Producto', ' Mercado mayorista ', 'Precio mínimo']] for name in FOOD_CLASSES}})
+
+
+@pytest.fixture
+def detector():
+    return FormatDetector(MagicMock())
+
+
+@pytest.mark.parametrize('data, expected', [
+    (SINGLE_TAB, (1, 'single_tab')),
+    (FOOD_CLASS_TABS, (2, 'food_class_tabs')),
+    (MARKET_COLUMN, (2, 'market_column')),
+    (b'<html>Not found</html>', (None, 'unknown')),
+], ids=['single_tab', 'food_class_tabs', 'market_column', 'not_a_workbook'])
+def test_detect(detector, data, expected):
+    """Test fingerprinting the DANE templates from their sheets and header row."""
+    signature = detector.detect(data)
+    assert (signature.file_format, signature.layout) == expected
+
+
+def test_detect_reads_structure(detector):
+    """Test the container, sheet names and header recorded in the signature."""
+    signature = detector.detect(MARKET_COLUMN)
+    assert signature.container == 'xlsx'
+    assert signature.sheet_names == ('Índice', *FOOD_CLASSES)
+    assert signature.header == ('Producto', 'Mercado mayorista', 'Precio mínimo')
+
+
+def test_container():
+    """Test sniffing the container from the magic bytes."""
+    assert FormatDetector.container(SINGLE_TAB) == 'xlsx'
+    assert FormatDetector.container(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + b'\x00' * 504) == 'xls'
+    assert FormatDetector.container(b'') == 'unknown'
+
+
+def test_signatures_are_cached_per_etag(detector, mocker):
+    """Test that a workbook version is fingerprinted once, and new templates are logged once."""
+    load_workbook = mocker.spy(openpyxl, 'load_workbook')
+    first = detector.detect(FOOD_CLASS_TABS, etag='"v1"')
+    assert detector.detect(FOOD_CLASS_TABS, etag='"v1"') is first
+    assert load_workbook.call_count == 1
+    assert detector.cached('"v1"') is first
+
+    # A new version of the object is fingerprinted again
+    assert detector.detect(SINGLE_TAB, etag='"v2"').file_format == 1
+    assert load_workbook.call_count == 2
+    detector.detect(SINGLE_TAB, etag='"v3"')
+    assert detector.logger.info.call_count == 2
@@ -0,0 +1,81 @@
+import pytest
+from src.LinkExtractor import Link, BeautifulSoupLinkExtractor, LxmlLinkExtractor, get_link_extractor
+
+LANDING_PAGE = """
+<html><head><meta charset="utf-8"><title>Mayoristas – boletín semanal</title></head>
+<body>
+  <nav><a href="/index.php">Inicio</a><a href="/index.php/estadisticas">Estadísticas</a></nav>
+  <div class="item-page">
+    <a href="/sipsa/2024">2024</a>
+    <a href="/sipsa/2023"> 2023 </a>
+    <a href="/sipsa/2022"><span>2022</span></a>
+    <a href="/sipsa/2021">
+        2021
+    </a>
+    <a href="/sipsa/otros">2020 y anteriores</a>
+    <a name="ancla">2019</a>
+    <a href="">2018</a>
+    <p>2017</p>
+  </div>
+</body></html>
+""".encode('utf-8')
+
+YEAR_PAGE = """
+<html><head><meta charset="utf-8"></head>
+<body>
+  <a href="/files/anexo_1.xlsx" target="_blank">Anexo</a>
+  <a href="/files/boletin_1.pdf" target="_blank">Boletín</a>
+  <a href="/files/anexo_2.xlsx" target="_blank"><img src="x.png"> Anexo <b>semana 2</b></a>
+  <a href="/files/anexo_3.xlsx" target="_self">Anexo</a>
+  <a href="/files/a&amp;b.xlsx" target="_blank">Anexo &amp; más</a>
+  <area href="/files/anexo_4.xlsx" target="_blank">
+  <span target="_blank">Anexo sin enlace</span>
+  <a href="/files/anexo_5.xls" target="_blank">Anexos semanales</a>
+</body></html>
+""".encode('utf-8')
+
+extractors = [BeautifulSoupLinkExtractor(), LxmlLinkExtractor()]
+
+
+@pytest.mark.parametrize('extractor', extractors, ids=lambda extractor: extractor.name)
+def test_year_links(extractor):
+    """Test extracting the year links from the landing page."""
+    links = extractor.year_links(LANDING_PAGE)
+    assert [link.href for link in links] == ['/sipsa/2024', '/sipsa/2023', '/sipsa/2022', '/sipsa/2021']
+    assert [link.get_text().strip() for link in links] == ['2024', '2023', '2022', '2021']
+
+
+@pytest.mark.parametrize('extractor', extractors, ids=lambda extractor: extractor.name)
+def test_report_links(extractor):
+    """Test extracting the 'Anexo' links opening in a new tab from a year page."""
+    links = extractor.report_links(YEAR_PAGE)
+    assert [link['href'] for link in links] == [
+        '/files/anexo_1.xlsx', '/files/anexo_2.xlsx', '/files/a&b.xlsx', '/files/anexo_5.xls'
+    ]
+    assert links[2].text == 'Anexo & más'
+
+
+@pytest.mark.parametrize('page', [LANDING_PAGE, YEAR_PAGE, b'', b'   ', b"<a href='/link1'>2012</a>"])
+def test_backend_parity(page):
+    """Test that the lxml backend returns exactly the same links as the BeautifulSoup reference."""
+    reference, fast = extractors
+    assert fast.year_links(page) == reference.year_links(page)
+    assert fast.report_links(page) == reference.report_links(page)
+
+
+def test_link_behaves_like_a_tag():
+    """Test that Link supports the accessors used on BeautifulSoup tags."""
+    link = Link('/sipsa/2024', '2024')
+    assert link['href'] == '/sipsa/2024'
+    assert link.text == link.get_text() == '2024'
+    assert link[0] == '/sipsa/2024'
+    href, text = link
+    assert (href, text) == ('/sipsa/2024', '2024')
+
+
+def test_get_link_extractor():
+    """Test selecting the backend."""
+    assert isinstance(get_link_extractor(), LxmlLinkExtractor)
+    assert type(get_link_extractor('bs4')) is BeautifulSoupLinkExtractor
+    with pytest.raises(ValueError):
+        get_link_extractor('regex')
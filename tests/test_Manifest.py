@@ -0,0 +1,153 @@
+import pytest
+import datetime
+import boto3
+from unittest.mock import MagicMock
+from botocore.exceptions import ClientError
+from moto import mock_aws
+from src.Manifest import Manifest
+
+
+def entry(key, etag='"a"', size=10):
+    """Builds a listing entry for a 2024 workbook."""
+    return {'key': key, 'year': '2024', 'week': int(key.split('_')[1]), 'file_format': 2, 'size': size,
+            'etag': etag, 'last_modified': datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)}
+
+
+@pytest.fixture
+def s3():
+    """Fixture providing a local S3 stand-in with an empty bucket."""
+    with mock_aws():
+        s3 = boto3.resource('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='test-bucket')
+        yield s3
+
+
+@pytest.fixture
+def manifest(s3):
+    """Fixture providing a loaded, empty manifest."""
+    manifest = Manifest(s3, MagicMock(), 'test-bucket')
+    manifest.load()
+    return manifest
+
+
+def test_apply_listing_delta(manifest):
+    """Test that only new, changed and deleted workbooks touch the manifest rows."""
+    manifest.apply_listing(['reports/2024/'], [entry('reports/2024/week_1_a.xlsx'), entry('reports/2024/week_2_b.xlsx')])
+    manifest.set_parse_status('reports/2024/week_1_a.xlsx', 'loaded')
+    manifest.set_parse_status('reports/2024/week_2_b.xlsx', 'loaded')
+
+    counts = manifest.apply_listing(['reports/2024/'], [
+        entry('reports/2024/week_1_a.xlsx'),
+        entry('reports/2024/week_2_b.xlsx', etag='"b"'),
+        entry('reports/2024/week_3_c.xlsx'),
+    ])
+
+    assert counts == {'added': 1, 'changed': 1, 'removed': 0}
+    assert [(row['key'], row['parse_status']) for row in manifest.rows()] == [
+        ('reports/2024/week_1_a.xlsx', 'loaded'),
+        ('reports/2024/week_2_b.xlsx', 'pending'),
+        ('reports/2024/week_3_c.xlsx', 'pending'),
+    ]
+
+
+def test_apply_listing_only_touches_listed_prefixes(manifest):
+    """Test that rows under prefixes that were not listed are kept, and missing ones are removed."""
+    manifest.apply_listing(['reports/2023/', 'reports/2024/'], [
+        {**entry('reports/2023/week_1_a.xlsx'), 'year': '2023'}, entry('reports/2024/week_1_b.xlsx')])
+
+    counts = manifest.apply_listing(['reports/2024/'], [])
+
+    assert counts == {'added': 0, 'changed': 0, 'removed': 1}
+    assert [row['key'] for row in manifest.rows()] == ['reports/2023/week_1_a.xlsx']
+
+
+def test_save_and_reload(s3, manifest):
+    """Test that the manifest round-trips through the bucket and is only uploaded when it changed."""
+    manifest.apply_listing(['reports/2024/'], [entry('reports/2024/week_1_a.xlsx')])
+    manifest.set_parse_status('reports/2024/week_1_a.xlsx', 'loaded')
+    manifest.save()
+    assert not manifest.dirty
+
+    reloaded = Manifest(s3, MagicMock(), 'test-bucket')
+    reloaded.load()
+    assert reloaded.rows() == [{**entry('reports/2024/week_1_a.xlsx'), 'parse_status': 'loaded'}]
+
+    reloaded.s3 = MagicMock()
+    reloaded.save()
+    reloaded.s3.Object.assert_not_called()
+
+
+def test_save_raises_client_errors(manifest):
+    """Test that a failed upload is raised and the manifest stays dirty for the next save."""
+    manifest.apply_listing(['reports/2024/'], [entry('reports/2024/week_1_a.xlsx')])
+    manifest.bucket_name = 'missing-bucket'
+
+    with pytest.raises(ClientError):
+        manifest.save()
+    assert manifest.dirty
+
+
+def test_full_listing_removes_unlisted_prefixes(manifest):
+    """Test that a full listing drops rows of folders that are gone and records when it ran."""
+    manifest.apply_listing(['reports/2023/', 'reports/2024/'], [
+        {**entry('reports/2023/week_1_a.xlsx'), 'year': '2023'}, entry('reports/2024/week_1_b.xlsx')])
+    assert manifest.last_full_listing() is None
+
+    counts = manifest.apply_listing(['reports/2024/'], [entry('reports/2024/week_1_b.xlsx')], full=True)
+
+    assert counts == {'added': 0, 'changed': 0, 'removed': 1}
+    assert [row['key'] for row in manifest.rows()] == ['reports/2024/week_1_b.xlsx']
+    assert manifest.last_full_listing() > datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=1)
+
+
+def test_concurrent_saves_merge(s3):
+    """Test that overlapping runs saving the manifest keep each other's updates."""
+    scheduled = Manifest(s3, MagicMock(), 'test-bucket')
+    scheduled.load()
+    scheduled.apply_listing(['reports/2024/'], [entry('reports/2024/week_1_a.xlsx'), entry('reports/2024/week_2_b.xlsx')])
+    scheduled.save()
+
+    backfill = Manifest(s3, MagicMock(), 'test-bucket')
+    backfill.load()
+    scheduled.set_parse_status('reports/2024/week_1_a.xlsx', 'loaded')
+    scheduled.save()
+
+    # The backfill read the manifest before that save, and lists a new workbook and a republished one
+    backfill.set_parse_status('reports/2024/week_2_b.xlsx', 'empty')
+    backfill.apply_listing(['reports/2024/'], [
+        entry('reports/2024/week_1_a.xlsx'), entry('reports/2024/week_2_b.xlsx', etag='"b"'),
+        entry('reports/2024/week_3_c.xlsx')])
+    backfill.save()
+
+    assert (scheduled.conflicts, backfill.conflicts) == (0, 1)
+    reloaded = Manifest(s3, MagicMock(), 'test-bucket')
+    reloaded.load()
+    assert [(row['key'], row['etag'], row['parse_status']) for row in reloaded.rows()] == [
+        ('reports/2024/week_1_a.xlsx', '"a"', 'loaded'),
+        ('reports/2024/week_2_b.xlsx', '"b"', 'pending'),
+        ('reports/2024/week_3_c.xlsx', '"a"', 'pending'),
+    ]
+
+
+def test_signatures_are_kept_per_version(s3, manifest):
+    """Test that a stored template survives a save and is dropped when the workbook is republished."""
+    signature = {'file_format': 2, 'layout': 'market_column', 'container': 'xlsx',
+                 'sheet_names': ['Índice', 'Cuadro 1'], 'header': ['Producto', 'Mercado mayorista']}
+    manifest.apply_listing(['reports/2024/'], [entry('reports/2024/week_1_a.xlsx')])
+    manifest.set_signature('reports/2024/week_1_a.xlsx', '"a"', signature)
+    manifest.set_signature('reports/2024/week_1_a.xlsx', '"old"', {**signature, 'file_format': 1})
+    manifest.save()
+
+    reloaded = Manifest(s3, MagicMock(), 'test-bucket')
+    reloaded.load()
+    assert reloaded.signature('reports/2024/week_1_a.xlsx', '"a"') == signature
+
+    # The detected format is kept by listings of the same version, the path rule applies to a new one
+    reloaded.apply_listing(['reports/2024/'], [{**entry('reports/2024/week_1_a.xlsx'), 'file_format': 1}])
+    assert reloaded.rows()[0]['file_format'] == 2
+    reloaded.set_signature('reports/2024/week_1_a.xlsx', '"a"', {**signature, 'file_format': 1})
+    assert reloaded.rows()[0]['file_format'] == 1
+
+    reloaded.apply_listing(['reports/2024/'], [entry('reports/2024/week_1_a.xlsx', etag='"b"')])
+    assert reloaded.signature('reports/2024/week_1_a.xlsx', '"b"') is None
+    assert reloaded.rows()[0]['file_format'] == 2
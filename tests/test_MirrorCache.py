@@ -0,0 +1,117 @@
+import pytest
+import mmap
+import os
+import time
+import boto3
+import pandas as pd
+from io import BytesIO
+from unittest.mock import MagicMock
+from moto import mock_aws
+from src.MirrorCache import MirrorCache
+from src.DataWrangler import DataWrangler
+
+
+@pytest.fixture
+def s3_bucket():
+    """Fixture providing a local S3 stand-in with a bucket holding three small workbooks."""
+    with mock_aws():
+        s3 = boto3.resource('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='test-bucket')
+        for week in (1, 2, 3):
+            s3.Object('test-bucket', f'reports/2024/week_{week}.xlsx').put(Body=bytes([week]) * 100)
+        yield s3
+
+
+def test_open_caches_by_key_and_etag(s3_bucket, tmp_path, mocker):
+    """Test that a workbook is fetched once, then served from a memory map."""
+    cache = MirrorCache(s3_bucket, MagicMock(), tmp_path)
+    spy_get = mocker.spy(s3_bucket.meta.client, 'get_object')
+
+    first = cache.open('test-bucket', 'reports/2024/week_1.xlsx')
+    second = cache.open('test-bucket', 'reports/2024/week_1.xlsx')
+
+    assert isinstance(second, mmap.mmap)
+    assert first[:] == second[:] == bytes([1]) * 100
+    assert spy_get.call_count == 1
+    assert cache.stats() == {'files': 1, 'bytes': 100, 'hits': 1, 'misses': 1, 'evictions': 0}
+
+
+def test_open_with_listing_etag_sends_no_request(s3_bucket, tmp_path, mocker):
+    """Test that a hit with a known ETag does not touch S3 at all."""
+    cache = MirrorCache(s3_bucket, MagicMock(), tmp_path)
+    etag = s3_bucket.Object('test-bucket', 'reports/2024/week_1.xlsx').e_tag
+    cache.open('test-bucket', 'reports/2024/week_1.xlsx', etag)
+
+    spy_head = mocker.spy(s3_bucket.meta.client, 'head_object')
+    spy_get = mocker.spy(s3_bucket.meta.client, 'get_object')
+    assert cache.open('test-bucket', 'reports/2024/week_1.xlsx', etag)[:] == bytes([1]) * 100
+    assert spy_head.call_count == spy_get.call_count == 0
+
+
+def test_new_version_replaces_old_one(s3_bucket, tmp_path):
+    """Test that a new ETag of the same key is fetched again and the old copy is dropped."""
+    cache = MirrorCache(s3_bucket, MagicMock(), tmp_path)
+    cache.open('test-bucket', 'reports/2024/week_1.xlsx')
+    s3_bucket.Object('test-bucket', 'reports/2024/week_1.xlsx').put(Body=b'updated')
+
+    assert cache.open('test-bucket', 'reports/2024/week_1.xlsx')[:] == b'updated'
+    assert cache.stats()['files'] == 1
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_stale_listing_etag_mirrors_the_current_version(s3_bucket, tmp_path):
+    """Test that an object replaced since it was listed is fetched at its current version instead of failing."""
+    cache = MirrorCache(s3_bucket, MagicMock(), tmp_path)
+    listed = s3_bucket.Object('test-bucket', 'reports/2024/week_1.xlsx').e_tag
+    s3_bucket.Object('test-bucket', 'reports/2024/week_1.xlsx').put(Body=b'republished')
+
+    assert cache.open('test-bucket', 'reports/2024/week_1.xlsx', listed)[:] == b'republished'
+    assert cache.stats() == {'files': 1, 'bytes': 11, 'hits': 0, 'misses': 1, 'evictions': 0}
+    current = s3_bucket.Object('test-bucket', 'reports/2024/week_1.xlsx').e_tag
+    assert cache.open('test-bucket', 'reports/2024/week_1.xlsx', current)[:] == b'republished'
+    assert cache.stats()['hits'] == 1
+
+
+def test_lru_eviction(s3_bucket, tmp_path):
+    """Test that the least recently used workbook is evicted to stay under the size limit."""
+    cache = MirrorCache(s3_bucket, MagicMock(), tmp_path, max_bytes=250)
+    cache.open('test-bucket', 'reports/2024/week_1.xlsx')
+    cache.open('test-bucket', 'reports/2024/week_2.xlsx')
+    cache.open('test-bucket', 'reports/2024/week_1.xlsx')
+    cache.open('test-bucket', 'reports/2024/week_3.xlsx')
+
+    stats = cache.stats()
+    assert (stats['files'], stats['bytes'], stats['evictions']) == (2, 200, 1)
+    cache.open('test-bucket', 'reports/2024/week_1.xlsx')
+    assert cache.stats()['hits'] == 2
+
+
+def test_lru_order_survives_restart(s3_bucket, tmp_path):
+    """Test that a new cache instance picks up the files and access order left on disk."""
+    cache = MirrorCache(s3_bucket, MagicMock(), tmp_path)
+    cache.open('test-bucket', 'reports/2024/week_1.xlsx')
+    cache.open('test-bucket', 'reports/2024/week_2.xlsx')
+    # Make week 1 the most recently used
+    for name, mtime in zip(cache.entries, (time.time(), time.time() - 60)):
+        os.utime(tmp_path / name, (mtime, mtime))
+
+    reopened = MirrorCache(s3_bucket, MagicMock(), tmp_path, max_bytes=150)
+    assert reopened.stats()['files'] == 1
+    reopened.open('test-bucket', 'reports/2024/week_1.xlsx')
+    assert reopened.stats()['hits'] == 1
+
+
+def test_data_wrangler_reads_through_mirror(s3_bucket, tmp_path, mocker):
+    """Test that reprocessing a workbook with the mirror enabled sends no second GET."""
+    workbook = BytesIO()
+    pd.DataFrame({'Column1': ['Data1', '1'], 'Column2': [1, 2]}).to_excel(workbook, index=False)
+    s3_bucket.Object('test-bucket', 'reports/2012/week_1_2012.xlsx').put(Body=workbook.getvalue())
+    data_wrangler = DataWrangler(bucket_name='test-bucket', s3=s3_bucket, logger=MagicMock(), cache_dir=tmp_path)
+    spy_get = mocker.spy(s3_bucket.meta.client, 'get_object')
+
+    first = data_wrangler.first_format_data_extraction('reports/2012/week_1_2012.xlsx')
+    second = data_wrangler.first_format_data_extraction('reports/2012/week_1_2012.xlsx')
+
+    pd.testing.assert_frame_equal(first, second)
+    assert first['Column1'].tolist() == ['Data1']
+    assert spy_get.call_count == 1
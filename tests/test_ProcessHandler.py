@@ -1,9 +1,14 @@
 import pytest
 import pandas as pd
-from unittest.mock import MagicMock, patch, ANY
+from unittest.mock import MagicMock, patch, ANY, call
 from pandas.testing import assert_frame_equal
 from src.ProcessHandler import ProcessHandler
+from src.WorkQueue import WorkQueue
 from pathlib import Path
+import datetime
+import boto3
+import sqlalchemy
+from moto import mock_aws
 
 
 def test_update_files_tracker_with_rds_load():
@@ -12,49 +17,45 @@ def test_update_files_tracker_with_rds_load():
     engine_mock = MagicMock()
     logger_mock = MagicMock()
 
-    # Mock the load_files_tracker method
-    with patch.object(ProcessHandler, 'load_files_tracker') as mock_load_files_tracker:
-        # Set up the mock to return a predefined DataFrame
-        mock_load_files_tracker.return_value = pd.DataFrame({
-            'file': ['file1.xls', 'file2.xls'],
-            'rds_load': ['no', 'no']
-        })
-
-        # Initialize ProcessHandler
-        process_handler = ProcessHandler(
-            s3=s3_mock,
-            engine=engine_mock,
-            bucket_name='test-bucket',
-            table_name='test-table',
-            logger=logger_mock
-        )
+    # Initialize ProcessHandler
+    process_handler = ProcessHandler(
+        s3=s3_mock,
+        engine=engine_mock,
+        bucket_name='test-bucket',
+        table_name='test-table',
+        logger=logger_mock
+    )
 
-    # Mock the update_files_tracker method to prevent actual S3 interaction
-    process_handler.update_files_tracker = MagicMock()
+    # Start from a tracker holding two files
+    tracker = process_handler.files_tracker
+    assert tracker.tracker is process_handler.tracker_store('test-bucket')
+    tracker.tracker.save(pd.DataFrame({
+        'file': ['file1.xls', 'file2.xls'],
+        'rds_load': ['no', 'no']
+    }))
+    s3_mock.Object.reset_mock()
 
     # Test updating an existing file
     process_handler.update_files_tracker_with_rds_load('file1.xls')
 
     # Assertions
-    assert process_handler.files_tracker_df.loc[
-        process_handler.files_tracker_df['file'] == 'file1.xls', 'rds_load'
-    ].values[0] == 'yes'
+    assert tracker.get('file1.xls')['rds_load'] == 'yes'
+    assert tracker.get('file2.xls')['rds_load'] == 'no'
 
     # Test adding a new file
     process_handler.update_files_tracker_with_rds_load('file3.xls')
 
     # Assertions
-    assert 'file3.xls' in process_handler.files_tracker_df['file'].values
-    assert process_handler.files_tracker_df.loc[
-        process_handler.files_tracker_df['file'] == 'file3.xls', 'rds_load'
-    ].values[0] == 'yes'
-
-    # Ensure update_files_tracker was called twice
-    assert process_handler.update_files_tracker.call_count == 2
-    process_handler.update_files_tracker.assert_called_with(
-        process_handler.files_tracker_df, 'test-bucket'
-    )
+    assert tracker.get('file3.xls')['rds_load'] == 'yes'
+    assert list(tracker.tracker.load()['file']) == ['file1.xls', 'file2.xls', 'file3.xls']
 
+    # Ensure the tracker is uploaded once for the whole checkpoint window, then exported to the CSV tracker
+    s3_mock.Object.return_value.put.assert_not_called()
+    tracker.flush()
+    assert s3_mock.Object.call_args_list == [call('test-bucket', 'files_tracker.sqlite'),
+                                             call('test-bucket', 'files_tracker.csv')]
+    assert s3_mock.Object.return_value.put.call_args_list == [call(Body=ANY, IfMatch=tracker.tracker.etag),
+                                                               call(Body=ANY)]
 
 
 def test_querying_db():
@@ -128,6 +129,7 @@ def test_executing_process():
     process_handler.validate_dataframe = MagicMock(side_effect=lambda df: df)  # Return the DataFrame as is
     process_handler.insert_dataframe_to_db = MagicMock()
     process_handler.update_files_tracker_with_rds_load = MagicMock()
+    process_handler.delete_previous_load = MagicMock()
     process_handler.second_format_data_extraction = MagicMock(return_value=pd.DataFrame({'data': [4, 5, 6]}))
 
     # Since the method uses tqdm, we'll patch it to prevent unnecessary output during testing
@@ -149,18 +151,22 @@ def test_executing_process():
     process_handler.validate_dataframe.assert_any_call(ANY)
     process_handler.insert_dataframe_to_db.assert_any_call(
         dataframe=ANY,
-        table_name='test-table'
+        table_name='test-table',
+        source_file='path/to/file1.xls'
     )
     process_handler.update_files_tracker_with_rds_load.assert_any_call('file1.xls')
 
     # Check that the second format file was processed
-    process_handler.second_format_data_extraction.assert_called_once_with('path/to/file2.xlsx')
+    process_handler.second_format_data_extraction.assert_called_once_with('path/to/file2.xlsx', ANY)
     process_handler.validate_dataframe.assert_any_call(ANY)
     process_handler.insert_dataframe_to_db.assert_any_call(
         dataframe=ANY,
-        table_name='test-table'
+        table_name='test-table',
+        source_file='path/to/file2.xlsx'
     )
     process_handler.update_files_tracker_with_rds_load.assert_any_call('file2.xlsx')
+    # Neither file was in flight before, so no previous rows are looked for
+    process_handler.delete_previous_load.assert_not_called()
 
     # Alternatively, inspect the call arguments to verify the DataFrames
     insert_calls = process_handler.insert_dataframe_to_db.call_args_list
@@ -188,4 +194,221 @@ def test_executing_process():
         process_handler.first_format_data_transformation.return_value,
         process_handler.second_format_data_extraction.return_value
     ], ignore_index=True)
-    pd.testing.assert_frame_equal(result_df.reset_index(drop=True), expected_df.reset_index(drop=True))
\ No newline at end of file
+    pd.testing.assert_frame_equal(result_df.reset_index(drop=True), expected_df.reset_index(drop=True))
+
+
+def test_executing_process_checkpoints_tracker():
+    # Mock dependencies
+    s3_mock = MagicMock()
+    engine_mock = MagicMock()
+    logger_mock = MagicMock()
+
+    process_handler = ProcessHandler(
+        s3=s3_mock,
+        engine=engine_mock,
+        bucket_name='test-bucket',
+        table_name='test-table',
+        logger=logger_mock,
+        checkpoint_files=2
+    )
+    # No other run writes the tracker
+    s3_mock.meta.client.head_object.return_value = {'ETag': '"v1"'}
+    s3_mock.Object.return_value.put.return_value = {'ETag': '"v1"'}
+    paths = [f'reports/2020/week_{week}_anexo_2020.xlsx' for week in range(1, 6)]
+
+    # Mock methods called within executing_process, failing to insert the fifth file
+    process_handler.get_files = MagicMock()
+    process_handler.first_format_paths = MagicMock(return_value=[])
+    process_handler.second_format_paths = MagicMock(return_value=paths)
+    process_handler.second_format_data_extraction = MagicMock(
+        side_effect=[pd.DataFrame({'data': [week]}) for week in range(1, 6)])
+    process_handler.validate_dataframe = MagicMock(side_effect=lambda df: df)
+    process_handler.insert_dataframe_to_db = MagicMock(side_effect=[None] * 4 + [ValueError('connection lost')])
+    process_handler.delete_rows = MagicMock(return_value=0)
+    checkpoint = MagicMock(wraps=process_handler.files_tracker.tracker.checkpoint)
+    process_handler.files_tracker.tracker.checkpoint = checkpoint
+
+    with pytest.raises(ValueError):
+        process_handler.executing_process()
+
+    # The files are marked in flight in one write, then two full windows, and nothing left to flush when the
+    # fifth file fails
+    assert checkpoint.call_count == 3
+    assert process_handler.files_tracker.pending == 0
+    assert [process_handler.files_tracker.get(Path(path).name)['rds_load'] for path in paths[:4]] == ['yes'] * 4
+    assert process_handler.files_tracker.get(Path(paths[4]).name)['rds_load'] == 'pending'
+    process_handler.delete_rows.assert_not_called()
+
+    # The file left in flight has its rows replaced, and one loaded after the last checkpoint is flushed when the
+    # run fails. The file failing to parse never had rows inserted, so it is not in flight anymore
+    process_handler.insert_dataframe_to_db = MagicMock()
+    process_handler.second_format_data_extraction = MagicMock(
+        side_effect=[pd.DataFrame({'data': [5]}), ValueError('corrupt workbook')])
+    process_handler.second_format_paths = MagicMock(return_value=paths + ['reports/2020/week_6_anexo_2020.xlsx'])
+    with pytest.raises(ValueError):
+        process_handler.executing_process()
+    assert checkpoint.call_count == 5
+    assert process_handler.files_tracker.get(Path(paths[4]).name)['rds_load'] == 'yes'
+    assert process_handler.files_tracker.get('week_6_anexo_2020.xlsx')['rds_load'] == 'no'
+    process_handler.delete_rows.assert_called_once_with('test-table', connection=None, source_file=paths[4])
+
+
+def test_load_into_db_is_transactional(tmp_path):
+    # The database tracker records each load in the transaction inserting the rows of the file
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path / "rds.sqlite"}')
+    with mock_aws():
+        s3 = boto3.resource('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='test-bucket')
+        process_handler = ProcessHandler(
+            s3=s3,
+            engine=engine,
+            bucket_name='test-bucket',
+            table_name='test-table',
+            logger=MagicMock(),
+            tracker_backend='postgres'
+        )
+        assert process_handler.files_tracker.transactional
+
+        rows = pd.DataFrame({'producto': ['papa', 'yuca'], 'semana_no': [5, 5], 'anho': ['2020', '2020']})
+        file_path = 'reports/2020/week_5_anexo_2020.xlsx'
+
+        # A failure before the load is recorded rolls the rows back too
+        with patch.object(process_handler.files_tracker.tracker, 'upsert_in_transaction',
+                          side_effect=RuntimeError('connection lost')):
+            with pytest.raises(RuntimeError):
+                process_handler.load_into_db(file_path, rows)
+        assert not sqlalchemy.inspect(engine).has_table('test-table') or \
+            pd.read_sql('SELECT * FROM "test-table"', engine).empty
+        assert process_handler.files_tracker.get('week_5_anexo_2020.xlsx') is None
+
+        # Loading again replaces the rows, and the status is committed with them
+        process_handler.load_into_db(file_path, rows)
+        process_handler.load_into_db(file_path, rows)
+        assert len(pd.read_sql('SELECT * FROM "test-table"', engine)) == 2
+        assert process_handler.files_tracker.get('week_5_anexo_2020.xlsx')['rds_load'] == 'yes'
+        assert process_handler.rds_load_status() == {'week_5_anexo_2020.xlsx': 'yes'}
+
+        # No tracker is written to S3
+        process_handler.files_tracker.flush()
+        assert list(s3.Bucket('test-bucket').objects.all()) == []
+
+
+def test_load_into_db_replaces_only_the_rows_of_the_file(tmp_path):
+    # Two files of different year folders carry the same year and week, only the one left in flight is replaced
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path / "rds.sqlite"}')
+    files = {'reports/2019/week_52_anexo_2018.xlsx': 'papa', 'reports/2018/week_52_anexo_2018.xlsx': 'yuca'}
+    with mock_aws():
+        s3 = boto3.resource('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='test-bucket')
+
+        def handler():
+            return ProcessHandler(s3=s3, engine=engine, bucket_name='test-bucket', table_name='test-table',
+                                  logger=MagicMock())
+
+        def rows(producto):
+            return pd.DataFrame({'producto': [producto], 'semana_no': [52], 'anho': ['2018']})
+
+        # A run marks both files in flight, loads them and stops before recording the loads
+        stopped = handler()
+        stopped.mark_in_flight([Path(file_path).name for file_path in files], stopped.rds_load_status())
+        for file_path, producto in files.items():
+            stopped.load_into_db(file_path, rows(producto))
+
+        # A run overlapping the one loading the files leaves them to it
+        overlapping = handler()
+        names = [Path(file_path).name for file_path in files]
+        assert overlapping.mark_in_flight(names, overlapping.rds_load_status()) == {'week_52_anexo_2018.xlsx'}
+        assert overlapping.replace_on_load == set()
+
+        # Once the mark is stale, the next run only loads the first file again
+        rerun = handler()
+        rerun.IN_FLIGHT_TIMEOUT = datetime.timedelta(0)
+        rerun.delete_rows = MagicMock(wraps=rerun.delete_rows)
+        rerun.mark_in_flight([Path(file_path).name for file_path in files], rerun.rds_load_status())
+        rerun.load_into_db('reports/2019/week_52_anexo_2018.xlsx', rows('papa'))
+        rerun.load_into_db('reports/2020/week_1_anexo_2020.xlsx', rows('arroz'))
+
+        loaded = pd.read_sql('SELECT producto, source_file FROM "test-table" ORDER BY producto', engine)
+        assert loaded.to_dict('records') == [
+            {'producto': 'arroz', 'source_file': 'reports/2020/week_1_anexo_2020.xlsx'},
+            {'producto': 'papa', 'source_file': 'reports/2019/week_52_anexo_2018.xlsx'},
+            {'producto': 'yuca', 'source_file': 'reports/2018/week_52_anexo_2018.xlsx'},
+        ]
+        # Only the file left in flight was looked up, through the index
+        rerun.delete_rows.assert_called_once_with('test-table', connection=None,
+                                                  source_file='reports/2019/week_52_anexo_2018.xlsx')
+        indexes = sqlalchemy.inspect(engine).get_indexes('test-table')
+        assert [index['column_names'] for index in indexes] == [['source_file']]
+
+
+
+def test_process_queue(tmp_path):
+    # Two workers share the queue: each workbook is loaded once, a corrupt one is retried then marked as failed
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path / "rds.sqlite"}')
+    keys = [f'reports/2020/week_{week}_anexo_2020.xlsx' for week in range(1, 6)]
+    with mock_aws():
+        s3 = boto3.resource('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='test-bucket')
+
+        def worker():
+            process_handler = ProcessHandler(
+                s3=s3,
+                engine=engine,
+                bucket_name='test-bucket',
+                table_name='test-table',
+                logger=MagicMock(),
+                tracker_backend='postgres'
+            )
+            process_handler.bucket_inventory = MagicMock()
+            entries = [MagicMock(key=key, file_format=2, etag='"1"') for key in keys]
+            process_handler.bucket_inventory.return_value.entries = entries
+
+            def parse_file(file_path, default_format=None):
+                week = int(Path(file_path).name.split('_')[1])
+                if week == 3:
+                    raise ValueError('corrupt workbook')
+                rows = pd.DataFrame({'producto': ['papa'], 'semana_no': [week], 'anho': ['2020']})
+                return rows, rows
+
+            process_handler.parse_file = MagicMock(side_effect=parse_file)
+            return process_handler
+
+        first, second = worker(), worker()
+        first.files_tracker.upsert('week_1_anexo_2020.xlsx', rds_load='yes')
+
+        queue = WorkQueue(engine, MagicMock(), worker_id='first', max_attempts=2)
+        assert first.process_queue(queue, batch_size=2) == {'done': 3, 'failed': 1}
+        # The second worker finds nothing left but the failed workbook
+        assert second.process_queue(WorkQueue(engine, MagicMock(), worker_id='second')) == {'done': 3, 'failed': 1}
+        second.parse_file.assert_not_called()
+
+        loaded = pd.read_sql('SELECT semana_no FROM "test-table" ORDER BY semana_no', engine)
+        assert list(loaded['semana_no']) == [2, 4, 5]
+        assert first.parse_file.call_count == 5
+        status = second.rds_load_status()
+        assert [status.get(Path(key).name) for key in keys] == ['yes', 'yes', None, 'yes', 'yes']
+
+
+def test_load_into_db_checks_the_lease(tmp_path):
+    # A workbook whose lease was taken over is left to its new worker, nothing is inserted
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path / "rds.sqlite"}')
+    with mock_aws():
+        s3 = boto3.resource('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='test-bucket')
+        process_handler = ProcessHandler(s3=s3, engine=engine, bucket_name='test-bucket', table_name='test-table',
+                                         logger=MagicMock())
+        key = 'reports/2020/week_1_anexo_2020.xlsx'
+        rows = pd.DataFrame({'producto': ['papa'], 'semana_no': [1], 'anho': ['2020']})
+        stalled = WorkQueue(engine, MagicMock(), worker_id='stalled', lease_seconds=0)
+        stalled.enqueue([key])
+        assert stalled.claim() == [key]
+        assert WorkQueue(engine, MagicMock(), worker_id='new').claim() == [key]
+
+        assert not process_handler.load_into_db(key, rows, work_queue=stalled)
+        assert not sqlalchemy.inspect(engine).has_table('test-table')
+        assert process_handler.files_tracker.get('week_1_anexo_2020.xlsx') is None
+
+        # The worker holding the lease loads it
+        assert process_handler.load_into_db(key, rows, work_queue=WorkQueue(engine, MagicMock(), worker_id='new'))
+        assert list(pd.read_sql('SELECT semana_no FROM "test-table"', engine)['semana_no']) == [1]
+        assert process_handler.files_tracker.get('week_1_anexo_2020.xlsx')['rds_load'] == 'yes'
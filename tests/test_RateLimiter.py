@@ -0,0 +1,131 @@
+import pytest
+import threading
+import time
+from unittest.mock import MagicMock
+from urllib3.util.retry import RequestHistory
+from src.RateLimiter import JitteredRetry, RateLimiter, RateLimitedAdapter
+
+
+@pytest.fixture
+def rate_limiter():
+    """Fixture returning a fast rate limiter without cooldown between back offs."""
+    return RateLimiter(logger=MagicMock(), rate=100.0, min_rate=1.0, max_rate=200.0, max_concurrency=8, cooldown=0)
+
+
+def test_initial_limits(rate_limiter):
+    """Test that concurrency starts at half of the maximum."""
+    stats = rate_limiter.stats()
+    assert stats['concurrency'] == 4
+    assert stats['rate'] == 100.0
+    assert stats['in_flight'] == 0
+
+
+def test_back_off_on_throttling(rate_limiter):
+    """Test that 429 and 503 answers halve the rate and the concurrency."""
+    rate_limiter.acquire()
+    rate_limiter.release(429, 0.1)
+    assert rate_limiter.concurrency == 2
+    assert rate_limiter.rate == 50.0
+
+    rate_limiter.acquire()
+    rate_limiter.release(503, 0.1)
+    stats = rate_limiter.stats()
+    assert stats['concurrency'] == 1
+    assert stats['throttled'] == 2
+    assert stats['backoff_events'] == 2
+    rate_limiter.logger.warning.assert_called()
+
+
+def test_back_off_cooldown():
+    """Test that a burst of throttled answers only backs off once per cooldown."""
+    rate_limiter = RateLimiter(logger=MagicMock(), rate=100.0, max_rate=200.0, max_concurrency=8, cooldown=60)
+    for _ in range(3):
+        rate_limiter.acquire()
+        rate_limiter.release(429, 0.1)
+    assert rate_limiter.backoff_events == 1
+    assert rate_limiter.throttled == 3
+    assert rate_limiter.concurrency == 2
+
+
+def test_back_off_on_rising_latency(rate_limiter):
+    """Test that a request much slower than the average triggers a back off."""
+    for _ in range(3):
+        rate_limiter.acquire()
+        rate_limiter.release(200, 0.1)
+    rate_limiter.acquire()
+    rate_limiter.release(200, 1.0)
+    assert rate_limiter.backoff_events == 1
+
+
+def test_ramp_up_on_success(rate_limiter):
+    """Test that the limits grow back while requests succeed."""
+    for _ in range(4):
+        rate_limiter.acquire()
+        rate_limiter.release(200, 0.1)
+    assert rate_limiter.concurrency == 5
+    assert rate_limiter.rate == 101.0
+
+    for _ in range(30):
+        rate_limiter.acquire()
+        rate_limiter.release(200, 0.1)
+    assert rate_limiter.concurrency == 8
+
+
+def test_token_bucket_paces_requests():
+    """Test that requests are spaced according to the rate."""
+    rate_limiter = RateLimiter(logger=MagicMock(), rate=50.0, max_rate=50.0, max_concurrency=8)
+    start = time.monotonic()
+    for _ in range(6):
+        rate_limiter.acquire()
+        rate_limiter.release(200, 0.0)
+    assert time.monotonic() - start >= 0.09
+
+
+def test_concurrency_limit_blocks(rate_limiter):
+    """Test that no more requests than the concurrency limit are in flight."""
+    rate_limiter.concurrency = 1
+    rate_limiter.acquire()
+    acquired = threading.Event()
+
+    def second_request():
+        rate_limiter.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=second_request)
+    thread.start()
+    assert not acquired.wait(0.1)
+
+    rate_limiter.release(200, 0.01)
+    assert acquired.wait(1)
+    thread.join()
+    assert rate_limiter.stats()['peak_in_flight'] == 1
+
+
+def test_adapter_holds_slot_until_streamed_response_closed(rate_limiter, mocker):
+    """Test that a streamed response keeps its slot until it is closed."""
+    response = MagicMock(status_code=200)
+    mocker.patch('requests.adapters.HTTPAdapter.send', return_value=response)
+    adapter = RateLimitedAdapter(rate_limiter)
+
+    adapter.send(MagicMock(), stream=False)
+    assert rate_limiter.in_flight == 0
+
+    streamed = adapter.send(MagicMock(), stream=True)
+    assert rate_limiter.in_flight == 1
+    streamed.close()
+    streamed.close()
+    assert rate_limiter.in_flight == 0
+    assert rate_limiter.requests == 2
+
+
+def test_jittered_retry_backoff():
+    """Test that the jitter is added to the exponential backoff and kept across attempts."""
+    retry = JitteredRetry(total=3, backoff_factor=0.5, jitter=0.5)
+    assert retry.get_backoff_time() == 0
+
+    error = RequestHistory('GET', '/sipsa', None, 503, None)
+    retry = retry.new(history=(error, error))
+    assert retry.jitter == 0.5
+    backoffs = [retry.get_backoff_time() for _ in range(50)]
+    assert all(1.0 <= backoff <= 1.5 for backoff in backoffs)
+    assert len(set(backoffs)) > 1
@@ -0,0 +1,127 @@
+import pytest
+import time
+import threading
+import sqlalchemy
+from unittest.mock import MagicMock
+from src.WorkQueue import WorkQueue
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Fixture providing a file backed SQLite database, shared by every worker of a test."""
+    return sqlalchemy.create_engine(f'sqlite:///{tmp_path / "queue.sqlite"}')
+
+
+def worker(engine, name, **kwargs):
+    return WorkQueue(engine, MagicMock(), worker_id=name, **kwargs)
+
+
+def test_enqueue_and_claim(engine):
+    """Test that workbooks are queued once and leased in key order."""
+    queue = worker(engine, 'a')
+    assert queue.enqueue(['reports/2020/week_2.xlsx', 'reports/2020/week_1.xlsx']) == 2
+    assert queue.enqueue(['reports/2020/week_1.xlsx', 'reports/2020/week_3.xlsx']) == 1
+
+    assert queue.claim(2) == ['reports/2020/week_1.xlsx', 'reports/2020/week_2.xlsx']
+    assert worker(engine, 'b').claim(5) == ['reports/2020/week_3.xlsx']
+    assert queue.claim() == []
+    assert queue.stats() == {'leased': 3}
+
+    assert queue.complete('reports/2020/week_1.xlsx')
+    assert not queue.complete('reports/2020/week_3.xlsx')  # Held by worker b
+    assert queue.stats() == {'done': 1, 'leased': 2}
+
+    # Done workbooks are not queued again, unless they were republished
+    assert queue.enqueue(['reports/2020/week_1.xlsx']) == 0
+
+
+def test_republished_workbooks_are_queued_again(engine):
+    """Test that a workbook queued with another ETag goes back to pending once no worker holds it."""
+    queue = worker(engine, 'a')
+    assert queue.enqueue(['a.xlsx', 'b.xlsx'], etags={'a.xlsx': '"1"', 'b.xlsx': '"1"'}) == 2
+    assert queue.claim(2) == ['a.xlsx', 'b.xlsx']
+    assert queue.complete('a.xlsx')
+
+    assert queue.enqueue(['a.xlsx', 'b.xlsx'], etags={'a.xlsx': '"1"', 'b.xlsx': '"1"'}) == 0
+    # b.xlsx is still leased, it is queued again by the first enqueue after it is released
+    assert queue.enqueue(['a.xlsx', 'b.xlsx'], etags={'a.xlsx': '"2"', 'b.xlsx': '"2"'}) == 1
+    assert queue.stats() == {'pending': 1, 'leased': 1}
+    assert queue.complete('b.xlsx')
+    assert queue.enqueue(['b.xlsx'], etags={'b.xlsx': '"2"'}) == 1
+    assert worker(engine, 'b').claim(2) == ['a.xlsx', 'b.xlsx']
+
+
+def test_expired_lease_is_claimed_again(engine):
+    """Test lease expiry, heartbeats and that a worker which lost its lease cannot complete the workbook."""
+    slow = worker(engine, 'slow', lease_seconds=0.2)
+    fast = worker(engine, 'fast', lease_seconds=0.2)
+    slow.enqueue(['a.xlsx', 'b.xlsx'])
+    assert slow.claim(2) == ['a.xlsx', 'b.xlsx']
+
+    time.sleep(0.15)
+    assert slow.heartbeat('a.xlsx')
+    time.sleep(0.1)
+
+    # b.xlsx expired, a.xlsx was renewed
+    assert fast.claim(2) == ['b.xlsx']
+    assert not slow.heartbeat('b.xlsx')
+    assert not slow.complete('b.xlsx')
+    assert fast.complete('b.xlsx')
+    assert slow.complete('a.xlsx')
+
+
+def test_keep_alive(engine):
+    """Test that the background heartbeat keeps a lease while a workbook is processed."""
+    queue = worker(engine, 'a', lease_seconds=0.3)
+    queue.enqueue(['a.xlsx'])
+    queue.claim()
+    with queue.keep_alive('a.xlsx'):
+        time.sleep(0.6)
+        assert worker(engine, 'b').claim() == []
+    time.sleep(0.35)
+    assert worker(engine, 'b').claim() == ['a.xlsx']
+
+
+def test_fail_retries_then_gives_up(engine):
+    """Test that failed workbooks are retried by any worker up to max_attempts."""
+    queue = worker(engine, 'a', max_attempts=2)
+    queue.enqueue(['a.xlsx'])
+    assert queue.claim() == ['a.xlsx']
+    assert queue.fail('a.xlsx', ValueError('corrupt workbook'))
+    assert queue.stats() == {'pending': 1}
+
+    other = worker(engine, 'b', max_attempts=2)
+    assert other.claim() == ['a.xlsx']
+    assert other.fail('a.xlsx', 'corrupt workbook')
+    assert queue.stats() == {'failed': 1}
+    assert queue.claim() == []
+
+
+def test_concurrent_workers_never_share_a_workbook(engine):
+    """Test that workers claiming at the same time each get distinct workbooks, and all of them are processed."""
+    keys = [f'reports/2020/week_{week:02d}.xlsx' for week in range(1, 61)]
+    worker(engine, 'setup').enqueue(keys)
+
+    claimed = {}
+    lock = threading.Lock()
+
+    def run(name):
+        queue = worker(engine, name)
+        while True:
+            batch = queue.claim(3)
+            if not batch:
+                return
+            for key in batch:
+                with lock:
+                    claimed.setdefault(key, []).append(name)
+                assert queue.complete(key)
+
+    threads = [threading.Thread(target=run, args=(f'worker-{i}',)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == keys
+    assert all(len(owners) == 1 for owners in claimed.values())
+    assert worker(engine, 'check').stats() == {'done': 60}
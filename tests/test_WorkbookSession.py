@@ -0,0 +1,93 @@
+import pytest
+import mmap
+import openpyxl
+from io import BytesIO
+import pandas as pd
+from unittest.mock import MagicMock
+from src.FormatDetector import FormatDetector
+from src.WorkbookSession import WorkbookSession, excel_engines, workbook_stream
+from tests.test_FormatDetector import FOOD_CLASSES, workbook_bytes
+
+
+WORKBOOK = workbook_bytes({'Índice': [['Contenido']],
+                           **{name: [['Producto', 'Precio medio'], [f'{name} 1', index]]
+                              for index, name in enumerate(FOOD_CLASSES, start=1)}})
+
+
+def test_sheets_are_read_from_one_parse(mocker):
+    """Test that every sheet is read from the workbook parsed when the session was opened."""
+    load_workbook = mocker.spy(openpyxl, 'load_workbook')
+    with WorkbookSession(WORKBOOK, MagicMock(), 'week_1_anexo_2020.xlsx') as session:
+        assert session.engine == 'openpyxl'
+        assert session.sheet_names == ['Índice', *FOOD_CLASSES]
+        frames = [session.sheet(index) for index in range(1, 9)]
+    assert load_workbook.call_count == 1
+
+    assert [frame['Precio medio'].iloc[0] for frame in frames] == list(range(1, 9))
+    pd.testing.assert_frame_equal(frames[2], pd.read_excel(BytesIO(WORKBOOK), sheet_name='Tubérculos'))
+
+
+def test_sheet_by_name_and_options():
+    """Test reading a sheet by name with pandas options, as a new DataFrame on every call."""
+    session = WorkbookSession(WORKBOOK, MagicMock())
+    frame = session.sheet('Frutas', header=None)
+    assert frame.iloc[1].tolist() == ['Frutas 1', 2]
+    frame.iloc[1, 0] = 'changed'
+    assert session.sheet('Frutas', header=None).iloc[1, 0] == 'Frutas 1'
+    session.close()
+
+
+def test_unreadable_workbook():
+    """Test that a file no engine can read raises ValueError."""
+    logger = MagicMock()
+    with pytest.raises(ValueError, match='not_a_workbook.xlsx'):
+        WorkbookSession(b'<html>Not found</html>', logger, 'not_a_workbook.xlsx')
+    assert logger.debug.call_count == 2
+
+
+def test_excel_engines(mocker):
+    """Test choosing the readers from the container, with calamine first only when it is asked for."""
+    mocker.patch('src.WorkbookSession.python_calamine', None)
+    assert excel_engines('xlsx') == ('openpyxl',)
+    assert excel_engines('xls') == ('xlrd',)
+    assert excel_engines('unknown') == ('openpyxl', 'xlrd')
+    with pytest.raises(ImportError):
+        excel_engines('xlsx', 'calamine')
+    with pytest.raises(ValueError):
+        excel_engines('xlsx', 'pyexcel')
+
+    # Installing calamine does not change the default readers
+    mocker.patch('src.WorkbookSession.python_calamine', MagicMock())
+    assert excel_engines('xls') == ('xlrd',)
+    assert excel_engines('xls', 'calamine') == ('calamine', 'xlrd')
+
+
+def test_calamine_session():
+    """Test that the calamine reader hands out the same sheets as openpyxl."""
+    pytest.importorskip('python_calamine')
+    with WorkbookSession(WORKBOOK, MagicMock(), engines=excel_engines('xlsx', 'calamine')) as session:
+        assert session.engine == 'calamine'
+        assert session.sheet_names == ['Índice', *FOOD_CLASSES]
+        pd.testing.assert_frame_equal(session.sheet(3), WorkbookSession(WORKBOOK, MagicMock()).sheet(3))
+
+
+@pytest.mark.parametrize('container', ['xlsx', 'xls'])
+def test_memory_maps_are_read_in_place(tmp_path, container):
+    """Test that a memory-mapped workbook, as served by the mirror cache, is read without a copy."""
+    from tests.test_DataWrangler import workbook_bytes as any_workbook_bytes
+    sheets = {'Índice': [['Contenido']], **{name: [['Producto', 'Precio medio'], [f'{name} 1', index]]
+                                            for index, name in enumerate(FOOD_CLASSES, start=1)}}
+    data = any_workbook_bytes(sheets, container)
+    path = tmp_path / f'workbook.{container}'
+    path.write_bytes(data)
+    with open(path, 'rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    stream = workbook_stream(mapped)
+    assert stream.seekable() and stream.read() == data
+    detector = FormatDetector(MagicMock())
+    assert detector.detect(mapped) == detector.detect(data)
+    engines = excel_engines(container)
+    with WorkbookSession(mapped, MagicMock(), engines=engines) as session, \
+            WorkbookSession(data, MagicMock(), engines=engines) as expected:
+        pd.testing.assert_frame_equal(session.sheet('Frutas'), expected.sheet('Frutas'))